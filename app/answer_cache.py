@@ -0,0 +1,97 @@
+import json
+import logging
+import time
+from typing import NamedTuple
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(settings.logger_name)
+
+# Version before the first check; the index version key itself is absent (None) until the first bump
+_UNSET = object()
+
+class Answer(NamedTuple):
+    completion: str
+    passages: str   # data of the `passages` event, already serialized
+
+class AnswerCache:
+    # Completed GPT answers keyed on the Ada embedding of their query. A new query whose
+    # embedding is within `threshold` cosine similarity of a cached one replays its answer.
+    def __init__(self, capacity: int, threshold: float, ttl: float, dim: int = 1536) -> None:
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.expires = np.zeros(capacity, dtype=np.float64)   # 0 marks an empty slot
+        self.answers: list[Answer | None] = [None] * capacity
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+        self.version = _UNSET
+        self._next = 0
+        self._version_checked = 0.0
+
+    @staticmethod
+    def _unit(dense: list[float]) -> np.ndarray:
+        vector = np.asarray(dense, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, dense: list[float]) -> Answer | None:
+        start = time.perf_counter()
+        scores = self.vectors @ self._unit(dense)
+        scores[self.expires < time.time()] = -np.inf
+        best = int(np.argmax(scores))
+        hit = scores[best] >= self.threshold
+        self.lookup_seconds += time.perf_counter() - start
+        if not hit:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.debug(f"Answer cache hit with similarity {scores[best]:.4f}")
+        return self.answers[best]
+
+    def store(self, dense: list[float], answer: Answer) -> None:
+        # Ring buffer: the oldest entry makes room for the newest
+        slot = self._next
+        self.vectors[slot] = self._unit(dense)
+        self.expires[slot] = time.time() + self.ttl
+        self.answers[slot] = answer
+        self._next = (slot + 1) % self.capacity
+
+    def invalidate(self) -> None:
+        self.expires[:] = 0
+        self.answers = [None] * self.capacity
+        logger.info("Invalidated the answer cache")
+
+    async def check_version(self, redis_client) -> None:
+        # Re-ingestion bumps the index version key; answers built on the old index are dropped
+        now = time.monotonic()
+        if now - self._version_checked < settings.answer_cache_version_interval: return
+        self._version_checked = now
+        try:
+            version = await redis_client.get(settings.index_version_key)
+        except Exception as err:
+            logger.warning(f"Unable to read the index version: {err}")
+            return
+        if self.version is not _UNSET and version != self.version: self.invalidate()
+        self.version = version
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": int(np.count_nonzero(self.expires >= time.time())),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "mean_lookup_ms": self.lookup_seconds / lookups * 1000 if lookups else 0.0
+        }
+
+def assemble_completion(payloads: list[bytes]) -> str:
+    # Joins the content deltas of a relayed OpenAI stream
+    content = []
+    for payload in payloads:
+        for choice in json.loads(payload).get("choices", []):
+            content.append(choice.get("delta", {}).get("content") or "")
+    return "".join(content)
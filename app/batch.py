@@ -0,0 +1,77 @@
+import asyncio
+import json
+import logging
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from config import settings
+from globals import g
+from ml import ada_encode_batch, splade_encode_batch, classify_batch, gpt_answer
+from utils import passage, gpt_message
+from schemas import Completion, Passage, Query
+
+logger = logging.getLogger(settings.logger_name)
+
+# Retrieval preparation for a whole batch: cached embeddings are reused, the rest are encoded with one
+# batched Ada request and batched SPLADE passes while the queries are classified in bulk
+async def encode_batch(queries: list[Query]) -> list[tuple[list[float], dict[str, list], str]]:
+    texts = [q.text for q in queries]
+    cached = await asyncio.gather(*(g.embedding_cache.get(t, track=False) for t in texts))
+    missing = [i for i, (dense, _) in enumerate(cached) if dense is None]
+    steps = [classify_batch(queries)]
+    if missing:
+        steps.append(ada_encode_batch([texts[i] for i in missing]))
+        steps.append(splade_encode_batch([texts[i] for i in missing]))
+    classes, *encoded = await asyncio.gather(*steps)
+    vectors = list(cached)
+    if missing:
+        for i, dense, sparse in zip(missing, *encoded):
+            vectors[i] = (dense, sparse)
+            g.embedding_cache.set_later(texts[i], dense, sparse)
+    return [(dense, sparse, class_) for (dense, sparse), class_ in zip(vectors, classes)]
+
+async def _retrieve(query: Query, dense: list[float], sparse: dict[str, list], class_: str, semaphore: asyncio.Semaphore) -> list[Passage]:
+    async with semaphore:
+        matches = await g.pinecone_db.query_db(query, dense, sparse, class_)
+    await g.episode_store.prefetch([m['metadata']['video_id'] for m in matches])
+    return [passage(m) for m in matches]
+
+async def _search(query: Query, encoded: tuple, semaphore: asyncio.Semaphore) -> dict:
+    passages = await _retrieve(query, *encoded, semaphore)
+    return {"passages": jsonable_encoder(passages)}
+
+async def _answer(query: Query, encoded: tuple, semaphore: asyncio.Semaphore, gpt_semaphore: asyncio.Semaphore) -> dict:
+    passages = await _retrieve(query, *encoded, semaphore)
+    async with gpt_semaphore:
+        completion = await gpt_answer(gpt_message(query, passages))
+    return jsonable_encoder(Completion(completion=completion, passages=passages))
+
+async def _ndjson(queries: list[Query], tasks: list[asyncio.Task]):
+    # One line per query, in input order; a failed query gets an error line instead of failing the batch
+    try:
+        for i, (query, task) in enumerate(zip(queries, tasks)):
+            try:
+                result = await task
+            except HTTPException as err:
+                result = {"error": err.detail}
+            except Exception as err:
+                logger.error(f"Batch query <{query.text}> failed: {err}")
+                result = {"error": "There was a problem encountered in the server."}
+            yield json.dumps({"index": i, "query": query.text, **result}) + "\n"
+    finally:
+        # a client that disconnects abandons the rest of the batch
+        for task in tasks: task.cancel()
+
+def check_batch_size(queries: list[Query]) -> None:
+    if len(queries) > settings.batch_max_queries:
+        raise HTTPException(status_code=413, detail=f"A batch can hold at most {settings.batch_max_queries} queries.")
+
+async def search_batch(queries: list[Query]):
+    encoded = await encode_batch(queries)
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+    return _ndjson(queries, [asyncio.ensure_future(_search(q, e, semaphore)) for q, e in zip(queries, encoded)])
+
+async def query_batch(queries: list[Query]):
+    encoded = await encode_batch(queries)
+    semaphore, gpt_semaphore = asyncio.Semaphore(settings.batch_concurrency), asyncio.Semaphore(settings.batch_gpt_concurrency)
+    return _ndjson(queries, [asyncio.ensure_future(_answer(q, e, semaphore, gpt_semaphore)) for q, e in zip(queries, encoded)])
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from fastapi import HTTPException
+
+from config import settings
+from globals import g
+
+logger = logging.getLogger(settings.logger_name)
+
+class SpladeBatcher:
+    # Collects concurrent SPLADE query encodings into one batched forward pass. A single collector forms
+    # the batches, so a burst stays in one batch, and hands each to the first idle worker.
+    def __init__(self, max_batch_size: int, max_wait_ms: float, queue_depth: int, workers: int = 1) -> None:
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue_depth = queue_depth
+        self.workers = workers
+        self.batches = 0
+        self.encoded = 0
+        self._queue: asyncio.Queue | None = None
+        self._batches: asyncio.Queue | None = None
+        self._idle: asyncio.Semaphore | None = None
+        self._full: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        # Created lazily since startup() runs outside of an event loop in AWS mode
+        if self._tasks: return
+        self._queue = asyncio.Queue(maxsize=self.queue_depth)
+        self._batches = asyncio.Queue()
+        self._idle = asyncio.Semaphore(self.workers)
+        self._full = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._collector())] + [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks: task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def encode(self, text: str) -> dict[str, list]:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, future))
+        except asyncio.QueueFull:
+            logger.error(f"SPLADE queue is full ({self.queue_depth} pending). Sending Service Unavailable Response to client.")
+            detail = "The server is currently overloaded. Please wait a couple of seconds before trying again."
+            raise HTTPException(status_code=503, detail=detail)
+        # one item is already held by a waiting worker
+        if self._queue.qsize() + 1 >= self.max_batch_size: self._full.set()
+        return await future
+
+    async def _collect(self) -> list[tuple[str, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        # a lone query is encoded right away; only a burst waits for the rest of it to arrive
+        if not self._queue.empty() and self._queue.qsize() + 1 < self.max_batch_size:
+            self._full.clear()
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        # callers that timed out or disconnected no longer need their vector
+        return [(text, future) for text, future in batch if not future.done()]
+
+    async def _collector(self) -> None:
+        # Waits for an idle worker before collecting, so queries arriving while every worker is busy
+        # join the next batch instead of splitting into smaller ones
+        while True:
+            await self._idle.acquire()
+            batch = await self._collect()
+            if batch: self._batches.put_nowait(batch)
+            else: self._idle.release()
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._batches.get()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await loop.run_in_executor(g.splade_executor, g.splade.encode_queries, texts)
+            except Exception as err:
+                logger.error(f"SPLADE batch encoding of {len(texts)} queries failed")
+                for _, future in batch:
+                    if not future.done(): future.set_exception(err)
+                continue
+            finally:
+                self._idle.release()
+            self.batches += 1
+            self.encoded += len(texts)
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done(): future.set_result(vector)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "encoded": self.encoded,
+            "mean_batch_size": self.encoded / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue else 0
+        }
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import math
+import re
+import struct
+import sys
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from config import settings
+
+logger = logging.getLogger(settings.logger_name)
+
+# Binary entry layout (little endian): header, float32 dense vector, uint32 sparse indices, float32 sparse values.
+# Bump CACHE_VERSION whenever the layout changes; entries with another version are treated as misses.
+CACHE_MAGIC = b"HGE"
+CACHE_VERSION = 1
+_HEADER = struct.Struct("<3sBII")
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+def normalize_key(text: str) -> str:
+    # Case, unicode form, punctuation and whitespace shouldn't produce different cache entries
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big": values.byteswap()
+    return values.tobytes()
+
+def _from_bytes(typecode: str, raw: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(raw)
+    if sys.byteorder == "big": values.byteswap()
+    return values
+
+def encode_embeddings(dense: list[float], sparse: dict[str, list]) -> bytes:
+    indices, values = sparse["indices"], sparse["values"]
+    return b"".join((
+        _HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(dense), len(indices)),
+        _to_bytes(array("f", dense)),
+        _to_bytes(array("I", indices)),
+        _to_bytes(array("f", values))
+    ))
+
+def decode_arrays(raw: bytes) -> tuple[array, array, array] | None:
+    # The dense vector, sparse indices and sparse values as arrays, the form the local tier keeps:
+    # ~6 KiB per entry against ~56 KiB as lists of Python floats.
+    # Anything that isn't a well-formed entry of the current version (e.g. old JSON blobs) is a miss
+    if raw is None or len(raw) < _HEADER.size: return None
+    magic, version, n_dense, n_sparse = _HEADER.unpack_from(raw)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION: return None
+    if len(raw) != _HEADER.size + 4 * (n_dense + 2 * n_sparse): return None
+    offset = _HEADER.size
+    dense = _from_bytes("f", raw[offset:offset + 4 * n_dense])
+    offset += 4 * n_dense
+    indices = _from_bytes("I", raw[offset:offset + 4 * n_sparse])
+    offset += 4 * n_sparse
+    values = _from_bytes("f", raw[offset:])
+    return dense, indices, values
+
+def to_arrays(dense: list[float], sparse: dict[str, list]) -> tuple[array, array, array]:
+    return array("f", dense), array("I", sparse["indices"]), array("f", sparse["values"])
+
+def to_lists(entry: tuple[array, array, array]) -> tuple[list[float], dict[str, list]]:
+    dense, indices, values = entry
+    return dense.tolist(), {"indices": indices.tolist(), "values": values.tolist()}
+
+def decode_embeddings(raw: bytes) -> tuple[list[float], dict[str, list]] | None:
+    entry = decode_arrays(raw)
+    return to_lists(entry) if entry is not None else None
+
+class LocalCache:
+    # In-process LRU with a per-entry TTL
+    def __init__(self, capacity: int, ttl: float) -> None:
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None: return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class EmbeddingCache:
+    # Two tiers: an in-process LRU in front of the shared Redis cache.
+    # Query popularity is tracked in a Redis sorted set that drives TTLs and eviction; the cached keys
+    # themselves are tracked in a second sorted set, scored by when they expire, that bounds the cache.
+    def __init__(self, redis_client, prefix: str, local_capacity: int, local_ttl: float,
+                 popularity_key: str, base_ttl: int, max_ttl: int, max_entries: int,
+                 entries_key: str = "query:cached", evict_grace: float = 60.0) -> None:
+        self.redis = redis_client
+        self.prefix = prefix
+        self.local = LocalCache(local_capacity, local_ttl)
+        self.popularity_key = popularity_key
+        self.base_ttl = base_ttl
+        self.max_ttl = max_ttl
+        self.max_entries = max_entries
+        self.entries_key = entries_key
+        self.evict_grace = evict_grace
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pending: set[asyncio.Task] = set()
+
+    def key(self, text: str) -> str:
+        return self.prefix + normalize_key(text)
+
+    def ttl(self, frequency: float) -> int:
+        # TTL doubles every time a query's frequency doubles, up to max_ttl
+        if frequency < 2: return self.base_ttl
+        return min(self.base_ttl * 2 ** int(math.log2(frequency)), self.max_ttl)
+
+    def _background(self, coro) -> None:
+        task = asyncio.ensure_future(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _extend(self, member: str, frequency: int) -> None:
+        # Every tracked lookup, local or Redis tier, sees the frequency its own ZINCRBY produced, so
+        # exactly one of them sees it reach the next power of two, where the TTL bucket changes
+        if frequency < 2 or frequency & (frequency - 1): return
+        ttl = self.ttl(frequency)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.expire(self.prefix + member, ttl)
+        pipe.zadd(self.entries_key, {member: time.time() + ttl}, xx=True)
+        await pipe.execute()
+
+    async def _track_local_hit(self, pipe, member: str) -> None:
+        frequency, = await pipe.execute()
+        await self._extend(member, int(frequency))
+
+    async def get(self, text: str, track: bool = True) -> tuple[list[float] | None, dict[str, list] | None]:
+        member = normalize_key(text)
+        key = self.prefix + member
+        entry = self.local.get(key)
+        pipe = self.redis.pipeline(transaction=False)
+        if track: pipe.zincrby(self.popularity_key, 1, member)
+        if entry is not None:
+            self.local_hits += 1
+            # keep the local hit path free of network waits; popularity is counted in the background
+            if track: self._background(self._track_local_hit(pipe, member))
+            return to_lists(entry)
+        pipe.get(key)
+        results = await pipe.execute()
+        raw = results[-1]
+        entry = decode_arrays(raw)
+        if entry is None:
+            self.misses += 1
+            return None, None
+        self.redis_hits += 1
+        self.local.set(key, entry)
+        if track: await self._extend(member, int(results[0]))
+        return to_lists(entry)
+
+    async def set(self, text: str, dense: list[float], sparse: dict[str, list], exp: int | None = None) -> None:
+        member = normalize_key(text)
+        key = self.prefix + member
+        self.local.set(key, to_arrays(dense, sparse))
+        frequency = await self.redis.zscore(self.popularity_key, member)
+        ttl = exp if exp is not None else self.ttl(frequency or 0)
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.setex(key, ttl, encode_embeddings(dense, sparse))
+        pipe.zadd(self.entries_key, {member: now + ttl})
+        # keys that expired on their own no longer count
+        pipe.zremrangebyscore(self.entries_key, "-inf", now)
+        pipe.zcard(self.entries_key)
+        size = (await pipe.execute())[-1]
+        if size > self.max_entries: await self.evict(size - self.max_entries)
+
+    def set_later(self, text: str, dense: list[float], sparse: dict[str, list]) -> None:
+        # Write in the background right away rather than after the response has been streamed
+        self.local.set(self.key(text), to_arrays(dense, sparse))
+        self._background(self.set(text, dense, sparse))
+
+    async def evict(self, count: int) -> None:
+        # Drop the cached queries closest to expiring, which are the coldest since TTLs grow with
+        # popularity. Any key expiring within base_ttl - evict_grace of now was written at least
+        # evict_grace seconds ago, so entries just written are never evicted.
+        now = time.time()
+        members = await self.redis.zrangebyscore(self.entries_key, now, now + self.base_ttl - self.evict_grace, start=0, num=count)
+        if not members: return
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(*[self.prefix + m.decode() for m in members])
+        pipe.zrem(self.entries_key, *members)
+        pipe.zrem(self.popularity_key, *members)
+        await pipe.execute()
+        self.evictions += len(members)
+        logger.info(f"Evicted {len(members)} cold queries from the embedding cache")
+
+    async def popular(self, n: int) -> list[tuple[str, float]]:
+        members = await self.redis.zrevrange(self.popularity_key, 0, n - 1, withscores=True)
+        return [(m.decode(), score) for m, score in members]
+
+    def stats(self) -> dict:
+        return {
+            "local_entries": len(self.local),
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
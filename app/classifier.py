@@ -0,0 +1,66 @@
+import json
+import logging
+import math
+import os
+import re
+from functools import lru_cache
+
+from config import settings
+
+logger = logging.getLogger(settings.logger_name)
+
+# In-process replacement for the zero-shot "question" vs "search term" endpoint:
+# a logistic model over a handful of surface features of the query
+INTERROGATIVES = {"what", "why", "how", "when", "where", "who", "whom", "whose", "which"}
+AUXILIARIES = {
+    "is", "are", "was", "were", "am", "do", "does", "did", "can", "could", "should",
+    "would", "will", "shall", "may", "might", "must", "has", "have", "had"
+}
+REQUESTS = {"explain", "tell", "describe", "help", "give", "list", "compare", "summarize"}
+FIRST_PERSON = {"i", "me", "my", "mine", "we", "our", "us"}
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+DEFAULT_WEIGHTS = {
+    "bias": -2.5,
+    "question_mark": 3.5,
+    "interrogative_start": 3.0,
+    "auxiliary_start": 2.5,
+    "request_start": 2.0,
+    "interrogative_any": 1.0,
+    "first_person": 1.0,
+    "log_tokens": 0.8
+}
+
+def features(text: str) -> dict[str, float]:
+    tokens = _TOKEN.findall(text.lower())
+    first = tokens[0] if tokens else ""
+    return {
+        "bias": 1.0,
+        "question_mark": float(text.rstrip().endswith("?")),
+        "interrogative_start": float(first in INTERROGATIVES),
+        "auxiliary_start": float(first in AUXILIARIES),
+        "request_start": float(first in REQUESTS),
+        "interrogative_any": float(any(t in INTERROGATIVES for t in tokens[1:])),
+        "first_person": float(any(t in FIRST_PERSON for t in tokens)),
+        "log_tokens": math.log1p(len(tokens))
+    }
+
+def load_weights(path: str) -> dict[str, float]:
+    # Weights fitted by scripts/train_classifier.py take precedence over the hand-set defaults
+    if not os.path.exists(path): return dict(DEFAULT_WEIGHTS)
+    with open(path) as f:
+        weights = json.load(f)
+    logger.info(f"Loaded query classifier weights from {path}")
+    return {name: weights.get(name, default) for name, default in DEFAULT_WEIGHTS.items()}
+
+WEIGHTS = load_weights(settings.classifier_weights_path)
+
+def question_probability(text: str, weights: dict[str, float] = WEIGHTS) -> float:
+    z = sum(weights[name] * value for name, value in features(text).items())
+    return 1 / (1 + math.exp(-z))
+
+@lru_cache(maxsize=settings.classifier_cache_size)
+def classify(text: str) -> tuple[str, float]:
+    # Returns the label and the model's confidence in it
+    p = question_probability(text)
+    return ("question", p) if p >= 0.5 else ("search term", 1 - p)
@@ -39,16 +39,70 @@ class Settings(BaseSettings):
     # Hugging Face Stuff
     hf_api_key: str = os.getenv("HUGGINGFACE_API_KEY")
     hf_inference_endpoint: str = "https://s2anvoabfag2is7a.us-east-1.aws.endpoints.huggingface.cloud"
+    # Query Classifier Stuff
+    classifier_mode: str = "hybrid"   # "local", "remote" or "hybrid"
+    classifier_confidence: float = 0.8
+    classifier_cache_size: int = 4096
+    classifier_weights_path: str = "classifier_weights.json"
+    # Retrieval Backend Stuff
+    retrieval_backend: str = "pinecone"   # "pinecone" or "local"
+    local_index_path: str = "local_index"
     # Pinecone Stuff
     pinecone_api_key: str = os.getenv("PINECONE_API_KEY")
     pinecone_env: str = os.getenv("PINECONE_ENV")
     pinecone_index: str = "huberman-search"
+    pinecone_index_host: str | None = None   # overrides the index URL, e.g. for a local proxy
     pinecone_namespace: str = "nocontext-default"
+    pinecone_workers: int = 4
+    pinecone_health_interval: float = 60.0   # seconds
+    pinecone_backoff_base: float = 1.0   # seconds
+    pinecone_backoff_max: float = 60.0   # seconds
     # Pinecone Querying Stuff
     hybrid_scale: bool = True
     top_k: int = 10
     sparse_alpha_value: float = 0.3
     dense_alpha_value: float = 0.8
+    # SPLADE Stuff
+    splade_engine: str = "torch"   # "torch", "quantized" or "onnx"
+    splade_snapshot_path: str = "splade.pt"   # torch engine
+    splade_quantized_snapshot_path: str = "splade-quantized.pt"
+    splade_onnx_path: str = "splade-onnx"
+    # Retrieval Preparation Stuff
+    splade_workers: int = 2
+    splade_max_batch_size: int = 16
+    splade_max_wait_ms: float = 8.0
+    splade_queue_depth: int = 256
+    ada_timeout: float = 10.0
+    splade_timeout: float = 5.0
+    classify_timeout: float = 5.0
+    # Upstream Client Stuff (Hugging Face and OpenAI)
+    upstream_http2: bool = True
+    upstream_max_connections: int = 100
+    upstream_max_keepalive: int = 20
+    upstream_keepalive_expiry: float = 30.0   # seconds
+    upstream_warm_connections: int = 2   # keep-alive connections opened per upstream at startup
+    upstream_retries: int = 2
+    upstream_backoff_ms: float = 100.0   # first retry waits up to this, doubling per retry (full jitter)
+    upstream_backoff_max_ms: float = 2000.0
+    upstream_retry_budget: float = 0.1   # retries allowed per request, on average
+    upstream_retry_burst: int = 10
+    upstream_hedge: bool = True   # hedge idempotent calls (embeddings, classification)
+    upstream_hedge_quantile: float = 0.9   # latency quantile after which the duplicate is sent
+    upstream_hedge_outlier: float = 4.0   # latencies above this multiple of the median are left out of the quantile
+    upstream_hedge_budget: float = 0.2   # hedges allowed per hedgeable call, on average
+    upstream_hedge_burst: int = 10
+    upstream_hedge_min_ms: float = 20.0
+    upstream_hedge_window: int = 256   # recent latencies the quantile is taken over
+    upstream_hedge_min_samples: int = 32   # no hedging until this many latencies are known
+    # Search Stuff
+    search_max_age: int = 300   # seconds clients and CDNs may reuse a /search response
+    # Batch Stuff
+    batch_max_queries: int = 1000
+    batch_concurrency: int = 8   # concurrent Pinecone lookups (and remote classifications) per batch
+    batch_gpt_concurrency: int = 8   # concurrent completions per /query/batch
+    ada_batch_size: int = 256   # texts per batched embeddings request
+    ada_batch_timeout: float = 60.0
+    gpt_answer_timeout: float = 60.0
     # OpenAI Stuff
     openai_api_key: str = os.getenv("OPENAI_API_KEY")
     embedding_model: str = "text-embedding-ada-002"
@@ -56,20 +110,50 @@ class Settings(BaseSettings):
     gpt_model: str = "gpt-3.5-turbo-16k-0613"
     gpt_endpoint: str = "https://api.openai.com/v1/chat/completions"
     gpt_sys_message: str = "You are a helpful AI agent designed to help users better understand the content of the episodes in the Huberman Lab podcast. Your task is to answer the subsequent query to the best of your ability by using the following passages from your podcast, which are delimited by triple quotes. If the answer cannot be found, write 'Unfortunately, I don't believe I've covered that topic in my podcast. Please note that my podcast is limited to neuroscience and its connections to human perception, behavior and health.' Crucially, be accurate, concise, and clear."
+    # Context Packing Stuff
+    context_token_budget: int = 3000   # tokens of passages in the GPT prompt
+    context_merge_gap: float = 1.0   # seconds between passages of an episode that are still merged
     # Redis Stuff
     redis_host: str = os.getenv("REDIS_HOST")
     redis_password: str = os.getenv("REDIS_PASSWORD")
     redis_port: int = 33643
     ssl: bool = True
-    expiry_time: int = 120
+    expiry_time: int = 86400   # seconds, base TTL of a cached query
+    max_expiry_time: int = 2592000   # seconds, TTL ceiling for popular queries
+    cache_max_entries: int = 50000
+    cache_evict_grace: int = 60   # seconds a new entry is safe from eviction
+    popularity_key: str = "query:popularity"
+    cache_entries_key: str = "query:cached"   # the cached queries, scored by expiry
+    embedding_cache_prefix: str = "emb:"
+    local_cache_size: int = 1024
+    local_cache_ttl: int = 120
+    # Answer Cache Stuff
+    answer_cache_enabled: bool = True
+    answer_cache_threshold: float = 0.97   # cosine similarity of Ada query embeddings
+    answer_cache_ttl: int = 3600
+    answer_cache_size: int = 2048
+    index_version_key: str = "index:version"   # bumped by scripts/index_version.py on re-ingestion
+    answer_cache_version_interval: float = 30.0   # seconds between index version checks
+    # Request Coalescing Stuff
+    coalesce_mode: str = "local"   # "off", "local" or "redis" (also coalesces embeddings across instances)
+    coalesce_lock_prefix: str = "flight:"
+    coalesce_lock_ttl_ms: int = 10000
+    coalesce_poll_ms: float = 25.0
+    # Metrics Stuff
+    metrics_enabled: bool = True
+    slow_request_ms: float = 10000.0   # requests slower than this (SSE streams included) are logged
+    slow_request_sample_rate: float = 0.1   # fraction of slow requests logged with their stage breakdown
     # Supabase Stuff
     supabase_url: str = os.getenv("SUPABASE_URL")
     supabase_key: str = os.getenv("SUPABASE_KEY")
+    episodes_refresh_interval: int = 600   # seconds
     # Logging Stuff
     logger_name: str = os.getenv("LOGGER_NAME")
     log_level: str = os.getenv("LOG_LEVEL")
     logger: LogConfig = LogConfig()
     stream_retry_timeout: int = 3000   # milliseconds
+    stream_flush_bytes: int = 1024
+    stream_flush_ms: float = 25.0
     origins: list = [
         "*"
     ]
@@ -0,0 +1,83 @@
+import logging
+from functools import lru_cache
+from typing import NamedTuple
+
+from config import settings
+from schemas import Passage
+
+logger = logging.getLogger(settings.logger_name)
+
+class Span(NamedTuple):
+    # One or more merged passages from a single episode
+    video_id: str
+    title: str
+    start: float
+    end: float
+    content: str
+    score: float
+
+@lru_cache(maxsize=1)
+def encoder():
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(settings.gpt_model)
+    except Exception as err:
+        # the BPE file is baked into the image; without it, fall back to ~4 characters per token
+        logger.warning(f"Unable to load the tiktoken encoding, approximating token counts: {err}")
+        return None
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    enc = encoder()
+    return len(enc.encode(text)) if enc is not None else (len(text) + 3) // 4
+
+def parse_timestamp(timestamp: str) -> float:
+    # Inverse of utils.format_timestamps, e.g. "1:02:03.5" or "2 days, 1:02:03"
+    days, _, clock = timestamp.rpartition(", ")
+    hours, minutes, seconds = clock.split(":")
+    return (int(days.split()[0]) * 86400 if days else 0) + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def join_overlapping(first: str, second: str) -> str:
+    # Chunks overlap by whole sentences, so the second usually starts with the tail of the first
+    probe = second[:32]
+    i = first.find(probe)
+    while i != -1:
+        if second.startswith(first[i:]): return first + second[len(first) - i:]
+        i = first.find(probe, i + 1)
+    return f"{first} {second}"
+
+def merge_passages(passages: list[Passage], gap: float) -> list[Span]:
+    # Merge passages of the same episode whose time ranges overlap or are at most `gap` seconds apart
+    episodes: dict[str, list[Passage]] = {}
+    for p in passages: episodes.setdefault(p.video_id, []).append(p)
+    spans = []
+    for video_id, group in episodes.items():
+        group.sort(key=lambda p: parse_timestamp(p.start))
+        current = None
+        for p in group:
+            start, end = parse_timestamp(p.start), parse_timestamp(p.end)
+            if current is not None and start <= current.end + gap:
+                current = current._replace(
+                    end=max(current.end, end),
+                    content=current.content if end <= current.end else join_overlapping(current.content, p.content),
+                    score=max(current.score, p.score)
+                )
+                continue
+            if current is not None: spans.append(current)
+            current = Span(video_id, p.title, start, end, p.content, p.score)
+        spans.append(current)
+    return spans
+
+def format_passage(span: Span) -> str:
+    return f'\n\nPassage: """Source={span.title}, Content={span.content}"""'
+
+def pack_context(passages: list[Passage], budget: int, gap: float) -> list[str]:
+    # Highest-scoring merged passages first, skipping any that would overflow the token budget
+    packed, used = [], 0
+    for span in sorted(merge_passages(passages, gap), key=lambda s: s.score, reverse=True):
+        text = format_passage(span)
+        tokens = count_tokens(text)
+        if used + tokens > budget: continue
+        packed.append(text)
+        used += tokens
+    return packed
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import logging
+from typing import NamedTuple
+
+from config import settings
+
+logger = logging.getLogger(settings.logger_name)
+
+class Episode(NamedTuple):
+    description: str
+    tags: list
+
+class EpisodeStore:
+    # In-memory map of the Supabase `episodes` table, so building a passage
+    # never has to leave the process
+    def __init__(self, supabase) -> None:
+        self.supabase = supabase
+        self.episodes: dict[str, Episode] = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._missing: set[str] = set()
+        self._refresh_task: asyncio.Task | None = None
+
+    @staticmethod
+    def _parse(row: dict) -> Episode:
+        keywords = row.get("keywords") or "[]"
+        tags = json.loads(keywords) if isinstance(keywords, str) else list(keywords)
+        return Episode(description=row.get("description") or "", tags=tags)
+
+    def _select(self, ids: list[str] | None = None) -> list[dict]:
+        query = self.supabase.table("episodes").select("id,description,keywords")
+        if ids is not None: query = query.in_("id", ids)
+        return query.execute().data
+
+    def load(self) -> None:
+        # Full reload, swapped in one assignment so readers never see a partial map
+        episodes = {row["id"]: self._parse(row) for row in self._select()}
+        self.episodes = episodes
+        self.reloads += 1
+        logger.info(f"Loaded {len(episodes)} episodes into the episode store...")
+
+    async def reload(self) -> None:
+        await asyncio.to_thread(self.load)
+
+    async def fetch_missing(self, video_ids: list[str]) -> None:
+        # Bulk fetch any ids not already in the store with a single `in_` query
+        missing = [v for v in set(video_ids) if v not in self.episodes]
+        if not missing: return
+        try:
+            rows = await asyncio.to_thread(self._select, missing)
+        except Exception as err:
+            logger.error(f"Unable to fetch episodes {missing} from Supabase")
+            logger.debug(err)
+            return
+        for row in rows:
+            self.episodes[row["id"]] = self._parse(row)
+
+    async def prefetch(self, video_ids: list[str]) -> None:
+        self.start_refresh()
+        await self.fetch_missing(video_ids)
+
+    def get(self, video_id: str) -> Episode:
+        episode = self.episodes.get(video_id)
+        if episode is not None:
+            self.hits += 1
+            return episode
+        self.misses += 1
+        self._missing.add(video_id)
+        logger.warning(f"Episode <{video_id}> not found in episode store")
+        return Episode(description="", tags=[])
+
+    def start_refresh(self) -> None:
+        # Must be called from a running event loop; startup() runs outside of one in AWS mode
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop_refresh(self) -> None:
+        if self._refresh_task is None: return
+        self._refresh_task.cancel()
+        try:
+            await self._refresh_task
+        except asyncio.CancelledError:
+            pass
+        self._refresh_task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.episodes_refresh_interval)
+            try:
+                missing, self._missing = list(self._missing), set()
+                await self.fetch_missing(missing)
+                await self.reload()
+            except Exception as err:
+                logger.error("Unable to refresh episode store from Supabase")
+                logger.debug(err)
+
+    def stats(self) -> dict:
+        return {
+            "episodes": len(self.episodes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads
+        }
@@ -1,25 +1,36 @@
-from contextvars import ContextVar, copy_context
-from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
 from typing import Any
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.datastructures import State
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Values assigned during a request (g.name = value); GlobalsMiddleware gives each request a fresh dict
+_request: ContextVar[dict[str, Any] | None] = ContextVar("globals:request", default=None)
 
 class Globals:
-    __slots__ = ("_vars", "_defaults")
-    _vars: dict[str, ContextVar]
+    # Process-wide singletons live in a State (the app's `app.state` once bound) and are plain dict
+    # lookups; only values assigned with `g.name = value` are per request
+    __slots__ = ("_state", "_defaults", "_assigned")
+    _state: State
     _defaults: dict[str, Any]
+    _assigned: set[str]
 
     def __init__(self) -> None:
-        object.__setattr__(self, '_vars', {})
+        object.__setattr__(self, '_state', State())
         object.__setattr__(self, '_defaults', {})
-    
+        object.__setattr__(self, '_assigned', set())
+
+    def bind(self, state: State) -> None:
+        """Hold singletons in `state` (the app's `app.state`), keeping any already set."""
+        for name, value in self._state._state.items():
+            setattr(state, name, value)
+        object.__setattr__(self, '_state', state)
+
     def cleanup(self):
-        self._vars.clear()
+        for name in self._defaults:
+            self._state._state.pop(name, None)
         self._defaults.clear()
-        del self._vars
-        del self._defaults
+        self._assigned.clear()
 
     def set_default(self, name: str, default: Any) -> None:
         """Set a default value for a variable."""
@@ -27,36 +38,51 @@ class Globals:
         if (name in self._defaults and default is self._defaults[name]):
             return
         # Ensure we don't have a value set already - the default will have no effect then
-        if name in self._vars: 
+        if name in self._assigned:
             raise RuntimeError(f"Cannot set default as variable {name} was already set",)
         self._defaults[name] = default
+        self._state._state.pop(name, None)
 
     def _get_default_value(self, name: str) -> Any:
+        # Callable defaults are factories, resolved once on first access
         default = self._defaults.get(name, None)
-        return default() if callable(default) else default
-
-    def _ensure_var(self, name: str) -> None:
-        if name not in self._vars:
-            default = self._get_default_value(name)
-            self._vars[name] = ContextVar(f"globals:{name}", default=default)
+        value = default() if callable(default) else default
+        if name in self._defaults: self._state._state[name] = value
+        return value
 
     def __getattr__(self, name: str) -> Any:
-        self._ensure_var(name)
-        return self._vars[name].get()
+        values = _request.get()
+        if values is not None and name in values:
+            return values[name]
+        try:
+            return self._state._state[name]
+        except KeyError:
+            return self._get_default_value(name)
 
     def __setattr__(self, name: str, value: Any) -> None:
-        self._ensure_var(name)
-        self._vars[name].set(value)
-    
-async def globals_middleware_dispatch(request: Request, call_next: Callable) -> Response:
-    ctx = copy_context()
-    def _call_next() -> Awaitable[Response]: return call_next(request)
-    return await ctx.run(_call_next)
-
-class GlobalsMiddleware(BaseHTTPMiddleware):  # noqa
+        self._assigned.add(name)
+        values = _request.get()
+        if values is None:
+            values = {}
+            _request.set(values)
+        values[name] = value
+
+class GlobalsMiddleware:
+    # Pure ASGI middleware: scopes `g.name = value` assignments to the request without wrapping the
+    # response in a task and memory stream the way BaseHTTPMiddleware does, so SSE chunks pass straight through
     def __init__(self, app: ASGIApp) -> None:
-        super().__init__(app, globals_middleware_dispatch)
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        token = _request.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request.reset(token)
 
 g = Globals()
 
-# REFERENCE: This one smart dude at https://gist.github.com/ddanier/ead419826ac6c3d75c96f9d89bea9bd0
\ No newline at end of file
+# REFERENCE: This one smart dude at https://gist.github.com/ddanier/ead419826ac6c3d75c96f9d89bea9bd0
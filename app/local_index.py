@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import re
+import numpy as np
+
+from datetime import datetime
+
+from config import settings
+
+logger = logging.getLogger(settings.logger_name)
+
+# Files written by scripts/export_local_index.py, one directory per namespace
+INDEX_META = "index.json"
+DENSE = "dense.npy"
+SCALE = "scale.npy"
+SPARSE_INDPTR = "sparse_indptr.npy"
+SPARSE_INDICES = "sparse_indices.npy"
+SPARSE_DATA = "sparse_data.npy"
+METADATA = "metadata.jsonl"
+DEQUANT_BLOCK = 2048
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:\d{2})?)?")
+
+def _parse_dates(metadata: dict) -> dict:
+    # The Pinecone client deserializes ISO date strings in metadata into datetimes; do the same so
+    # local matches look exactly like Pinecone's
+    for key, value in metadata.items():
+        if isinstance(value, str) and _ISO_DATE.fullmatch(value):
+            metadata[key] = datetime.fromisoformat(value)
+    return metadata
+
+class LocalNamespace:
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, INDEX_META)) as f:
+            meta = json.load(f)
+        self.quantized = meta["quantized"]
+        self.vocab_size = meta["vocab_size"]
+        self.ids = meta["ids"]
+        # dense matrix stays memory-mapped; the OS pages it in on first use
+        self.dense = np.load(os.path.join(path, DENSE), mmap_mode="r")
+        self.scale = np.load(os.path.join(path, SCALE)) if self.quantized else None
+        indptr = np.load(os.path.join(path, SPARSE_INDPTR))
+        indices = np.load(os.path.join(path, SPARSE_INDICES))
+        data = np.load(os.path.join(path, SPARSE_DATA))
+        # transpose the CSR matrix into per-token posting lists (CSC), so a query only touches
+        # the vectors sharing one of its few non-zero tokens
+        rows = np.repeat(np.arange(len(self.ids), dtype=np.int32), np.diff(indptr))
+        order = np.argsort(indices, kind="stable")
+        self.posting_rows = rows[order]
+        self.posting_data = data[order]
+        self.posting_ptr = np.searchsorted(indices[order], np.arange(self.vocab_size + 1))
+        with open(os.path.join(path, METADATA)) as f:
+            self.metadata = [_parse_dates(json.loads(line)) for line in f]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def scores(self, vector: list[float], sparse_vector: dict[str, list] | None) -> np.ndarray:
+        # dotproduct metric, same as the Pinecone index: dense . q + sparse . q_sparse
+        query = np.asarray(vector, dtype=np.float32)
+        if self.quantized:
+            # numpy has no BLAS path for int8, so dequantize in cache-sized blocks instead
+            scores = np.empty(len(self.ids), dtype=np.float32)
+            for start in range(0, len(scores), DEQUANT_BLOCK):
+                block = self.dense[start:start + DEQUANT_BLOCK]
+                scores[start:start + DEQUANT_BLOCK] = block.astype(np.float32) @ query
+            scores *= self.scale
+        else:
+            scores = self.dense @ query
+        if sparse_vector and sparse_vector["indices"]:
+            rows, weights = [], []
+            for token, value in zip(sparse_vector["indices"], sparse_vector["values"]):
+                if token >= self.vocab_size: continue
+                start, end = self.posting_ptr[token], self.posting_ptr[token + 1]
+                rows.append(self.posting_rows[start:end])
+                weights.append(self.posting_data[start:end] * value)
+            if rows:
+                scores = scores + np.bincount(np.concatenate(rows), weights=np.concatenate(weights), minlength=len(self.ids))
+        return scores
+
+    def top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, len(scores))
+        if k <= 0: return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind="stable")]
+
+class LocalIndex:
+    # In-process hybrid index exposing the subset of pinecone.Index used by PineconeDB
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.namespaces = {
+            name: LocalNamespace(os.path.join(path, name))
+            for name in sorted(os.listdir(path))
+            if os.path.isfile(os.path.join(path, name, INDEX_META))
+        }
+        if not self.namespaces: raise FileNotFoundError(f"No local index namespaces found in {path}")
+
+    def query(self, top_k: int, vector: list[float], sparse_vector: dict[str, list] | None = None,
+              namespace: str = "", include_metadata: bool = False, **kwargs) -> dict:
+        ns = self.namespaces[namespace]
+        scores = ns.scores(vector, sparse_vector)
+        matches = []
+        for i in ns.top_k(scores, top_k):
+            match = {"id": ns.ids[i], "score": float(scores[i]), "values": []}
+            if include_metadata: match["metadata"] = ns.metadata[i]
+            matches.append(match)
+        return {"matches": matches, "namespace": namespace}
+
+    def describe_index_stats(self) -> dict:
+        first = next(iter(self.namespaces.values()))
+        total = sum(len(ns) for ns in self.namespaces.values())
+        return {
+            "dimension": first.dense.shape[1],
+            "index_fullness": 0.0,
+            "namespaces": {name: {"vector_count": len(ns)} for name, ns in self.namespaces.items()},
+            "total_vector_count": total
+        }
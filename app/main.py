@@ -1,44 +1,72 @@
-import torch
+import asyncio
 import logging
-import json
 import redis.asyncio as redis
-from supabase import create_client, Client
 
-from httpx import AsyncClient
-from pinecone_text.sparse import SpladeEncoder
 from typing import Any
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from logging.config import dictConfig
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from sse_starlette.sse import EventSourceResponse
-from fastapi import status, BackgroundTasks, Request, FastAPI
+from fastapi import status, Request, FastAPI
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from config import settings
 from pinecone_db import PineconeDB
-from ml import splade_encode, ada_encode, gpt_complete
-from utils import passage, gpt_message
-from schemas import Query
+from episodes import EpisodeStore
+from batching import SpladeBatcher
+from cache import EmbeddingCache, normalize_key
+from singleflight import SingleFlight, RedisSingleFlight, Broadcaster, flight_key
+from answer_cache import Answer, AnswerCache
+from startup import Timeline, LazySplade
+from tracing import CACHE_LOOKUPS, MetricsMiddleware, span
+from upstream import create_upstream
+from ml import prepare_retrieval, zero_shot_classify, gpt_complete, replay_answer
+from batch import check_batch_size, search_batch, query_batch
+from utils import passage, gpt_message, search_result, etag, etag_matches
+from schemas import Passage, Query, QueryBatch
 from globals import g, GlobalsMiddleware
 
 
 dictConfig(settings.logger.dict())
 logger = logging.getLogger(settings.logger_name)
 
+def init_supabase():
+    from supabase import create_client
+    return create_client(
+        settings.supabase_url,
+        settings.supabase_key
+    )
+
+def init_episode_store(supabase) -> EpisodeStore:
+    # Load episode metadata once so passages are built without Supabase round trips
+    episode_store = EpisodeStore(supabase)
+    episode_store.load()
+    return episode_store
+
 def startup() -> None:
-    # Initialize connection to Pinecone
-    pinecone_db = PineconeDB()
-    g.set_default("pinecone_db", pinecone_db)
-    # Load the ML models
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    splade = SpladeEncoder(device=device)
-    hf_client = AsyncClient(timeout=5.0)
-    ada_client = AsyncClient(timeout=10.0)
-    gpt_client = AsyncClient(timeout=20.0)
+    timeline = Timeline()
+    g.set_default("startup_timeline", timeline)
+    # SPLADE loads in the background (or on first use) rather than blocking startup
+    splade = LazySplade(timeline)
     g.set_default("splade", splade)
+    splade.warm()
+    # Pooled HTTP/2 clients with retries, and hedging for the idempotent calls
+    hf_client = create_upstream("huggingface", timeout=5.0)
+    ada_client = create_upstream("openai_embeddings", timeout=10.0)
+    gpt_client = create_upstream("openai_chat", timeout=20.0)
+    g.set_default("splade_executor", ThreadPoolExecutor(max_workers=settings.splade_workers, thread_name_prefix="splade"))
+    g.set_default("splade_batcher", SpladeBatcher(
+        max_batch_size=settings.splade_max_batch_size,
+        max_wait_ms=settings.splade_max_wait_ms,
+        queue_depth=settings.splade_queue_depth,
+        workers=settings.splade_workers
+    ))
     g.set_default("hf_client", hf_client)
     g.set_default("ada_client", ada_client)
     g.set_default("gpt_client", gpt_client)
-    # Initialize connection to Redis
+    # Initialize connection to Redis (connections are opened lazily on first command)
     redis_client = redis.Redis(
         host = settings.redis_host,
         port = settings.redis_port,
@@ -46,14 +74,43 @@ def startup() -> None:
         ssl = settings.ssl
     )
     g.set_default("redis_client", redis_client)
+    g.set_default("embedding_cache", EmbeddingCache(
+        redis_client,
+        prefix=settings.embedding_cache_prefix,
+        local_capacity=settings.local_cache_size,
+        local_ttl=settings.local_cache_ttl,
+        popularity_key=settings.popularity_key,
+        base_ttl=settings.expiry_time,
+        max_ttl=settings.max_expiry_time,
+        max_entries=settings.cache_max_entries,
+        entries_key=settings.cache_entries_key,
+        evict_grace=settings.cache_evict_grace
+    ))
     logger.info("Connected to Redis client...")
-    # Initialize connection to Supabase
-    supabase: Client = create_client(
-        settings.supabase_url,
-        settings.supabase_key
-    )
-    g.set_default("supabase", supabase)
-    logger.info("Connected to Supabase DB...")
+    g.set_default("answer_cache", AnswerCache(
+        capacity=settings.answer_cache_size,
+        threshold=settings.answer_cache_threshold,
+        ttl=settings.answer_cache_ttl
+    ))
+    # Identical in-flight queries share embeddings, retrieval and the GPT stream
+    g.set_default("flights", SingleFlight())
+    g.set_default("broadcaster", Broadcaster())
+    g.set_default("redis_flights", RedisSingleFlight(
+        redis_client,
+        prefix=settings.coalesce_lock_prefix,
+        lock_ttl_ms=settings.coalesce_lock_ttl_ms,
+        poll_ms=settings.coalesce_poll_ms
+    ))
+    # Pinecone and Supabase are independent, so initialize them concurrently
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup") as pool:
+        pinecone_db = pool.submit(timeline.timed, "pinecone", PineconeDB)
+        supabase = timeline.timed("supabase", init_supabase)
+        episode_store = pool.submit(timeline.timed, "episode_store", init_episode_store, supabase)
+        g.set_default("pinecone_db", pinecone_db.result())
+        g.set_default("supabase", supabase)
+        logger.info("Connected to Supabase DB...")
+        g.set_default("episode_store", episode_store.result())
+    timeline.log("startup")
     logger.info("App initialized!")
 
 async def shutdown() -> None:
@@ -62,15 +119,31 @@ async def shutdown() -> None:
     await g.hf_client.aclose()
     await g.ada_client.aclose()
     await g.gpt_client.aclose()
-    await g.redis_client.flushall(asynchronous=True)
+    await g.episode_store.stop_refresh()
+    await g.pinecone_db.stop_monitor()
+    g.pinecone_db.close()
+    await g.splade_batcher.stop()
+    g.splade_executor.shutdown(wait=False)
     await g.redis_client.close()
     g.cleanup()
     logger.info("Cleaned up resources...")
 
+async def warm_upstreams() -> None:
+    # TCP and TLS handshakes happen before the first query instead of during it
+    connections = settings.upstream_warm_connections
+    await asyncio.gather(
+        g.hf_client.warm(settings.hf_inference_endpoint, connections),
+        g.ada_client.warm(settings.embedding_endpoint, connections),
+        g.gpt_client.warm(settings.gpt_endpoint, connections)
+    )
+    logger.info("Pre-warmed upstream connections...")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     startup()
+    warming = asyncio.create_task(warm_upstreams())
     yield
+    warming.cancel()
     await shutdown()
 
 def create_app() -> FastAPI:
@@ -79,8 +152,10 @@ def create_app() -> FastAPI:
         app = FastAPI(
             title=settings.title,
             description=settings.description,
-            version=settings.version
+            version=settings.version,
+            on_startup=[warm_upstreams]
         )
+        g.bind(app.state)
         startup()
     else:
         app = FastAPI(
@@ -89,48 +164,142 @@ def create_app() -> FastAPI:
             version=settings.version,
             lifespan=lifespan
         )
+        # singletons set in startup() live in app.state
+        g.bind(app.state)
     app.add_middleware(GlobalsMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=settings.origins,
         allow_credentials=True,
         allow_methods=["*"],
-        allow_headers=["*"]
+        allow_headers=["*"],
+        expose_headers=["Server-Timing", "ETag"]
     )
+    # outermost, so request timings cover the other middleware too
+    app.add_middleware(MetricsMiddleware)
     return app
 
 app = create_app()
 
-async def get_cache(query: Query) -> None | tuple[dict[str, list], None | list[float]]:
-    cache = await g.redis_client.exists(query.text.lower())
-    if not cache: return None, None
-    logger.debug(f"Cache hit for query: {query.text}")
-    embeddings = await g.redis_client.get(query.text.lower())
-    dense, sparse = json.loads(embeddings)["dense"], json.loads(embeddings)["sparse"]
+async def get_cache(query: Query) -> tuple[None | list[float], None | dict[str, list]]:
+    with span("embedding_cache"):
+        dense, sparse = await g.embedding_cache.get(query.text)
+    CACHE_LOOKUPS.labels("embedding", "miss" if dense is None else "hit").inc()
+    if dense is not None: logger.debug(f"Cache hit for query: {query.text}")
     return dense, sparse
 
-async def set_cache(query: Query, dense: list[float], sparse: dict[str, list], exp: int):
-    embeddings = {
-        "dense": dense,
-        "sparse": sparse
-    }
-    await g.redis_client.setex(query.text.lower(), exp, json.dumps(embeddings))
+async def set_cache(query: Query, dense: list[float], sparse: dict[str, list]):
+    await g.embedding_cache.set(query.text, dense, sparse)
+
+async def encode_and_cache(query: Query) -> tuple[list[float], dict[str, list]]:
+    dense, sparse, _ = await prepare_retrieval(query, classify=False)
+    await set_cache(query, dense, sparse)
+    return dense, sparse
+
+async def lookup_cache(query: Query) -> None | tuple[list[float], dict[str, list]]:
+    dense, sparse = await g.embedding_cache.get(query.text, track=False)
+    return None if dense is None else (dense, sparse)
+
+async def encode(query: Query) -> tuple[list[float], dict[str, list], str]:
+    dense, sparse = await get_cache(query)
+    if dense is not None: return await prepare_retrieval(query, dense, sparse)
+    logger.debug(f"Cache miss for query: {query.text}")
+    if settings.coalesce_mode == "redis":
+        # another instance may already be encoding this query; wait for its cache entry instead
+        (dense, sparse), class_ = await asyncio.gather(
+            g.redis_flights.do(normalize_key(query.text), lambda: encode_and_cache(query), lambda: lookup_cache(query)),
+            zero_shot_classify(query)
+        )
+        return dense, sparse, class_
+    dense, sparse, class_ = await prepare_retrieval(query)
+    g.embedding_cache.set_later(query.text, dense, sparse)
+    return dense, sparse, class_
+
+async def lookup_answer(dense: list[float]) -> Answer | None:
+    if not settings.answer_cache_enabled: return None
+    with span("answer_cache"):
+        await g.answer_cache.check_version(g.redis_client)
+        answer = g.answer_cache.lookup(dense)
+    CACHE_LOOKUPS.labels("answer", "miss" if answer is None else "hit").inc()
+    return answer
+
+def store_answer(dense: list[float]):
+    if not settings.answer_cache_enabled: return None
+    return lambda answer: g.answer_cache.store(dense, answer)
+
+async def find_passages(query: Query, dense: list[float], sparse: dict[str, list], class_: str) -> list[Passage]:
+    matches = await g.pinecone_db.query_db(query, dense, sparse, class_)
+    with span("episodes"):
+        await g.episode_store.prefetch([m['metadata']['video_id'] for m in matches])
+    with span("passages"):
+        return [passage(m) for m in matches]
+
+async def retrieve(query: Query) -> tuple[list[float], list[Passage], Answer | None]:
+    dense, sparse, class_ = await encode(query)
+    # a near-duplicate of an answered question skips retrieval and the completion altogether
+    answer = await lookup_answer(dense)
+    if answer is not None: return dense, [], answer
+    return dense, await find_passages(query, dense, sparse, class_), None
+
+async def search_body(query: Query) -> bytes:
+    passages = await find_passages(query, *await encode(query))
+    return search_result(query, passages).model_dump_json().encode()
 
 
 @app.post("/query")
-async def query(payload: Query, background_tasks: BackgroundTasks) -> Any:
-    dense, sparse = await get_cache(payload)
-    if not (dense and sparse):
-        logger.debug(f"Cache miss for query: {payload.text}")
-        dense, sparse = await ada_encode(payload), await splade_encode(payload)
-        background_tasks.add_task(set_cache, payload, dense, sparse, settings.expiry_time)
-
-    matches = await g.pinecone_db.query_db(payload, dense, sparse)
-    passages = [passage(m) for m in matches]
+async def query(payload: Query) -> Any:
+    if settings.coalesce_mode == "off":
+        with span("retrieve"):
+            dense, passages, answer = await retrieve(payload)
+        if answer is not None: return EventSourceResponse(replay_answer(answer), media_type='text/event-stream')
+        gpt_comp = gpt_complete(gpt_message(payload, passages), passages, store_answer(dense))
+        return EventSourceResponse(gpt_comp, media_type='text/event-stream')
+    key = flight_key(payload.text)
+    with span("retrieve"):
+        dense, passages, answer = await g.flights.do(key, lambda: retrieve(payload))
+    if answer is not None: return EventSourceResponse(replay_answer(answer), media_type='text/event-stream')
     message = gpt_message(payload, passages)
-    gpt_comp = gpt_complete(message, passages)
+    # followers attach to the leader's stream and replay the chunks they missed
+    gpt_comp = g.broadcaster.stream(key, lambda: gpt_complete(message, passages, store_answer(dense)))
     return EventSourceResponse(gpt_comp, media_type='text/event-stream')
 
+@app.get("/search")
+async def search(request: Request, q: str) -> Response:
+    # Passages without a completion, as a cacheable GET with episode fields listed once per episode
+    query = Query(text=q)
+    if settings.coalesce_mode == "off": body = await search_body(query)
+    else: body = await g.flights.do(("search", flight_key(q)), lambda: search_body(query))
+    tag = etag(body)
+    headers = {"ETag": tag, "Cache-Control": f"public, max-age={settings.search_max_age}"}
+    if etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.post("/search/batch")
+async def search_many(payload: QueryBatch) -> Any:
+    # NDJSON, one line of passages per query in input order
+    check_batch_size(payload.queries)
+    return StreamingResponse(await search_batch(payload.queries), media_type='application/x-ndjson')
+
+@app.post("/query/batch")
+async def query_many(payload: QueryBatch) -> Any:
+    # NDJSON, one completion with its passages per query in input order
+    check_batch_size(payload.queries)
+    return StreamingResponse(await query_batch(payload.queries), media_type='application/x-ndjson')
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/ready")
+async def readiness():
+    # Ready once the SPLADE model is loaded; liveness stays on the healthcheck below
+    ready = g.splade.ready.is_set()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"ready": ready, "startup": g.startup_timeline.as_dict()}
+    )
+
 @app.get("/", status_code=status.HTTP_200_OK)
 async def healthcheck(request: Request):
     return {
@@ -138,5 +307,11 @@ async def healthcheck(request: Request):
         "description": request.app.description,
         "version": request.app.version,
         "redis_ping": await g.redis_client.ping(),
+        "pinecone": g.pinecone_db.stats(),
+        "episode_store": g.episode_store.stats(),
+        "embedding_cache": g.embedding_cache.stats(),
+        "answer_cache": g.answer_cache.stats(),
+        "upstreams": {u.name: u.stats() for u in (g.hf_client, g.ada_client, g.gpt_client)},
+        "coalesced": {"retrievals": g.flights.followers, "streams": g.broadcaster.followers},
         "health": "All is well!"
     }
@@ -1,18 +1,25 @@
 import logging
 import json
 import asyncio
+import time
+from collections.abc import Callable
+from contextlib import aclosing
 from fastapi import HTTPException
 from fastapi.encoders import jsonable_encoder
 from sse_starlette.sse import ServerSentEvent
 
 from config import settings
 from globals import g
+from classifier import classify
+from answer_cache import Answer, assemble_completion
+from tracing import TOKENS_STREAMED, UPSTREAM_ERRORS, record, span, traced
 from schemas import Passage, Query, Message
 
 logger = logging.getLogger(settings.logger_name)
 
-# Zero-shot classify if query is a question or search term
-async def zero_shot_classify(query: Query) -> str:
+# Zero-shot classify if query is a question or search term using the remote inference endpoint
+@traced("hf_classify")
+async def remote_classify(query: Query) -> str:
     headers = {
         "Authorization": f"Bearer {settings.hf_api_key}"
     }
@@ -23,19 +30,35 @@ async def zero_shot_classify(query: Query) -> str:
         }
     }
     try:
-        res = await g.hf_client.post(url=settings.hf_inference_endpoint, headers=headers, json=payload)
+        res = await g.hf_client.post(url=settings.hf_inference_endpoint, hedge=True, headers=headers, json=payload)
         scores = sorted(zip(res.json()['scores'], res.json()['labels']), reverse=True)
         logger.info(f"Query <{query.text}> classified as <{scores[0][1]}>")
         return scores[0][1]
     except Exception as err:
+        UPSTREAM_ERRORS.labels("huggingface").inc()
         logger.error(f"Unable to reach inference endpoint for zero-shot classification")
         logger.warning("Defaulting to scaled dense vector similarity search...")
         return "question"
 
+# Classify if query is a question or search term: in-process, remotely, or in-process with
+# remote confirmation when the local model isn't confident
+@traced("classify")
+async def zero_shot_classify(query: Query) -> str:
+    if settings.classifier_mode == "remote": return await remote_classify(query)
+    label, confidence = classify(query.text.strip())
+    if settings.classifier_mode == "hybrid" and confidence < settings.classifier_confidence:
+        logger.info(f"Low confidence ({confidence:.2f}) local classification of <{query.text}>, confirming remotely")
+        return await remote_classify(query)
+    logger.info(f"Query <{query.text}> classified as <{label}> ({confidence:.2f})")
+    return label
+
+# SPLADE runs batched in a bounded executor so the torch forward pass never blocks the event loop
+@traced("splade")
 async def splade_encode(query: Query) -> dict[str, list]:
-    return g.splade.encode_queries(query.text)
+    return await g.splade_batcher.encode(query.text)
 
 # Ada
+@traced("ada")
 async def ada_encode(query: Query) -> list[float]:
     headers = {
         "Content-Type": "application/json",
@@ -46,15 +69,194 @@ async def ada_encode(query: Query) -> list[float]:
         "input": query.text
     }
     try:
-        dense = await g.ada_client.post(url=settings.embedding_endpoint, headers=headers, json=payload)
+        dense = await g.ada_client.post(url=settings.embedding_endpoint, hedge=True, headers=headers, json=payload)
         return dense.json()['data'][0]['embedding']
     except Exception as err:
+        UPSTREAM_ERRORS.labels("openai_embeddings").inc()
         logger.error(f"Unable to reach OpenAI Ada client. Sending Internal Server Error Response to client.")
         detail = "There was a problem encountered in the server. Please wait a couple of seconds before trying again."
         raise HTTPException(status_code=500, detail=detail)
 
-# Chat Completion
-async def gpt_complete(message: Message, passages: list[Passage]):
+# Batched variants for /query/batch and /search/batch: one Ada request per ada_batch_size texts
+# (the embeddings API takes arrays) and one SPLADE forward pass per splade_max_batch_size texts
+@traced("ada_batch")
+async def ada_encode_batch(texts: list[str]) -> list[list[float]]:
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {settings.openai_api_key}"
+    }
+    dense = []
+    try:
+        for i in range(0, len(texts), settings.ada_batch_size):
+            payload = {
+                "model": settings.embedding_model,
+                "input": texts[i:i + settings.ada_batch_size]
+            }
+            res = await g.ada_client.post(url=settings.embedding_endpoint, headers=headers, json=payload, timeout=settings.ada_batch_timeout)
+            # the API does not promise to return the embeddings in input order
+            dense.extend(d['embedding'] for d in sorted(res.json()['data'], key=lambda d: d['index']))
+        return dense
+    except Exception as err:
+        UPSTREAM_ERRORS.labels("openai_embeddings").inc()
+        logger.error(f"Unable to reach OpenAI Ada client for a batch of {len(texts)} queries. Sending Internal Server Error Response to client.")
+        logger.debug(err)
+        detail = "There was a problem encountered in the server. Please wait a couple of seconds before trying again."
+        raise HTTPException(status_code=500, detail=detail)
+
+@traced("splade_batch")
+async def splade_encode_batch(texts: list[str]) -> list[dict[str, list]]:
+    loop = asyncio.get_running_loop()
+    size = settings.splade_max_batch_size
+    chunks = [texts[i:i + size] for i in range(0, len(texts), size)]
+    # chunks run side by side, bounded by the SPLADE executor's workers
+    results = await asyncio.gather(*(loop.run_in_executor(g.splade_executor, g.splade.encode_queries, c) for c in chunks))
+    return [sparse for chunk in results for sparse in chunk]
+
+@traced("classify_batch")
+async def classify_batch(queries: list[Query]) -> list[str]:
+    # Local classification for all queries; in hybrid mode only the uncertain ones go to the remote endpoint
+    if settings.classifier_mode == "remote":
+        labels, uncertain = ["question"] * len(queries), list(range(len(queries)))
+    else:
+        labels, uncertain = [], []
+        for i, query in enumerate(queries):
+            label, confidence = classify(query.text.strip())
+            labels.append(label)
+            if settings.classifier_mode == "hybrid" and confidence < settings.classifier_confidence: uncertain.append(i)
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+    async def confirm(i: int) -> None:
+        async with semaphore: labels[i] = await remote_classify(queries[i])
+    await asyncio.gather(*(confirm(i) for i in uncertain))
+    return labels
+
+# Non-streamed chat completion, for batch evaluation
+async def gpt_answer(message: Message) -> str:
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {settings.openai_api_key}"
+    }
+    payload = {
+        "model": settings.gpt_model,
+        "messages": [
+            {"role": "system", "content": settings.gpt_sys_message},
+            {"role": "user", "content": message.text}
+        ]
+    }
+    try:
+        with span("gpt_answer"):
+            res = await g.gpt_client.post(url=settings.gpt_endpoint, headers=headers, json=payload, timeout=settings.gpt_answer_timeout)
+            res.raise_for_status()
+        return res.json()['choices'][0]['message']['content']
+    except Exception as err:
+        UPSTREAM_ERRORS.labels("openai_chat").inc()
+        logger.error(f"Unable to reach OpenAI GPT-Turbo client for a batch answer.")
+        logger.debug(err)
+        detail = "There was a problem encountered in the server. Please wait a couple of seconds before trying again."
+        raise HTTPException(status_code=500, detail=detail)
+
+async def _classify_step(query: Query) -> str:
+    try:
+        return await asyncio.wait_for(zero_shot_classify(query), timeout=settings.classify_timeout)
+    except asyncio.TimeoutError:
+        UPSTREAM_ERRORS.labels("classifier_timeout").inc()
+        logger.error(f"Zero-shot classification timed out after {settings.classify_timeout}s")
+        logger.warning("Defaulting to scaled dense vector similarity search...")
+        return "question"
+
+async def _encode_step(coro, timeout: float, name: str):
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        UPSTREAM_ERRORS.labels(f"{name.lower()}_timeout").inc()
+        logger.error(f"{name} encoding timed out after {timeout}s. Sending Internal Server Error Response to client.")
+        detail = "There was a problem encountered in the server. Please wait a couple of seconds before trying again."
+        raise HTTPException(status_code=500, detail=detail)
+
+# Retrieval preparation: Ada, SPLADE and the query classifier are independent, so run them concurrently.
+# Cached embeddings skip their encoding step; classify=False skips classification (class_ is None).
+async def prepare_retrieval(query: Query, dense: list[float] | None = None, sparse: dict[str, list] | None = None,
+                            classify: bool = True) -> tuple[list[float], dict[str, list], str | None]:
+    steps = [asyncio.ensure_future(_classify_step(query) if classify else asyncio.sleep(0))]
+    if not dense:
+        steps.append(asyncio.ensure_future(_encode_step(ada_encode(query), settings.ada_timeout, "Ada")))
+    if not sparse:
+        steps.append(asyncio.ensure_future(_encode_step(splade_encode(query), settings.splade_timeout, "SPLADE")))
+    try:
+        results = await asyncio.gather(*steps)
+    except BaseException:
+        for step in steps: step.cancel()
+        raise
+    class_ = results[0]
+    if not dense: dense = results[1]
+    if not sparse: sparse = results[-1]
+    return dense, sparse, class_
+
+# Pre-encoded SSE frames, so upstream chunks are relayed as raw bytes without a JSON round trip
+_GPT_EVENT = b"event: gpt-response\r\ndata: "
+_GPT_RETRY = f"\r\nretry: {settings.stream_retry_timeout}\r\n\r\n".encode()
+_CLOSE_EVENT = b"event: close\r\ndata: {}\r\n\r\n"
+
+async def _sse_lines(response):
+    buffer = b""
+    async for chunk in response.aiter_bytes():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines: yield line.rstrip(b"\r")
+    if buffer: yield buffer.rstrip(b"\r")
+
+async def _relay(headers: dict, payload: dict, frames: asyncio.Queue, deltas: list[bytes]) -> None:
+    # Producer: reads the upstream stream and queues one SSE frame per delta, then None when done.
+    # Raw deltas are kept so the completion can be assembled once the stream is over.
+    try:
+        async with g.gpt_client.stream('POST', url=settings.gpt_endpoint, headers=headers, json=payload) as response:
+            # An error response (or a 429/5xx that outlived its retries) has no data lines to relay
+            if response.status_code != 200:
+                body = await response.aread()
+                raise HTTPException(status_code=response.status_code, detail=body.decode(errors="replace")[:500])
+            async for line in _sse_lines(response):
+                if not line.startswith(b"data:"): continue
+                value = line[5:]
+                if value.startswith(b" "): value = value[1:]
+                if value == b"[DONE]":
+                    frames.put_nowait(_CLOSE_EVENT)
+                    continue
+                deltas.append(value)
+                frames.put_nowait(_GPT_EVENT + value + _GPT_RETRY)
+        frames.put_nowait(None)
+    except Exception as err:
+        frames.put_nowait(err)
+
+async def _coalesce(frames: asyncio.Queue):
+    # Flush the first delta immediately, then whenever the buffer reaches stream_flush_bytes
+    # or its oldest frame has waited stream_flush_ms
+    loop = asyncio.get_running_loop()
+    max_wait = settings.stream_flush_ms / 1000
+    buffer, deadline, flushed = bytearray(), 0.0, False
+    getter = None
+    try:
+        while True:
+            if getter is None: getter = asyncio.ensure_future(frames.get())
+            timeout = max(0.0, deadline - loop.time()) if buffer else None
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                yield bytes(buffer)
+                buffer.clear()
+                continue
+            item, getter = getter.result(), None
+            if item is None: break
+            if isinstance(item, Exception): raise item
+            if not buffer: deadline = loop.time() + max_wait
+            buffer += item
+            if not flushed or len(buffer) >= settings.stream_flush_bytes:
+                yield bytes(buffer)
+                buffer.clear()
+                flushed = True
+        if buffer: yield bytes(buffer)
+    finally:
+        if getter is not None: getter.cancel()
+
+# Chat Completion. on_complete receives the assembled answer once the stream finished cleanly.
+async def gpt_complete(message: Message, passages: list[Passage], on_complete: Callable[[Answer], None] | None = None):
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {settings.openai_api_key}"
@@ -67,31 +269,26 @@ async def gpt_complete(message: Message, passages: list[Passage]):
         ],
         "stream": True,
     }
+    frames = asyncio.Queue()
+    deltas = []
+    relay = None
+    data = json.dumps([jsonable_encoder(p) for p in passages])
     try:
         yield {
             "event": "passages",
-            "data": json.dumps([jsonable_encoder(p) for p in passages])
+            "data": data
         }
-        async with g.gpt_client.stream('POST', url=settings.gpt_endpoint, headers=headers, json=payload) as response:
-            async for raw in response.aiter_lines():
-                line = raw.rstrip("\n")
-                if not line: continue
-                _, _, value = line.partition(":")
-                if value.startswith(" "): value = value[1:]
-                if value != "[DONE]":
-                    chunk = json.loads(value)
-                    yield {
-                        "event": "gpt-response",
-                        "data": json.dumps(chunk),
-                        "retry": settings.stream_retry_timeout
-                    }    
-                else:
-                    yield {
-                        "event": "close",
-                        "data": {}
-                    }
-                await asyncio.sleep(0.05)
+        relay = asyncio.ensure_future(_relay(headers, payload, frames, deltas))
+        start, first = time.perf_counter(), True
+        async with aclosing(_coalesce(frames)) as chunks:
+            async for chunk in chunks:
+                if first:
+                    record("gpt_ttft", time.perf_counter() - start)
+                    first = False
+                yield chunk
+        record("gpt_stream", time.perf_counter() - start)
     except Exception as err:
+        UPSTREAM_ERRORS.labels("openai_chat").inc()
         logger.error(f"Unable to reach OpenAI GPT-Turbo client. Sending Internal Server Error Response to client.")
         logger.debug(err)
         detail = "There was a problem encountered in the server. Please wait a couple of seconds before trying again."
@@ -100,4 +297,21 @@ async def gpt_complete(message: Message, passages: list[Passage]):
             "data": detail
         })
         return
-    
\ No newline at end of file
+    finally:
+        # On client disconnect the response task cancels this generator; drop the upstream stream with it
+        if relay is not None: relay.cancel()
+        TOKENS_STREAMED.inc(len(deltas))
+    if on_complete is None or not deltas: return
+    try:
+        on_complete(Answer(assemble_completion(deltas), data))
+    except Exception as err:
+        logger.warning(f"Unable to cache the completed answer: {err}")
+
+# Replays a cached answer as the same passages / gpt-response / close event sequence, all at once
+async def replay_answer(answer: Answer):
+    yield {
+        "event": "passages",
+        "data": answer.passages
+    }
+    delta = {"choices": [{"index": 0, "delta": {"role": "assistant", "content": answer.completion}, "finish_reason": None}]}
+    yield _GPT_EVENT + json.dumps(delta).encode() + _GPT_RETRY + _CLOSE_EVENT
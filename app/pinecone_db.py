@@ -1,45 +1,116 @@
+import asyncio
 import logging
+import random
+import statistics
+import time
 import pinecone
 
-from pinecone_text.hybrid import hybrid_convex_scale
-from ml import zero_shot_classify
+from collections import deque
+from pinecone.core.client.configuration import Configuration as OpenApiConfiguration
+from concurrent.futures import ThreadPoolExecutor
+from typing import Protocol
+from local_index import LocalIndex
 from schemas import Query
+from tracing import STAGE_SECONDS, UPSTREAM_ERRORS, record
 from config import settings
 
+# Same as pinecone_text.hybrid.hybrid_convex_scale, which would import torch through pinecone_text.sparse
+def hybrid_convex_scale(dense: list[float], sparse: dict[str, list], alpha: float) -> tuple[list[float], dict[str, list]]:
+    if alpha < 0 or alpha > 1:
+        raise ValueError("Alpha must be between 0 and 1")
+    scaled_sparse = {
+        "indices": sparse["indices"],
+        "values": [v * (1 - alpha) for v in sparse["values"]]
+    }
+    return [v * alpha for v in dense], scaled_sparse
+
+class IndexBackend(Protocol):
+    # Retrieval backend behind PineconeDB: pinecone.Index, LocalIndex or a test double
+    def query(self, top_k: int, vector: list[float], sparse_vector: dict[str, list], namespace: str, include_metadata: bool) -> dict: ...
+    def describe_index_stats(self) -> dict: ...
+
 class PineconeDB():
-    def __init__(self):
+    def __init__(self, index: IndexBackend | None = None):
         self.api_key = settings.pinecone_api_key
         self.env = settings.pinecone_env
         self.index_name = settings.pinecone_index
         self.logger = logging.getLogger(settings.logger_name)
-        self.init_db()
-      
-      
-    def init_db(self) -> None:
-        pinecone.init(
-            api_key=self.api_key,
-            environment=self.env
-        )
+        # blocking client calls run in a bounded pool sized to the index's connection pool
+        self.executor = ThreadPoolExecutor(max_workers=settings.pinecone_workers, thread_name_prefix="pinecone")
+        self.latencies = deque(maxlen=1024)
+        self.calls = 0
+        self.errors = 0
+        self.reinits = 0
+        # set by the health monitor: False from a failed health check until a re-initialization succeeds
+        self.healthy = True
+        self._monitor_task: asyncio.Task | None = None
+        self._reinit_lock: asyncio.Lock | None = None
+        # an injected index (e.g. a test double) skips connecting to Pinecone
+        if index is None: self.init_db()
+        else: self.index = index
+
 
-        self.index = pinecone.Index(self.index_name)
+    def init_db(self) -> None:
+        if settings.retrieval_backend == "local":
+            self.index = LocalIndex(settings.local_index_path)
+        else:
+            # a configured index host (e.g. a local proxy or fake) replaces the URL derived from the index name
+            openapi_config = OpenApiConfiguration(host=settings.pinecone_index_host) if settings.pinecone_index_host else None
+            pinecone.init(
+                api_key=self.api_key,
+                environment=self.env,
+                openapi_config=openapi_config
+            )
+            self.index = pinecone.Index(self.index_name, pool_threads=settings.pinecone_workers)
         stats = self.index.describe_index_stats()
-        self.logger.info("Pinecone DB Initialized...")
+        self.logger.info(f"{settings.retrieval_backend.capitalize()} DB Initialized...")
         self.logger.info(f"Dimension: {stats['dimension']}")
         self.logger.info(f"Index Capacity: {stats['index_fullness']}")
         self.logger.info(f"Namespaces: {list(stats['namespaces'].keys())}")
         self.logger.info(f"Total Vectors: {stats['total_vector_count']}")
 
 
-    async def query_db(self, payload: Query, dense: list[float], sparse: dict[str, list]) -> list[dict]:
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: fn(*args, **kwargs))
+
+
+    async def reinit(self) -> None:
+        # Concurrent failures share a single re-initialization
+        if self._reinit_lock is None: self._reinit_lock = asyncio.Lock()
+        if self._reinit_lock.locked():
+            async with self._reinit_lock: return
+        async with self._reinit_lock:
+            self.reinits += 1
+            await self._run(self.init_db)
+
+
+    async def _query(self, vector: list[float], sparse_vector: dict[str, list]) -> list[dict]:
+        start = time.perf_counter()
         try:
-            index_desc = pinecone.describe_index(self.index_name)
-            self.logger.info(f"Querying index: {index_desc[0]}...")
-        except Exception as err:
-            self.logger.warning(f"Expired connection. Re-initializing connection to Pinecone DB...")
-            self.init_db()
-        
-        # classify query as either question or search term
-        class_ = await zero_shot_classify(payload)
+            result = await self._run(
+                self.index.query,
+                top_k = settings.top_k,
+                vector = vector,
+                sparse_vector = sparse_vector,
+                namespace=settings.pinecone_namespace,
+                include_metadata=True
+            )
+        except Exception:
+            self.errors += 1
+            UPSTREAM_ERRORS.labels("pinecone").inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.calls += 1
+            self.latencies.append(elapsed)
+            record("pinecone", elapsed)
+        return result['matches']
+
+
+    async def query_db(self, payload: Query, dense: list[float], sparse: dict[str, list], class_: str) -> list[dict]:
+        self.start_monitor()
+        # class_ is the query's classification as either question or search term
         vector, sparse_vector = dense, sparse
         if settings.hybrid_scale:
             # if search term, then conduct scaled sparse vector similarity search using an alpha value closer to 0
@@ -50,12 +121,65 @@ class PineconeDB():
             else:
                 self.logger.info(f"Conducting scaled dense vector search using alpha = {settings.dense_alpha_value}")
                 vector, sparse_vector = hybrid_convex_scale(dense, sparse, alpha=settings.dense_alpha_value)
-  
-        result = self.index.query(
-            top_k = settings.top_k,
-            vector = vector,
-            sparse_vector = sparse_vector,
-            namespace=settings.pinecone_namespace,
-            include_metadata=True
-        )
-        return result['matches']
+
+        try:
+            return await self._query(vector, sparse_vector)
+        except Exception as err:
+            # a failed query is how an expired connection shows up; re-initialize and retry once
+            self.logger.warning(f"Pinecone query failed ({err}). Re-initializing connection to Pinecone DB...")
+            await self.reinit()
+            return await self._query(vector, sparse_vector)
+
+
+    def start_monitor(self) -> None:
+        # Must be called from a running event loop; startup() runs outside of one in AWS mode
+        if self._monitor_task is None or self._monitor_task.done():
+            self._monitor_task = asyncio.create_task(self._monitor())
+
+
+    async def stop_monitor(self) -> None:
+        if self._monitor_task is None: return
+        self._monitor_task.cancel()
+        try:
+            await self._monitor_task
+        except asyncio.CancelledError:
+            pass
+        self._monitor_task = None
+
+
+    async def _monitor(self) -> None:
+        # Periodic health check; on failure re-initialize with jittered exponential backoff
+        failures = 0
+        while True:
+            if failures:
+                delay = min(settings.pinecone_backoff_base * 2 ** (failures - 1), settings.pinecone_backoff_max)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            else:
+                await asyncio.sleep(settings.pinecone_health_interval)
+            try:
+                if failures: await self.reinit()
+                else:
+                    # histogram only: the monitor task outlives the request that started it
+                    with STAGE_SECONDS.labels("pinecone_describe").time(): await self._run(self.index.describe_index_stats)
+                failures = 0
+                self.healthy = True
+            except Exception as err:
+                failures += 1
+                self.healthy = False
+                self.logger.warning(f"Pinecone health check failed {failures} time(s): {err}")
+
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "healthy": self.healthy,
+            "calls": self.calls,
+            "errors": self.errors,
+            "reinits": self.reinits,
+            "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+            "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000 if latencies else None
+        }
+
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
@@ -4,6 +4,9 @@ from datetime import date
 class Query(BaseModel):
     text: str
 
+class QueryBatch(BaseModel):
+    queries: list[Query]
+
 class Message(BaseModel):
     text: str
 
@@ -20,6 +23,27 @@ class Passage(BaseModel):
     content: str
     score: float
 
+class EpisodeInfo(BaseModel):
+    title: str
+    video_description: str
+    video_tags: list
+    published: str
+    thumbnail: HttpUrl
+
+class Clip(BaseModel):
+    # A Passage without the fields it shares with its episode
+    video_id: str
+    start: str
+    end: str
+    clip_url: HttpUrl
+    content: str
+    score: float
+
+class SearchResult(BaseModel):
+    query: str
+    episodes: dict[str, EpisodeInfo]
+    passages: list[Clip]
+
 class Completion(BaseModel):
     completion: str
     passages: list[Passage]
\ No newline at end of file
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import unicodedata
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable
+from typing import Any
+
+from config import settings
+
+logger = logging.getLogger(settings.logger_name)
+
+def flight_key(text: str) -> str:
+    # Requests coalesce only if they would be answered the same way. Unlike cache.normalize_key this
+    # keeps punctuation: the query classifier reads a trailing "?", and its label sets the hybrid alpha
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+class SingleFlight:
+    # Concurrent calls with the same key share one in-flight execution and its result
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            self.leaders += 1
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.followers += 1
+        # one caller going away must not cancel the work the others are waiting on
+        return await asyncio.shield(future)
+
+class RedisSingleFlight:
+    # Cross-instance variant: the instance holding the Redis lock computes, the others poll
+    # `lookup` (e.g. the shared cache) until the result shows up or the lock is released
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, redis_client, prefix: str, lock_ttl_ms: int, poll_ms: float) -> None:
+        self.redis = redis_client
+        self.prefix = prefix
+        self.lock_ttl_ms = lock_ttl_ms
+        self.poll = poll_ms / 1000
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]], lookup: Callable[[], Awaitable[Any]]) -> Any:
+        lock, token = self.prefix + key, uuid.uuid4().hex
+        if await self.redis.set(lock, token, nx=True, px=self.lock_ttl_ms):
+            self.leaders += 1
+            try:
+                return await compute()
+            finally:
+                await self.redis.eval(self._RELEASE, 1, lock, token)
+        self.followers += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl_ms / 1000
+        while loop.time() < deadline:
+            await asyncio.sleep(self.poll)
+            result = await lookup()
+            if result is not None: return result
+            if not await self.redis.exists(lock): break
+        # the leader failed or is too slow; compute it here
+        return await compute()
+
+class Broadcast:
+    # Fans one source stream out to any number of subscribers. Late subscribers first replay
+    # what they missed. The source is cancelled once every subscriber has gone away.
+    def __init__(self, source: AsyncIterator) -> None:
+        self.items: list = []
+        self.done = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _pump(self, source: AsyncIterator) -> None:
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator:
+        self.subscribers += 1
+        sent = 0
+        try:
+            while True:
+                changed = self._changed
+                while sent < len(self.items):
+                    yield self.items[sent]
+                    sent += 1
+                if self.done: return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done: self.task.cancel()
+
+class Broadcaster:
+    # Registry of in-flight broadcasts keyed on the normalized query
+    def __init__(self) -> None:
+        self._broadcasts: dict[Hashable, Broadcast] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def stream(self, key: Hashable, source: Callable[[], AsyncIterator]) -> AsyncIterator:
+        broadcast = self._broadcasts.get(key)
+        if broadcast is None or broadcast.done:
+            self.leaders += 1
+            broadcast = Broadcast(source())
+            self._broadcasts[key] = broadcast
+            broadcast.task.add_done_callback(lambda _: self._finished(key, broadcast))
+        else:
+            self.followers += 1
+        return broadcast.subscribe()
+
+    def _finished(self, key: Hashable, broadcast: Broadcast) -> None:
+        if self._broadcasts.get(key) is broadcast: del self._broadcasts[key]
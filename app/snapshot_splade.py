@@ -0,0 +1,27 @@
+# Serialize the SPLADE query encoder so cold starts skip resolving and loading it from the
+# Hugging Face hub. Run at image build time: python snapshot_splade.py [--engine quantized|onnx]
+import argparse
+import torch
+
+from config import settings
+from startup import snapshot_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot the SPLADE encoder for fast loading")
+    parser.add_argument("--engine", choices=["torch", "quantized", "onnx"], default=settings.splade_engine)
+    parser.add_argument("--out", help="defaults to the path load_splade reads for the engine")
+    parser.add_argument("--no-quantize", action="store_true", help="keep fp32 weights in the ONNX export")
+    args = parser.parse_args()
+    if args.engine == "onnx":
+        from splade_engines import export_onnx
+        out = export_onnx(args.out or settings.splade_onnx_path, quantize=not args.no_quantize)
+    else:
+        if args.engine == "quantized":
+            from splade_engines import QuantizedSpladeEncoder
+            encoder = QuantizedSpladeEncoder()
+        else:
+            from pinecone_text.sparse import SpladeEncoder
+            encoder = SpladeEncoder(device="cpu")
+        out = args.out or snapshot_path(args.engine)
+        torch.save(encoder, out)
+    print(f"Saved {args.engine} SPLADE snapshot to", out)
@@ -0,0 +1,93 @@
+import os
+import numpy as np
+
+# Alternative CPU engines for SPLADE query encoding. Both produce the same {"indices", "values"}
+# sparse vectors as pinecone_text's SpladeEncoder, and mask padding so batched and single
+# encodings agree.
+SPLADE_MODEL = "naver/splade-cocondenser-ensembledistil"
+ONNX_MODEL = "model.onnx"
+
+def _sparse(pooled: np.ndarray) -> list[dict[str, list]]:
+    output = []
+    for row in pooled:
+        indices = np.flatnonzero(row > 0)
+        output.append({"indices": indices.tolist(), "values": row[indices].tolist()})
+    return output
+
+class QuantizedSpladeEncoder:
+    # Same model with its Linear layers dynamically quantized to int8
+    def __init__(self, model: str = SPLADE_MODEL, max_seq_length: int = 256) -> None:
+        import torch
+        from transformers import AutoTokenizer, AutoModelForMaskedLM
+        self.tokenizer = AutoTokenizer.from_pretrained(model)
+        fp32 = AutoModelForMaskedLM.from_pretrained(model).eval()
+        self.model = torch.quantization.quantize_dynamic(fp32, {torch.nn.Linear}, dtype=torch.qint8)
+        self.max_seq_length = max_seq_length
+
+    def encode_queries(self, texts: str | list[str]) -> dict[str, list] | list[dict[str, list]]:
+        import torch
+        inputs = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=self.max_seq_length)
+        with torch.no_grad():
+            logits = self.model(**inputs).logits
+        pooled = torch.max(torch.log1p(torch.relu(logits)) * inputs["attention_mask"].unsqueeze(-1), dim=1).values
+        output = _sparse(pooled.numpy())
+        return output[0] if isinstance(texts, str) else output
+
+class OnnxSpladeEncoder:
+    # ONNX Runtime export of the model with SPLADE pooling inside the graph, so only the
+    # pooled vocabulary vector (not per-token logits) leaves the session
+    def __init__(self, path: str, max_seq_length: int = 256, threads: int = 0) -> None:
+        import onnxruntime
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(os.path.join(path, ONNX_MODEL), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.max_seq_length = max_seq_length
+
+    def encode_queries(self, texts: str | list[str]) -> dict[str, list] | list[dict[str, list]]:
+        inputs = self.tokenizer(texts, return_tensors="np", padding=True, truncation=True, max_length=self.max_seq_length)
+        feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.input_names}
+        pooled, = self.session.run(None, feed)
+        output = _sparse(pooled)
+        return output[0] if isinstance(texts, str) else output
+
+def export_onnx(path: str, model: str = SPLADE_MODEL, quantize: bool = True) -> str:
+    # Export the SPLADE model with pooling to path/model.onnx, optionally int8-quantizing its weights
+    import torch
+    from transformers import AutoTokenizer, AutoModelForMaskedLM
+
+    class Pooled(torch.nn.Module):
+        def __init__(self, mlm) -> None:
+            super().__init__()
+            self.mlm = mlm
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            logits = self.mlm(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids).logits
+            return torch.max(torch.log1p(torch.relu(logits)) * attention_mask.unsqueeze(-1), dim=1).values
+
+    os.makedirs(path, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model)
+    tokenizer.save_pretrained(path)
+    module = Pooled(AutoModelForMaskedLM.from_pretrained(model).eval())
+    sample = tokenizer(["does alcohol affect testosterone?"], return_tensors="pt")
+    out = os.path.join(path, ONNX_MODEL)
+    axes = {0: "batch", 1: "sequence"}
+    torch.onnx.export(
+        module,
+        (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+        out,
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["pooled"],
+        dynamic_axes={"input_ids": axes, "attention_mask": axes, "token_type_ids": axes, "pooled": {0: "batch"}},
+        opset_version=14
+    )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        fp32 = out + ".fp32"
+        os.replace(out, fp32)
+        quantize_dynamic(fp32, out, weight_type=QuantType.QInt8)
+        os.remove(fp32)
+    return out
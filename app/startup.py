@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from config import settings
+
+logger = logging.getLogger(settings.logger_name)
+
+class Timeline:
+    # Wall-clock time each startup component took, measured from process start-up
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.components: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.components[name] = {
+                    "start_ms": round((start - self.start) * 1000, 1),
+                    "duration_ms": round((end - start) * 1000, 1)
+                }
+
+    def timed(self, name: str, fn, *args, **kwargs):
+        with self.measure(name):
+            return fn(*args, **kwargs)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "elapsed_ms": round((time.perf_counter() - self.start) * 1000, 1),
+                "components": dict(self.components)
+            }
+
+    def log(self, event: str) -> None:
+        logger.info(json.dumps({"event": event, **self.as_dict()}))
+
+def snapshot_path(engine: str) -> str:
+    # Each engine has its own snapshot, so one baked for another engine is never picked up
+    return settings.splade_quantized_snapshot_path if engine == "quantized" else settings.splade_snapshot_path
+
+def load_splade():
+    # torch and transformers are only imported here, off the import path of main
+    if settings.splade_engine == "onnx":
+        from splade_engines import OnnxSpladeEncoder
+        logger.info(f"Loading SPLADE ONNX engine from {settings.splade_onnx_path}...")
+        return OnnxSpladeEncoder(settings.splade_onnx_path)
+    import torch
+    path = snapshot_path(settings.splade_engine)
+    if path and os.path.exists(path):
+        logger.info(f"Loading SPLADE snapshot from {path}...")
+        return torch.load(path, weights_only=False)
+    if settings.splade_engine == "quantized":
+        from splade_engines import QuantizedSpladeEncoder
+        return QuantizedSpladeEncoder()
+    from pinecone_text.sparse import SpladeEncoder
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    return SpladeEncoder(device=device)
+
+class LazySplade:
+    # Stands in for the SPLADE encoder until the model is loaded, either by warm() in a
+    # background thread or by the first encode_queries call, whichever comes first
+    def __init__(self, timeline: Timeline, loader=None) -> None:
+        self.timeline = timeline
+        self.loader = loader or load_splade
+        self.ready = threading.Event()
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._encoder is None:
+                with self.timeline.measure("splade"):
+                    self._encoder = self.loader()
+                self.ready.set()
+                self.timeline.log("splade_loaded")
+        return self._encoder
+
+    def warm(self) -> None:
+        threading.Thread(target=self.load, name="splade-warm", daemon=True).start()
+
+    def encode_queries(self, texts):
+        encoder = self._encoder or self.load()
+        return encoder.encode_queries(texts)
@@ -0,0 +1,111 @@
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from prometheus_client import Counter, Histogram
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+
+logger = logging.getLogger(settings.logger_name)
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+REQUEST_SECONDS = Histogram("hubermangpt_request_seconds", "Request duration, including the whole SSE stream", ["path", "status"], buckets=LATENCY_BUCKETS)
+STAGE_SECONDS = Histogram("hubermangpt_stage_seconds", "Duration of each stage of a request", ["stage"], buckets=LATENCY_BUCKETS)
+CACHE_LOOKUPS = Counter("hubermangpt_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+UPSTREAM_ERRORS = Counter("hubermangpt_upstream_errors_total", "Failed or timed out upstream calls", ["upstream"])
+UPSTREAM_SECONDS = Histogram("hubermangpt_upstream_seconds", "Duration of each upstream call attempt (to the headers for streams)", ["upstream"], buckets=LATENCY_BUCKETS)
+UPSTREAM_REQUESTS = Counter("hubermangpt_upstream_requests_total", "Upstream call attempts by outcome (status class or transport error)", ["upstream", "outcome"])
+UPSTREAM_RETRIES = Counter("hubermangpt_upstream_retries_total", "Upstream calls retried after an error, 429 or 5xx", ["upstream"])
+UPSTREAM_HEDGES = Counter("hubermangpt_upstream_hedges_total", "Hedged upstream calls sent, and those that answered first", ["upstream", "result"])
+TOKENS_STREAMED = Counter("hubermangpt_tokens_streamed_total", "GPT completion deltas relayed to clients")
+
+class Trace:
+    # Stage durations of one request, in the order they finished
+    __slots__ = ("start", "spans")
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.spans: list[tuple[str, float]] = []
+
+    def server_timing(self) -> str:
+        totals: dict[str, float] = {}
+        for stage, seconds in self.spans: totals[stage] = totals.get(stage, 0.0) + seconds
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+# Tasks spawned by a request copy this context, so concurrent stages record into the same Trace
+_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+
+_stage_histograms: dict = {}
+
+def record(stage: str, seconds: float) -> None:
+    # labels() takes a lock on every call, so keep each stage's child
+    histogram = _stage_histograms.get(stage)
+    if histogram is None: histogram = _stage_histograms[stage] = STAGE_SECONDS.labels(stage)
+    histogram.observe(seconds)
+    trace = _trace.get()
+    if trace is not None: trace.spans.append((stage, seconds))
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+def traced(stage: str):
+    # Decorator form of span() for coroutine functions
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(stage):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class MetricsMiddleware:
+    # Pure ASGI middleware: starts a Trace per request, sends the stages finished before the
+    # response started as a Server-Timing header, and records the request once it has ended
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+        trace = Trace()
+        token = _trace.set(trace)
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace.spans:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _trace.reset(token)
+            elapsed = time.perf_counter() - trace.start
+            # unmatched paths share one label so scanners can't grow the series count
+            path = scope["path"] if status != 404 else "unmatched"
+            REQUEST_SECONDS.labels(path, str(status)).observe(elapsed)
+            if elapsed * 1000 >= settings.slow_request_ms and random.random() < settings.slow_request_sample_rate:
+                logger.warning(json.dumps({
+                    "event": "slow_request",
+                    "path": scope["path"],
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "stages": [{"stage": stage, "duration_ms": round(seconds * 1000, 1)} for stage, seconds in trace.spans]
+                }))
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager
+
+import httpx
+
+from config import settings
+from tracing import UPSTREAM_HEDGES, UPSTREAM_REQUESTS, UPSTREAM_RETRIES, UPSTREAM_SECONDS
+
+logger = logging.getLogger(settings.logger_name)
+
+# Statuses worth another attempt: rate limiting and server-side failures
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+class RetryBudget:
+    # Extra attempts are paid for by first attempts: each deposits `ratio` of a token and each extra
+    # attempt withdraws one, so an upstream outage can't multiply our traffic by the retry count.
+    # Retries and hedges each have their own budget, so hedging never starves retries.
+    def __init__(self, ratio: float, burst: int) -> None:
+        self.ratio = ratio
+        self.burst = float(burst)
+        self.balance = float(burst)
+
+    def deposit(self) -> None:
+        self.balance = min(self.burst, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.balance < 1.0: return False
+        self.balance -= 1.0
+        return True
+
+class LatencyTracker:
+    # Recent successful call latencies; the hedge delay is their `quantile`, recomputed every 16 samples.
+    # Samples slower than `outlier` times the median are left out: they are the tail hedging should cut,
+    # and counting them would drag the delay up to the spike latency itself.
+    def __init__(self, window: int, quantile: float, min_samples: int, outlier: float = 4.0) -> None:
+        self.samples = deque(maxlen=window)
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.outlier = outlier
+        self._added = 0
+        self._cached: float | None = None
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self._added += 1
+        if self._added % 16 == 0: self._cached = None
+
+    def value(self) -> float | None:
+        if len(self.samples) < self.min_samples: return None
+        if self._cached is None:
+            ordered = sorted(self.samples)
+            limit = ordered[len(ordered) // 2] * self.outlier
+            ordered = [s for s in ordered if s <= limit]
+            self._cached = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+        return self._cached
+
+class Upstream:
+    """
+    An httpx.AsyncClient for one upstream service, with tuned pool limits, jittered retries bounded
+    by a retry budget and, for idempotent calls, hedging: when the first attempt hasn't answered
+    after a high quantile of the upstream's recent latency a duplicate is sent and the first good
+    answer wins. Hedges draw on a budget of their own.
+    """
+    def __init__(self, name: str, timeout: float, *, http2: bool = True, max_connections: int = 100,
+                 max_keepalive: int = 20, keepalive_expiry: float = 30.0, retries: int = 2,
+                 backoff_ms: float = 100.0, backoff_max_ms: float = 2000.0, budget_ratio: float = 0.1,
+                 budget_burst: int = 10, hedge: bool = True, hedge_quantile: float = 0.9,
+                 hedge_outlier: float = 4.0, hedge_budget_ratio: float = 0.2, hedge_budget_burst: int = 10,
+                 hedge_min_ms: float = 20.0, hedge_window: int = 256, hedge_min_samples: int = 32) -> None:
+        self.name = name
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            http2=http2,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                keepalive_expiry=keepalive_expiry)
+        )
+        self.retries = retries
+        self.backoff = backoff_ms / 1000
+        self.backoff_max = backoff_max_ms / 1000
+        self.budget = RetryBudget(budget_ratio, budget_burst)
+        self.hedging = hedge
+        self.hedge_budget = RetryBudget(hedge_budget_ratio, hedge_budget_burst)
+        self.hedge_min = hedge_min_ms / 1000
+        self.latency = LatencyTracker(hedge_window, hedge_quantile, hedge_min_samples, hedge_outlier)
+        self.requests = self.retried = self.hedged = self.hedge_wins = 0
+        self._seconds = UPSTREAM_SECONDS.labels(name)
+        self._retries = UPSTREAM_RETRIES.labels(name)
+
+    def _observe(self, start: float, outcome: str) -> None:
+        self._seconds.observe(time.perf_counter() - start)
+        UPSTREAM_REQUESTS.labels(self.name, outcome).inc()
+
+    @staticmethod
+    def _outcome(response: httpx.Response) -> str:
+        return f"{response.status_code // 100}xx"
+
+    async def _send(self, method: str, url: str, kwargs: dict) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.TransportError as err:
+            self._observe(start, type(err).__name__)
+            raise
+        self._observe(start, self._outcome(response))
+        if response.status_code not in RETRY_STATUSES: self.latency.add(time.perf_counter() - start)
+        return response
+
+    async def _send_stream(self, method: str, url: str, kwargs: dict) -> httpx.Response:
+        # Times the call up to the response headers; the body is read by the caller
+        start = time.perf_counter()
+        try:
+            response = await self.client.send(self.client.build_request(method, url, **kwargs), stream=True)
+        except httpx.TransportError as err:
+            self._observe(start, type(err).__name__)
+            raise
+        self._observe(start, self._outcome(response))
+        return response
+
+    def hedge_delay(self) -> float | None:
+        quantile = self.latency.value()
+        return None if quantile is None else max(quantile, self.hedge_min)
+
+    async def _hedged(self, method: str, url: str, kwargs: dict) -> httpx.Response:
+        self.hedge_budget.deposit()
+        primary = asyncio.ensure_future(self._send(method, url, kwargs))
+        tasks = [primary]
+        try:
+            delay = self.hedge_delay()
+            if delay is None: return await primary
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self.hedge_budget.withdraw(): return await primary
+            self.hedged += 1
+            UPSTREAM_HEDGES.labels(self.name, "sent").inc()
+            tasks.append(asyncio.ensure_future(self._send(method, url, kwargs)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in RETRY_STATUSES:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                            UPSTREAM_HEDGES.labels(self.name, "won").inc()
+                        return task.result()
+            # both attempts failed: surface the first one's outcome to the retry loop
+            return primary.result()
+        finally:
+            for task in tasks: task.cancel()
+
+    def _backoff_delay(self, attempt: int, response: httpx.Response | None) -> float:
+        # Full jitter, but never sooner than a 429's Retry-After (within backoff_max)
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt - 1)))
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after is not None:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    async def _retrying(self, attempt: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        self.requests += 1
+        self.budget.deposit()
+        attempts = 0
+        while True:
+            response, error = None, None
+            try:
+                response = await attempt()
+                if response.status_code not in RETRY_STATUSES: return response
+            except httpx.TransportError as err:
+                error = err
+            if attempts >= self.retries or not self.budget.withdraw():
+                if error is not None: raise error
+                return response
+            attempts += 1
+            self.retried += 1
+            self._retries.inc()
+            delay = self._backoff_delay(attempts, response)
+            logger.info(f"Retrying {self.name} after {error or response.status_code} ({attempts}/{self.retries}) in {delay * 1000:.0f}ms")
+            if response is not None: await response.aclose()
+            await asyncio.sleep(delay)
+
+    async def post(self, url: str, *, hedge: bool = False, **kwargs) -> httpx.Response:
+        """POST with retries; hedge=True also hedges the call, for idempotent requests only."""
+        if hedge and self.hedging: return await self._retrying(lambda: self._hedged("POST", url, kwargs))
+        return await self._retrying(lambda: self._send("POST", url, kwargs))
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """Like httpx.AsyncClient.stream; attempts are retried until the response headers arrive."""
+        response = await self._retrying(lambda: self._send_stream(method, url, kwargs))
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    async def warm(self, url: str, connections: int) -> None:
+        # Opens keep-alive connections (TCP + TLS) ahead of the first request; any response will do
+        async def touch() -> None:
+            try:
+                await self.client.head(url)
+            except httpx.HTTPError as err:
+                logger.warning(f"Unable to pre-warm a connection to {self.name}: {err}")
+        await asyncio.gather(*(touch() for _ in range(connections)))
+
+    def stats(self) -> dict:
+        delay = self.hedge_delay()
+        return {
+            "requests": self.requests,
+            "retries": self.retried,
+            "hedges": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": None if delay is None else round(delay * 1000, 1),
+            "retry_budget": round(self.budget.balance, 2),
+            "hedge_budget": round(self.hedge_budget.balance, 2),
+        }
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+def create_upstream(name: str, timeout: float) -> Upstream:
+    return Upstream(
+        name,
+        timeout,
+        http2=settings.upstream_http2,
+        max_connections=settings.upstream_max_connections,
+        max_keepalive=settings.upstream_max_keepalive,
+        keepalive_expiry=settings.upstream_keepalive_expiry,
+        retries=settings.upstream_retries,
+        backoff_ms=settings.upstream_backoff_ms,
+        backoff_max_ms=settings.upstream_backoff_max_ms,
+        budget_ratio=settings.upstream_retry_budget,
+        budget_burst=settings.upstream_retry_burst,
+        hedge=settings.upstream_hedge,
+        hedge_quantile=settings.upstream_hedge_quantile,
+        hedge_outlier=settings.upstream_hedge_outlier,
+        hedge_budget_ratio=settings.upstream_hedge_budget,
+        hedge_budget_burst=settings.upstream_hedge_burst,
+        hedge_min_ms=settings.upstream_hedge_min_ms,
+        hedge_window=settings.upstream_hedge_window,
+        hedge_min_samples=settings.upstream_hedge_min_samples
+    )
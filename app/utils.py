@@ -1,14 +1,17 @@
-from schemas import Passage, Message, Query
+from schemas import Passage, Message, Query, EpisodeInfo, Clip, SearchResult
 from pydantic import HttpUrl
 from globals import g
+from config import settings
+from context import pack_context
 import datetime
-import json
+import hashlib
 
 def passage(m: dict) -> Passage:
+    episode = g.episode_store.get(m['metadata']['video_id'])
     return Passage(
         video_id = m['metadata']['video_id'],
-        video_description = get_video_description(m['metadata']['video_id']),
-        video_tags = get_video_tags(m['metadata']['video_id']),
+        video_description = episode.description,
+        video_tags = episode.tags,
         start = format_timestamps(m['metadata']['start']),
         end = format_timestamps(m['metadata']['end']),
         clip_url = get_video_url(m['metadata']['video_id'], m['metadata']['start']),
@@ -19,19 +22,39 @@ def passage(m: dict) -> Passage:
         score = m['score'])
 
 def gpt_message(query: Query, passages: list[Passage]) -> Message:
-    message = f"Query: {query.text}"
+    # Overlapping chunks of an episode are merged and the best of them packed up to the token budget
+    packed = pack_context(passages, settings.context_token_budget, settings.context_merge_gap)
+    return Message(text=f"Query: {query.text}" + "".join(packed))
+
+def search_result(query: Query, passages: list[Passage]) -> SearchResult:
+    # Normalized form of the passages: episode-level fields appear once per episode
+    episodes = {}
     for p in passages:
-        next_passage = f'\n\nPassage: """Source={p.title}, Content={p.content}"""'
-        message += next_passage
-    return Message(text=message)
+        if p.video_id not in episodes:
+            episodes[p.video_id] = EpisodeInfo(
+                title = p.title,
+                video_description = p.video_description,
+                video_tags = p.video_tags,
+                published = p.published,
+                thumbnail = p.thumbnail)
+    clips = [Clip(video_id=p.video_id, start=p.start, end=p.end, clip_url=p.clip_url, content=p.content, score=p.score) for p in passages]
+    return SearchResult(query=query.text, episodes=episodes, passages=clips)
+
+def etag(body: bytes) -> str:
+    # Strong validator: the digest of the exact response bytes
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: str | None, tag: str) -> bool:
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    if not if_none_match: return False
+    candidates = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in candidates or tag in candidates
 
 def get_video_description(video_id: str) -> str:
-    res = g.supabase.table("episodes").select("description").eq("id", video_id).execute()
-    return res.data[0]["description"]
+    return g.episode_store.get(video_id).description
 
 def get_video_tags(video_id: str) -> list:
-    res = g.supabase.table("episodes").select("keywords").eq("id", video_id).execute()
-    return json.loads(res.data[0]["keywords"])
+    return g.episode_store.get(video_id).tags
 
 def format_thumbnail(video_id: str) -> HttpUrl:
     return f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"
@@ -0,0 +1,86 @@
+# Pre-compute embeddings for the most popular historical queries so cold instances serve them from cache.
+# Run after a deploy: python warmup.py --top 200
+import argparse
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from logging.config import dictConfig
+
+import redis.asyncio as redis
+
+from config import settings
+from globals import g
+from batching import SpladeBatcher
+from cache import EmbeddingCache
+from upstream import create_upstream
+from ml import ada_encode, splade_encode
+from schemas import Query
+
+dictConfig(settings.logger.dict())
+logger = logging.getLogger(settings.logger_name)
+
+def init(concurrency: int) -> None:
+    from pinecone_text.sparse import SpladeEncoder
+    redis_client = redis.Redis(
+        host = settings.redis_host,
+        port = settings.redis_port,
+        password = settings.redis_password,
+        ssl = settings.ssl
+    )
+    g.set_default("redis_client", redis_client)
+    g.set_default("embedding_cache", EmbeddingCache(
+        redis_client,
+        prefix=settings.embedding_cache_prefix,
+        local_capacity=0,
+        local_ttl=0,
+        popularity_key=settings.popularity_key,
+        base_ttl=settings.expiry_time,
+        max_ttl=settings.max_expiry_time,
+        max_entries=settings.cache_max_entries,
+        entries_key=settings.cache_entries_key,
+        evict_grace=settings.cache_evict_grace
+    ))
+    g.set_default("ada_client", create_upstream("openai_embeddings", timeout=settings.ada_timeout))
+    g.set_default("splade", SpladeEncoder(device="cpu"))
+    g.set_default("splade_executor", ThreadPoolExecutor(max_workers=settings.splade_workers))
+    g.set_default("splade_batcher", SpladeBatcher(
+        max_batch_size=settings.splade_max_batch_size,
+        max_wait_ms=settings.splade_max_wait_ms,
+        queue_depth=max(settings.splade_queue_depth, concurrency),
+        workers=settings.splade_workers
+    ))
+
+async def warm_query(text: str, frequency: float, semaphore: asyncio.Semaphore) -> bool:
+    async with semaphore:
+        dense, _ = await g.embedding_cache.get(text, track=False)
+        if dense is not None: return False
+        query = Query(text=text)
+        dense, sparse = await asyncio.gather(ada_encode(query), splade_encode(query))
+        await g.embedding_cache.set(text, dense, sparse, exp=g.embedding_cache.ttl(frequency))
+        return True
+
+async def warmup(top: int, concurrency: int) -> None:
+    init(concurrency)
+    try:
+        popular = await g.embedding_cache.popular(top)
+        semaphore = asyncio.Semaphore(concurrency)
+        results = await asyncio.gather(
+            *(warm_query(text, frequency, semaphore) for text, frequency in popular),
+            return_exceptions=True
+        )
+        warmed = sum(r is True for r in results)
+        failed = [r for r in results if isinstance(r, BaseException)]
+        for err in failed: logger.error(f"Unable to warm query: {err}")
+        logger.info(f"Warmed {warmed} of the top {len(popular)} queries ({len(failed)} failed, {len(popular) - warmed - len(failed)} already cached)")
+    finally:
+        await g.splade_batcher.stop()
+        await g.ada_client.aclose()
+        await g.redis_client.close()
+        g.splade_executor.shutdown(wait=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm the embedding cache with the most popular queries")
+    parser.add_argument("--top", type=int, default=200, help="number of most popular queries to warm")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(warmup(args.top, args.concurrency))
@@ -0,0 +1,89 @@
+# Semantic answer cache: lookup latency at capacity, hit rate on a paraphrase-heavy workload,
+# and time to the close event for a replayed answer vs. a fresh completion from a fake OpenAI server
+# Usage: python benchmarks/bench_answer_cache.py [--capacity 2048] [--questions 300] [--queries 3000]
+import argparse
+import asyncio
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from httpx import AsyncClient
+
+from config import settings
+from globals import g
+from answer_cache import AnswerCache
+from ml import gpt_complete, replay_answer
+from schemas import Message
+from fakes import FakeOpenAIStream
+
+DIM = 1536
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+def topics(rng: np.random.Generator, count: int) -> np.ndarray:
+    # Ada embeddings of unrelated questions still share a common direction (cosine ~0.75)
+    shared = unit(rng.normal(size=DIM))
+    return unit(shared + 0.58 / np.sqrt(DIM) * rng.normal(size=(count, DIM)))
+
+def paraphrase(rng: np.random.Generator, vector: np.ndarray, noise: float) -> np.ndarray:
+    return unit(vector + noise / np.sqrt(DIM) * rng.normal(size=DIM))
+
+def bench_lookup(args, rng: np.random.Generator) -> None:
+    cache = AnswerCache(capacity=args.capacity, threshold=args.threshold, ttl=3600)
+    for vector in topics(rng, args.capacity): cache.store(vector, None)
+    probes = topics(rng, 200)
+    start = time.perf_counter()
+    for probe in probes: cache.lookup(probe)
+    print(f"lookup at {args.capacity} entries: {(time.perf_counter() - start) / len(probes) * 1000:.3f} ms")
+
+def bench_hit_rate(args, rng: np.random.Generator) -> None:
+    cache = AnswerCache(capacity=args.capacity, threshold=args.threshold, ttl=3600)
+    questions = topics(rng, args.questions)
+    # Zipf-distributed popularity; every query is a fresh paraphrase of its question
+    picks = np.minimum(rng.zipf(1.3, size=args.queries), args.questions) - 1
+    wrong = 0
+    for question in picks:
+        answer = cache.lookup(paraphrase(rng, questions[question], args.noise))
+        if answer is None: cache.store(questions[question], int(question))
+        elif answer != question: wrong += 1
+    stats = cache.stats()
+    print(f"hit rate {stats['hit_rate']:.1%} over {args.queries} queries, {wrong} answered from the wrong question, "
+          f"mean lookup {stats['mean_lookup_ms']:.3f} ms")
+
+async def drain(stream) -> float:
+    start = time.perf_counter()
+    async for _ in stream: pass
+    return time.perf_counter() - start
+
+async def bench_replay(args) -> None:
+    server = await FakeOpenAIStream(tokens=args.tokens).start()
+    settings.gpt_endpoint = server.url
+    g.set_default("gpt_client", AsyncClient(timeout=60.0))
+    answers = []
+    try:
+        fresh = await drain(gpt_complete(Message(text="Query: how does light exposure affect sleep?"), [], answers.append))
+        replayed = await drain(replay_answer(answers[0]))
+        expected = "".join(f" tok{i}" for i in range(args.tokens))
+        print(f"fresh completion {fresh * 1000:.1f} ms, replayed {replayed * 1000:.3f} ms, "
+              f"assembled answer {'matches' if answers[0].completion == expected else 'DOES NOT MATCH'} the stream")
+    finally:
+        await g.gpt_client.aclose()
+        await server.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--capacity", type=int, default=2048)
+    parser.add_argument("--threshold", type=float, default=settings.answer_cache_threshold)
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=3000)
+    parser.add_argument("--noise", type=float, default=0.2, help="paraphrase noise relative to the vector norm")
+    parser.add_argument("--tokens", type=int, default=400)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    bench_lookup(args, rng)
+    bench_hit_rate(args, rng)
+    asyncio.run(bench_replay(args))
@@ -0,0 +1,57 @@
+# Throughput of /query/batch and /search/batch against the one-at-a-time /query loop an evaluation
+# script would run, on the offline stack from loadtest.py, with the upstream calls each approach makes
+# Usage: python benchmarks/bench_batch.py [--queries 100] [--profile profile.json]
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import add_serve_arguments, make_queries, one_query, serve
+
+async def upstream_calls(client: httpx.AsyncClient, upstreams: str) -> dict:
+    return {name: stats["calls"] for name, stats in (await client.get(f"{upstreams}/stats")).json().items()}
+
+async def measure(client: httpx.AsyncClient, upstreams: str, name: str, run) -> None:
+    before = await upstream_calls(client, upstreams)
+    start = time.perf_counter()
+    results = await run()
+    elapsed = time.perf_counter() - start
+    after = await upstream_calls(client, upstreams)
+    calls = ", ".join(f"{k}={after[k] - before[k]}" for k in after if after[k] != before[k])
+    print(f"{name:13s} {len(results) / elapsed:7.2f} queries/s  ({elapsed:6.1f} s, {sum(results)} ok)  upstream calls: {calls}")
+
+async def loop(base_url: str, queries: list[str]) -> list[bool]:
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+        return [(await one_query(client, text))["ok"] for text in queries]
+
+async def batch(base_url: str, path: str, queries: list[str]) -> list[bool]:
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=600.0) as client:
+        async with client.stream("POST", path, json={"queries": [{"text": q} for q in queries]}) as response:
+            async for line in response.aiter_lines():
+                if not line: continue
+                result = json.loads(line)
+                assert result["query"] == queries[result["index"]] and result["index"] == len(results), "out of order"
+                results.append("error" not in result)
+    return results
+
+async def main(args) -> None:
+    async with serve(args) as (base_url, upstreams):
+        rng = random.Random(args.seed)
+        async with httpx.AsyncClient() as client:
+            await measure(client, upstreams, "/query loop", lambda: loop(base_url, make_queries(args.queries, 0.0, rng)))
+            await measure(client, upstreams, "/query/batch", lambda: batch(base_url, "/query/batch", make_queries(args.queries, 0.0, rng)))
+            await measure(client, upstreams, "/search/batch", lambda: batch(base_url, "/search/batch", make_queries(args.queries, 0.0, rng)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=100)
+    add_serve_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
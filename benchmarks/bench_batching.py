@@ -0,0 +1,78 @@
+# Throughput vs. latency of SPLADE query encoding at 1/8/32 concurrent clients,
+# one executor call per query vs. the micro-batching SpladeBatcher
+# Usage: python benchmarks/bench_batching.py [--real] [--requests 20]
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from batching import SpladeBatcher
+from config import settings
+from globals import g
+
+class FakeSplade:
+    # Cost model of a CPU forward pass: fixed overhead plus a smaller per-sentence cost
+    def __init__(self, base_ms: float, item_ms: float) -> None:
+        self.base = base_ms / 1000
+        self.item = item_ms / 1000
+
+    def encode_queries(self, texts):
+        batch = texts if isinstance(texts, list) else [texts]
+        time.sleep(self.base + self.item * len(batch))
+        vectors = [{"indices": [1, 2], "values": [0.5, 0.5]} for _ in batch]
+        return vectors if isinstance(texts, list) else vectors[0]
+
+async def unbatched(text: str) -> dict:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(g.splade_executor, g.splade.encode_queries, text)
+
+async def client(encode, requests: int, latencies: list[float]) -> None:
+    for i in range(requests):
+        start = time.perf_counter()
+        await encode(f"how does caffeine affect sleep {i}")
+        latencies.append(time.perf_counter() - start)
+
+async def run(encode, clients: int, requests: int) -> dict:
+    latencies: list[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(encode, requests, latencies) for _ in range(clients)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / wall,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(0.99 * (len(latencies) - 1))] * 1000
+    }
+
+async def main(args) -> None:
+    if args.real:
+        from pinecone_text.sparse import SpladeEncoder
+        g.set_default("splade", SpladeEncoder(device="cpu"))
+    else:
+        g.set_default("splade", FakeSplade(args.base_ms, args.item_ms))
+    g.set_default("splade_executor", ThreadPoolExecutor(max_workers=settings.splade_workers))
+    for clients in (1, 8, 32):
+        batcher = SpladeBatcher(
+            max_batch_size=settings.splade_max_batch_size,
+            max_wait_ms=settings.splade_max_wait_ms,
+            queue_depth=settings.splade_queue_depth,
+            workers=settings.splade_workers
+        )
+        for name, encode in (("unbatched", unbatched), ("batched", batcher.encode)):
+            r = await run(encode, clients, args.requests)
+            print(f"{name:10s} clients={clients:3d} {r['throughput']:8.1f} q/s  p50={r['p50']:8.1f} ms  p99={r['p99']:8.1f} ms")
+        print(f"{'':10s} batcher stats: {batcher.stats()}")
+        await batcher.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--real", action="store_true", help="use the real SpladeEncoder on CPU")
+    parser.add_argument("--requests", type=int, default=20, help="sequential requests per client")
+    parser.add_argument("--base-ms", type=float, default=30.0)
+    parser.add_argument("--item-ms", type=float, default=4.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,62 @@
+# Memory per entry and hit-path latency of the embedding cache: legacy JSON blob vs. the binary format and local tier
+# Usage: python benchmarks/bench_cache.py [--rtt-ms 1.5] [--iterations 2000]
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from cache import LocalCache, decode_arrays, decode_embeddings, encode_embeddings, to_lists
+
+def sample_entry(nnz: int = 120) -> tuple[list[float], dict[str, list]]:
+    dense = [random.uniform(-0.1, 0.1) for _ in range(1536)]
+    indices = sorted(random.sample(range(30522), nnz))
+    return dense, {"indices": indices, "values": [random.uniform(0, 3) for _ in indices]}
+
+def legacy_hit(raw: str):
+    # old get_cache: exists + get round trips, then the payload parsed twice
+    return json.loads(raw)["dense"], json.loads(raw)["sparse"]
+
+def timed(fn, arg, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations): fn(arg)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def local_entry_bytes(entries: list, decode) -> float:
+    cache = LocalCache(capacity=len(entries), ttl=3600)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i, raw in enumerate(entries): cache.set(str(i), decode(raw))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(s.size_diff for s in after.compare_to(before, "filename")) / len(entries)
+
+def main(args) -> None:
+    dense, sparse = sample_entry()
+    legacy_raw = json.dumps({"dense": dense, "sparse": sparse})
+    binary_raw = encode_embeddings(dense, sparse)
+    cache = LocalCache(capacity=16, ttl=3600)
+    cache.set("q", decode_arrays(binary_raw))
+    rtt = args.rtt_ms * 1000
+
+    legacy_us = timed(legacy_hit, legacy_raw, args.iterations)
+    binary_us = timed(decode_embeddings, binary_raw, args.iterations)
+    local_us = timed(lambda key: to_lists(cache.get(key)), "q", args.iterations)
+    print(f"{'format':8s} {'payload':>10s} {'decode':>12s} {'hit path (incl. RTTs)':>24s}")
+    print(f"{'json':8s} {len(legacy_raw):>8d} B {legacy_us:>9.1f} us {legacy_us + 2 * rtt:>21.1f} us")
+    print(f"{'binary':8s} {len(binary_raw):>8d} B {binary_us:>9.1f} us {binary_us + rtt:>21.1f} us")
+    print(f"{'local':8s} {'-':>10s} {'-':>12s} {local_us:>21.1f} us")
+
+    entries = [encode_embeddings(*sample_entry()) for _ in range(200)]
+    lists, arrays = local_entry_bytes(entries, decode_embeddings), local_entry_bytes(entries, decode_arrays)
+    print(f"local tier memory per entry: {lists / 1024:.1f} KiB as lists, {arrays / 1024:.1f} KiB as arrays ({lists / arrays:.1f}x the entries per MiB)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt-ms", type=float, default=1.5, help="Redis round-trip time to add per network call")
+    parser.add_argument("--iterations", type=int, default=2000)
+    main(parser.parse_args())
@@ -0,0 +1,69 @@
+# Upstream call counts and latency under bursts of identical queries, with and without
+# single-flight retrieval and GPT stream fan-out
+# Usage: python benchmarks/bench_coalesce.py [--burst 50] [--distinct 3]
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from singleflight import SingleFlight, Broadcaster, flight_key
+
+class Upstreams:
+    # Counts calls to each stage of the /query pipeline, with representative latencies
+    def __init__(self) -> None:
+        self.calls = {"ada": 0, "splade": 0, "classify": 0, "pinecone": 0, "gpt": 0}
+
+    async def retrieve(self, text: str) -> list[str]:
+        for stage in ("ada", "splade", "classify", "pinecone"):
+            self.calls[stage] += 1
+        # Ada, SPLADE and classification run concurrently, then Pinecone
+        await asyncio.sleep(0.08 + 0.06)
+        return [f"passage for {text}"]
+
+    async def gpt(self, tokens: int = 50):
+        self.calls["gpt"] += 1
+        await asyncio.sleep(0.3)
+        for i in range(tokens):
+            await asyncio.sleep(0.01)
+            yield f"tok{i}".encode()
+
+async def request(upstreams: Upstreams, text: str, flights, broadcaster) -> tuple[float, int]:
+    start = time.perf_counter()
+    if flights is None:
+        await upstreams.retrieve(text)
+        stream = upstreams.gpt()
+    else:
+        key = flight_key(text)
+        await flights.do(key, lambda: upstreams.retrieve(text))
+        stream = broadcaster.stream(key, upstreams.gpt)
+    chunks = 0
+    async for _ in stream: chunks += 1
+    return time.perf_counter() - start, chunks
+
+async def burst(coalesce: bool, size: int, distinct: int) -> None:
+    upstreams = Upstreams()
+    flights, broadcaster = (SingleFlight(), Broadcaster()) if coalesce else (None, None)
+    texts = [f"How does caffeine affect sleep? #{i % distinct}" for i in range(size)]
+    tasks = []
+    for text in texts:
+        tasks.append(asyncio.create_task(request(upstreams, text.replace(" ", "  ").upper() if len(tasks) % 2 else text, flights, broadcaster)))
+        await asyncio.sleep(0.002)   # requests trickle in over the burst
+    results = await asyncio.gather(*tasks)
+    latencies = sorted(r[0] for r in results)
+    assert all(r[1] == results[0][1] for r in results), "every client must receive the full stream"
+    print(f"{'coalesced' if coalesce else 'baseline':10s} requests={size} upstream calls={upstreams.calls} "
+          f"p50={statistics.median(latencies) * 1000:.0f} ms max={latencies[-1] * 1000:.0f} ms")
+
+async def main(args) -> None:
+    for coalesce in (False, True):
+        await burst(coalesce, args.burst, args.distinct)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--distinct", type=int, default=3, help="number of distinct questions in the burst")
+    asyncio.run(main(parser.parse_args()))
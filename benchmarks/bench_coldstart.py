@@ -0,0 +1,75 @@
+# Cold-start profile: module import time of the app and time to the first healthcheck, readiness and /query
+# Usage: python benchmarks/bench_coldstart.py [--runs 3] [--serve] [--query "does alcohol affect testosterone?"]
+# --serve starts uvicorn against the services configured in the environment
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+# import everything main imports, without running create_app()/startup()
+IMPORTS = "import config, globals, schemas, utils, ml, cache, batching, episodes, startup, pinecone_db"
+
+def import_time(runs: int) -> None:
+    totals = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", IMPORTS], cwd=APP_DIR, check=True)
+        totals.append(time.perf_counter() - start)
+    print(f"interpreter + app imports: median {statistics.median(totals) * 1000:.0f} ms over {runs} runs")
+    # heaviest modules by cumulative import time
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORTS], cwd=APP_DIR, capture_output=True, text=True).stderr
+    rows = []
+    for line in out.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+        if m and len(m.group(2)) <= 2: rows.append((int(m.group(1)), m.group(3)))
+    for us, name in sorted(rows, reverse=True)[:10]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+    torch_loaded = subprocess.run([sys.executable, "-c", IMPORTS + "; import sys; print('torch' in sys.modules)"], cwd=APP_DIR, capture_output=True, text=True).stdout.strip()
+    print(f"torch imported at startup: {torch_loaded}")
+
+def wait_for(client: httpx.Client, url: str, status: int = 200, timeout: float = 120.0) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if client.get(url).status_code == status: return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    raise TimeoutError(url)
+
+def serve(port: int, query: str) -> None:
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "--port", str(port), "main:app"], cwd=APP_DIR)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        with httpx.Client(timeout=60.0) as client:
+            live = wait_for(client, base + "/")
+            print(f"first healthcheck:  {(live - start) * 1000:8.0f} ms")
+            req = time.perf_counter()
+            with client.stream("POST", base + "/query", json={"text": query}) as res:
+                for line in res.iter_lines():
+                    if line.startswith("event: gpt-response"):
+                        print(f"first /query token: {(time.perf_counter() - start) * 1000:8.0f} ms ({(time.perf_counter() - req) * 1000:.0f} ms after request)")
+                        break
+            ready = wait_for(client, base + "/ready")
+            print(f"ready:              {(ready - start) * 1000:8.0f} ms")
+            print(client.get(base + "/ready").json())
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--query", default="does alcohol affect testosterone?")
+    args = parser.parse_args()
+    import_time(args.runs)
+    if args.serve: serve(args.port, args.query)
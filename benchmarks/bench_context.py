@@ -0,0 +1,103 @@
+# Prompt tokens and GPT time-to-first-token of the packed context vs. concatenating every passage,
+# over a replayed set of queries whose matches are chunks of the same episodes (window=15, stride=10)
+# Usage: python benchmarks/bench_context.py [--queries 50] [--prefill-ms-per-kb 40]
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from contextlib import aclosing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from httpx import AsyncClient
+
+from config import settings
+from globals import g
+from context import count_tokens, pack_context
+from ml import gpt_complete
+from schemas import Passage, Query, Message
+from utils import format_timestamps, gpt_message
+from fakes import FakeOpenAIStream
+
+WORDS = "sleep light dopamine focus cortisol morning sunlight circadian rhythm neurons brain exercise cold".split()
+
+def episode(rng: random.Random, sentences: int = 600) -> list[dict]:
+    # Timestamped transcript sentences
+    rows, t = [], 0.0
+    for _ in range(sentences):
+        length = rng.uniform(3, 9)
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+        rows.append({"text": text, "start": t, "end": t + length})
+        t += length
+    return rows
+
+def chunk(rows: list[dict], window: int = 15, stride: int = 10) -> list[dict]:
+    # Same windowing as the ingestion notebook
+    chunks = []
+    for s in range(0, len(rows), stride):
+        end = min(s + window, len(rows))
+        chunks.append({"content": " ".join(r["text"] for r in rows[s:end]), "start": rows[s]["start"], "end": rows[end - 1]["end"]})
+    return chunks
+
+def matches(rng: random.Random, episodes: dict[str, list[dict]], top_k: int) -> list[Passage]:
+    # Relevant content clusters: a few neighbouring chunks from one or two episodes
+    passages = []
+    while len(passages) < top_k:
+        video_id = rng.choice(list(episodes))
+        chunks = episodes[video_id]
+        first = rng.randrange(len(chunks) - 4)
+        for c in chunks[first:first + rng.randint(1, 4)]:
+            passages.append(Passage(
+                video_id=video_id, video_description="", video_tags=[],
+                start=format_timestamps(c["start"]), end=format_timestamps(c["end"]),
+                clip_url=f"https://www.youtube.com/embed/{video_id}?start={int(c['start'])}&autoplay=1",
+                published="Jan 01, 2023", thumbnail=f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
+                title=f"Episode {video_id}", content=c["content"], score=rng.uniform(0.7, 0.9)
+            ))
+    return sorted(passages[:top_k], key=lambda p: p.score, reverse=True)
+
+def concatenated(query: Query, passages: list[Passage]) -> Message:
+    # previous gpt_message
+    message = f"Query: {query.text}"
+    for p in passages: message += f'\n\nPassage: """Source={p.title}, Content={p.content}"""'
+    return Message(text=message)
+
+def merged(query: Query, passages: list[Passage]) -> Message:
+    # merging alone, without a token budget
+    return Message(text=f"Query: {query.text}" + "".join(pack_context(passages, 10 ** 9, settings.context_merge_gap)))
+
+async def ttft(message: Message) -> float:
+    start = time.perf_counter()
+    async with aclosing(gpt_complete(message, [])) as stream:
+        async for item in stream:
+            if isinstance(item, bytes): return time.perf_counter() - start
+
+async def main(args) -> None:
+    rng = random.Random(0)
+    episodes = {f"ep{i}": chunk(episode(rng)) for i in range(20)}
+    workload = [(Query(text=f"question {i}"), matches(rng, episodes, settings.top_k)) for i in range(args.queries)]
+    server = await FakeOpenAIStream(tokens=1, first_token_ms=args.first_token_ms, prefill_ms_per_kb=args.prefill_ms_per_kb).start()
+    settings.gpt_endpoint = server.url
+    g.set_default("gpt_client", AsyncClient(timeout=60.0))
+    try:
+        for name, build in [("concat", concatenated), ("merged", merged), ("packed", gpt_message)]:
+            tokens, firsts = [], []
+            for query, passages in workload:
+                message = build(query, passages)
+                tokens.append(count_tokens(message.text))
+                firsts.append(await ttft(message))
+            print(f"{name:7s} prompt tokens mean={statistics.mean(tokens):7.0f} max={max(tokens):6d}  "
+                  f"ttft p50={statistics.median(firsts) * 1000:6.1f} ms")
+    finally:
+        await g.gpt_client.aclose()
+        await server.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--first-token-ms", type=float, default=150.0)
+    parser.add_argument("--prefill-ms-per-kb", type=float, default=40.0, help="simulated prompt processing cost")
+    asyncio.run(main(parser.parse_args()))
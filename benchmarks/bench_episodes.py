@@ -0,0 +1,84 @@
+# Added latency of building top_k passages: per-passage Supabase lookups vs. the in-memory episode store
+# Usage: python benchmarks/bench_episodes.py [--rtt-ms 25] [--top-k 10] [--queries 20]
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from episodes import EpisodeStore
+
+class FakeSupabase:
+    # Mimics the postgrest query builder with a fixed round trip per execute()
+    def __init__(self, rows: list[dict], rtt: float) -> None:
+        self.rows = {r["id"]: r for r in rows}
+        self.rtt = rtt
+        self.calls = 0
+
+    def table(self, name: str):
+        return FakeQuery(self)
+
+class FakeQuery:
+    def __init__(self, db: FakeSupabase) -> None:
+        self.db = db
+        self.ids = None
+
+    def select(self, columns: str):
+        return self
+
+    def eq(self, column: str, value: str):
+        self.ids = [value]
+        return self
+
+    def in_(self, column: str, values: list):
+        self.ids = list(values)
+        return self
+
+    def execute(self):
+        time.sleep(self.db.rtt)
+        self.db.calls += 1
+        ids = self.db.rows.keys() if self.ids is None else self.ids
+        return SimpleNamespace(data=[self.db.rows[i] for i in ids if i in self.db.rows])
+
+def legacy_lookup(db: FakeSupabase, video_id: str) -> tuple[str, list]:
+    # Equivalent of the old get_video_description + get_video_tags pair
+    description = db.table("episodes").select("description").eq("id", video_id).execute().data[0]["description"]
+    tags = json.loads(db.table("episodes").select("keywords").eq("id", video_id).execute().data[0]["keywords"])
+    return description, tags
+
+async def main(args) -> None:
+    rows = [{"id": f"vid{i}", "description": "d" * 200, "keywords": json.dumps(["sleep", "focus"])} for i in range(args.episodes)]
+    queries = [[f"vid{(q + k) % args.episodes}" for k in range(args.top_k)] for q in range(args.queries)]
+
+    db = FakeSupabase(rows, args.rtt_ms / 1000)
+    start = time.perf_counter()
+    for ids in queries:
+        for video_id in ids: legacy_lookup(db, video_id)
+    legacy = (time.perf_counter() - start) / args.queries
+    legacy_calls = db.calls / args.queries
+
+    db = FakeSupabase(rows, args.rtt_ms / 1000)
+    store = EpisodeStore(db)
+    store.load()
+    db.calls = 0
+    start = time.perf_counter()
+    for ids in queries:
+        await store.fetch_missing(ids)
+        for video_id in ids: store.get(video_id)
+    cached = (time.perf_counter() - start) / args.queries
+
+    print(f"legacy: {legacy * 1000:8.2f} ms/query  ({legacy_calls:.0f} Supabase calls/query)")
+    print(f"store:  {cached * 1000:8.4f} ms/query  ({db.calls / args.queries:.0f} Supabase calls/query)")
+    print(f"store stats: {store.stats()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt-ms", type=float, default=25.0)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--episodes", type=int, default=150)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,133 @@
+# Per-request overhead and SSE chunk latency of the request-context middleware: the previous
+# BaseHTTPMiddleware with a ContextVar per global (reproduced below) against globals.GlobalsMiddleware
+# with singletons in app.state. The ASGI app is called directly, so only middleware and lookup costs show.
+# Usage: python benchmarks/bench_globals.py [--requests 5000] [--chunks 2000] [--lookups 12]
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from contextvars import ContextVar, copy_context
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from fastapi import FastAPI, Request
+from sse_starlette.sse import EventSourceResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from globals import Globals, GlobalsMiddleware
+
+class LegacyGlobals:
+    # The previous lookup path: every global is a ContextVar whose default is the singleton
+    def __init__(self) -> None:
+        object.__setattr__(self, "_vars", {})
+
+    def set_default(self, name: str, default) -> None:
+        self._vars[name] = ContextVar(f"globals:{name}", default=default)
+
+    def __getattr__(self, name: str):
+        return self._vars[name].get()
+
+async def legacy_dispatch(request: Request, call_next):
+    ctx = copy_context()
+    return await ctx.run(lambda: call_next(request))
+
+class LegacyGlobalsMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app) -> None:
+        super().__init__(app, legacy_dispatch)
+
+NAMES = ["embedding_cache", "flights", "broadcaster", "redis_flights", "answer_cache", "pinecone_db",
+         "episode_store", "splade_batcher", "ada_client", "gpt_client", "hf_client", "redis_client"]
+
+def create_app(variant: str, lookups: int, chunks: asyncio.Queue) -> FastAPI:
+    app = FastAPI()
+    if variant == "before":
+        g = LegacyGlobals()
+        app.add_middleware(LegacyGlobalsMiddleware)
+    else:
+        g = Globals()
+        g.bind(app.state)
+        app.add_middleware(GlobalsMiddleware)
+    for name in NAMES: g.set_default(name, object())
+    names = [NAMES[i % len(NAMES)] for i in range(lookups)]
+
+    @app.get("/ping")
+    async def ping():
+        for name in names: getattr(g, name)
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            while (sent := await chunks.get()) is not None:
+                yield {"event": "gpt-response", "data": repr(sent)}
+        return EventSourceResponse(events())
+
+    return app
+
+def scope(path: str) -> dict:
+    return {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+            "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80)}
+
+async def request_overhead(app: FastAPI, requests: int) -> list[float]:
+    samples = []
+    for _ in range(requests):
+        # like a server: the request body once, then a disconnect after the response has been sent
+        done = asyncio.Event()
+        pending = [{"type": "http.request", "body": b"", "more_body": False}]
+        async def receive():
+            if pending: return pending.pop()
+            await done.wait()
+            return {"type": "http.disconnect"}
+        async def send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body"): done.set()
+        start = time.perf_counter()
+        await app(scope("/ping"), receive, send)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def chunk_latency(app: FastAPI, queue: asyncio.Queue, chunks: int) -> list[float]:
+    # Time from a chunk being handed to the SSE generator to its bytes reaching the server's send()
+    disconnected = asyncio.Event()
+    received = asyncio.Queue()
+    samples = []
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"): received.put_nowait(time.perf_counter())
+
+    response = asyncio.create_task(app(scope("/stream"), receive, send))
+    for _ in range(chunks):
+        sent = time.perf_counter()
+        queue.put_nowait(sent)
+        samples.append(await received.get() - sent)
+    queue.put_nowait(None)
+    await response
+    disconnected.set()
+    return samples
+
+def summary(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p99 = samples[int(0.99 * len(samples))]
+    return f"mean {statistics.fmean(samples) * 1e6:7.1f} us  p50 {statistics.median(samples) * 1e6:7.1f} us  p99 {p99 * 1e6:7.1f} us"
+
+async def main(args) -> None:
+    for variant in ["before", "after"]:
+        queue = asyncio.Queue()
+        app = create_app(variant, args.lookups, queue)
+        await request_overhead(app, 200)   # warm up routing and pydantic serializers
+        overhead = await request_overhead(app, args.requests)
+        latency = await chunk_latency(app, queue, args.chunks)
+        print(f"{variant:6s} request  {summary(overhead)}")
+        print(f"{variant:6s} sse chunk {summary(latency)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=12, help="g.* lookups per request")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,133 @@
+# Wall clock of index ingestion on a synthetic corpus: the notebook's loop (a scan of the sentences per
+# episode, Ada 8 documents at a time, SPLADE per batch of 8, 64-vector blocking upserts) against
+# scripts/ingest.py, with the fake embeddings endpoint from upstreams.py (per-input cost and a rate
+# limit), a fake SPLADE encoder and a fake index. Also checks that an interrupted run resumes.
+# Usage: python benchmarks/bench_ingest.py [--episodes 30] [--sentences 450]
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+sys.path.insert(0, HERE)
+
+from ingest import batch_embed, build_documents, build_vector_meta, chunk, group_by_episode, upsert_vectors
+from loadtest import wait_ready
+
+PROFILE = {"embeddings": {"median_ms": 80, "p95_ms": 200, "per_input_ms": 0.5, "rate_limit_rps": 25}}
+WORDS = "sleep light dopamine focus caffeine cortisol exercise protocol neuron circadian morning".split()
+
+class FakeSplade:
+    # Fixed cost per forward pass plus a cost per document, like a batched GPU encoder
+    def __init__(self, batch_ms: float = 20.0, doc_ms: float = 1.0) -> None:
+        self.batch_ms, self.doc_ms = batch_ms, doc_ms
+
+    def encode_documents(self, texts):
+        time.sleep((self.batch_ms + self.doc_ms * len(texts)) / 1000)
+        return [{"indices": sorted({hash(w) % 30522 for w in t.split()}), "values": [1.0] * len(set(t.split()))} for t in texts]
+
+class FakeIndex:
+    # Blocking upserts with a round trip and a per-vector cost; thread safe
+    def __init__(self, call_ms: float = 60.0, vector_ms: float = 0.3) -> None:
+        self.call_ms, self.vector_ms = call_ms, vector_ms
+        self.ids, self.lock = set(), threading.Lock()
+
+    def upsert(self, vectors, namespace):
+        time.sleep((self.call_ms + self.vector_ms * len(vectors)) / 1000)
+        with self.lock: self.ids.update(v["id"] for v in vectors)
+
+def corpus(episodes: int, per_episode: int, rng: random.Random):
+    sentences, metadata = [], {}
+    for e in range(episodes):
+        video_id = f"ep{e:03d}"
+        metadata[video_id] = {"video_id": video_id, "title": f"Episode {e}", "published": "2023-01-02T00:00:00", "thumbnail": "thumb.jpg"}
+        for s in range(per_episode):
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))) + "."
+            sentences.append({"id": video_id, "text": text, "start": s * 5.0, "end": s * 5.0 + 4.5})
+    return sentences, metadata
+
+def notebook(sentences, channel_meta, endpoint: str, splade: FakeSplade, index: FakeIndex) -> int:
+    # The notebook's build_embeddings / batch_embed / upsert_vectors, with a list standing in for the dataset
+    vectors = []
+    with httpx.Client(timeout=120.0) as client:
+        for video_id in channel_meta:
+            episode = [s for s in sentences if s["id"] == video_id and s["end"] is not None]
+            documents = chunk(episode)
+            for d in range(0, len(documents), 8):
+                batch = documents[d:d + 8]
+                texts = [doc["content"] for doc in batch]
+                while True:
+                    res = client.post(endpoint, json={"model": "ada", "input": texts})
+                    if res.status_code != 429: break
+                    time.sleep(float(res.headers["retry-after"]))   # the openai client's retry
+                dense = [v["embedding"] for v in res.json()["data"]]
+                sparse = splade.encode_documents(texts)
+                for i, (doc, dv, sv) in enumerate(zip(batch, dense, sparse)):
+                    vectors.append({"id": f"{video_id}_{d + i + 1}", "values": dv, "sparse_values": sv, "metadata": build_vector_meta(doc, channel_meta[video_id])})
+    for i in range(0, len(vectors), 64): index.upsert(vectors=vectors[i:i + 64], namespace="bench")
+    return len(vectors)
+
+async def pipeline(sentences, channel_meta, endpoint: str, splade: FakeSplade, index: FakeIndex, out: str, args) -> int:
+    documents = build_documents(group_by_episode(sentences), channel_meta)
+    await batch_embed(documents, out, splade, endpoint, "fake", batch_size=args.batch_size, concurrency=args.concurrency)
+    return await asyncio.to_thread(upsert_vectors, index, "bench", out)
+
+async def main(args) -> None:
+    sentences, channel_meta = corpus(args.episodes, args.sentences, random.Random(0))
+    documents = build_documents(group_by_episode(sentences), channel_meta)
+    print(f"{len(sentences)} sentences, {len(channel_meta)} episodes, {len(documents)} documents")
+    with tempfile.TemporaryDirectory() as tmp:
+        profile = os.path.join(tmp, "profile.json")
+        with open(profile, "w") as f: json.dump(PROFILE, f)
+        base = f"http://127.0.0.1:{args.port}"
+        endpoint = f"{base}/v1/embeddings"
+        process = subprocess.Popen([sys.executable, os.path.join(HERE, "upstreams.py"), "--port", str(args.port), "--profile", profile])
+        try:
+            await wait_ready(f"{base}/stats", 30, process)
+            if not args.skip_notebook:
+                index = FakeIndex()
+                start = time.perf_counter()
+                count = await asyncio.to_thread(notebook, sentences, channel_meta, endpoint, FakeSplade(), index)
+                print(f"notebook   {time.perf_counter() - start:6.1f} s  ({count} vectors, {len(index.ids)} in the index)")
+
+            index = FakeIndex()
+            out = os.path.join(tmp, "vectors.jsonl")
+            start = time.perf_counter()
+            await pipeline(sentences, channel_meta, endpoint, FakeSplade(), index, out, args)
+            elapsed = time.perf_counter() - start
+            async with httpx.AsyncClient() as client: stats = (await client.get(f"{base}/stats")).json()["embeddings"]
+            print(f"ingest.py  {elapsed:6.1f} s  ({len(index.ids)} in the index, {stats['throttled']} calls rate limited in total)")
+
+            # interrupt a fresh run half way through, then resume it
+            out = os.path.join(tmp, "resumed.jsonl")
+            interrupted = asyncio.ensure_future(batch_embed(documents, out, FakeSplade(), endpoint, "fake", batch_size=args.batch_size, concurrency=args.concurrency))
+            await asyncio.sleep(elapsed / 3)
+            interrupted.cancel()
+            await asyncio.gather(interrupted, return_exceptions=True)
+            index = FakeIndex()
+            start = time.perf_counter()
+            resumed = await batch_embed(documents, out, FakeSplade(), endpoint, "fake", batch_size=args.batch_size, concurrency=args.concurrency)
+            await asyncio.to_thread(upsert_vectors, index, "bench", out)
+            print(f"resumed    {time.perf_counter() - start:6.1f} s  ({resumed} documents re-embedded, {len(index.ids)} in the index)")
+        finally:
+            process.terminate()
+            process.wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--episodes", type=int, default=30)
+    parser.add_argument("--sentences", type=int, default=450, help="sentences per episode")
+    parser.add_argument("--batch-size", type=int, default=32, help="documents per Ada request")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--skip-notebook", action="store_true")
+    asyncio.run(main(parser.parse_args()))
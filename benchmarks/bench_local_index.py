@@ -0,0 +1,101 @@
+# p50/p99 query latency of the local hybrid index (float32 and int8) on a synthetic corpus,
+# optionally against the remote Pinecone index configured in the environment. The matches go through
+# utils.passage() as /query's do; exits non-zero if that fails.
+# Usage: python benchmarks/bench_local_index.py [--vectors 30000] [--queries 200] [--remote]
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# app/ goes first: its utils, not the one in scripts/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import numpy as np
+
+from episodes import Episode
+from export_local_index import export_index
+from globals import g
+from local_index import LocalIndex
+from utils import passage
+
+class Store:
+    # episode_store stand-in
+    def get(self, video_id: str) -> Episode:
+        return Episode(description="In this episode, I discuss sleep.", tags=["sleep"])
+
+def synthetic_vectors(n: int):
+    rng = np.random.default_rng(1)
+    for i in range(n):
+        dense = rng.normal(size=1536).astype(np.float32)
+        dense /= np.linalg.norm(dense)
+        indices = np.sort(rng.choice(30522, size=150, replace=False))
+        yield {
+            "id": f"vid{i // 150}_{i % 150 + 1}",
+            "values": dense.tolist(),
+            "sparse_values": {"indices": indices.tolist(), "values": rng.random(150).tolist()},
+            # the metadata scripts/ingest.py writes, with published as the ISO string of the vectors file
+            "metadata": {"title": f"Episode {i // 150} | Huberman Lab", "published": f"2023-01-{i // 150 % 28 + 1:02d}T00:00:00",
+                         "thumbnail": f"https://img.youtube.com/vi/vid{i // 150}/maxresdefault.jpg", "video_id": f"vid{i // 150}",
+                         "content": "...", "start": 60.0 * (i % 150), "end": 60.0 * (i % 150) + 90.0, "tokens": 120}
+        }
+
+def percentiles(latencies: list[float]) -> str:
+    latencies = sorted(latencies)
+    p99 = latencies[int(0.99 * (len(latencies) - 1))]
+    return f"p50={statistics.median(latencies) * 1000:7.2f} ms  p99={p99 * 1000:7.2f} ms"
+
+def run(query, queries: list) -> list[float]:
+    latencies = []
+    for dense, sparse in queries:
+        start = time.perf_counter()
+        query(top_k=10, vector=dense, sparse_vector=sparse, namespace="nocontext-default", include_metadata=True)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def main(args) -> None:
+    g.set_default("episode_store", Store())
+    rng = np.random.default_rng(0)
+    failed = False
+    queries = [(rng.normal(size=1536).tolist(), {"indices": sorted(random.sample(range(30522), 20)), "values": [1.0] * 20}) for _ in range(args.queries)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for quantized in (False, True):
+            path = os.path.join(tmp, "int8" if quantized else "float32")
+            export_index(synthetic_vectors(args.vectors), os.path.join(path, "nocontext-default"), quantized=quantized)
+            index = LocalIndex(path)
+            name = "local int8" if quantized else "local f32"
+            print(f"{name:12s} {percentiles(run(index.query, queries))}")
+            # the local backend has to be a drop-in for Pinecone: its matches must make passages
+            try:
+                passages = [passage(m) for m in index.query(10, *queries[0], "nocontext-default", include_metadata=True)["matches"]]
+                ok = len(passages) == 10
+                detail = f"{passages[0].title}, published {passages[0].published}"
+            except Exception as err:
+                ok, detail = False, repr(err)
+            failed |= not ok
+            print(f"{'':12s} passages from matches: {detail}  {'OK' if ok else 'FAIL'}")
+        # int8 ranking agreement with float32
+        f32, i8 = LocalIndex(os.path.join(tmp, "float32")), LocalIndex(os.path.join(tmp, "int8"))
+        overlap = [
+            len({m["id"] for m in f32.query(10, d, s, "nocontext-default")["matches"]} & {m["id"] for m in i8.query(10, d, s, "nocontext-default")["matches"]}) / 10
+            for d, s in queries
+        ]
+        print(f"int8 top-10 overlap with float32: {statistics.mean(overlap):.3f}")
+    if args.remote:
+        import pinecone
+        from config import settings
+        pinecone.init(api_key=settings.pinecone_api_key, environment=settings.pinecone_env)
+        index = pinecone.Index(settings.pinecone_index)
+        print(f"{'pinecone':12s} {percentiles(run(index.query, queries))}")
+    if failed: sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=30000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--remote", action="store_true", help="also query the configured Pinecone index")
+    main(parser.parse_args())
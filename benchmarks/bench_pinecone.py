@@ -0,0 +1,79 @@
+# Exercise the PineconeDB access layer offline against FakeIndex: concurrent queries, recovery from a
+# failed query, per-call latency stats, and the health monitor taking an index that went down (with the
+# first reconnect failing too) out of service and back. Exits non-zero if any of those checks fails.
+# Usage: python benchmarks/bench_pinecone.py [--clients 16] [--latency-ms 40]
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from config import settings
+from pinecone_db import PineconeDB
+from schemas import Query
+from fakes import FakeIndex
+
+async def wait_for(condition, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline: return False
+        await asyncio.sleep(0.01)
+    return True
+
+async def main(args) -> None:
+    settings.pinecone_health_interval = settings.pinecone_backoff_base = args.health_interval
+    index = FakeIndex(latency_ms=args.latency_ms, fail_next=1)
+    db = PineconeDB(index=index)
+    # re-initializing would connect to Pinecone; the test double reconnects to a fresh FakeIndex, failing
+    # the first `refuse` times
+    refuse = 0
+    def reconnect() -> None:
+        nonlocal refuse
+        if refuse:
+            refuse -= 1
+            raise ConnectionError("connection refused")
+        db.index = FakeIndex(latency_ms=args.latency_ms)
+    db.init_db = reconnect
+    dense = [0.01] * 1536
+    sparse = {"indices": [10, 20], "values": [0.5, 0.5]}
+    query = Query(text="morning sunlight")
+    failed = False
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(db.query_db(query, dense, sparse, "question") for _ in range(args.clients)))
+    wall = time.perf_counter() - start
+    print(f"{args.clients} concurrent queries in {wall * 1000:.1f} ms (serial would be ~{args.clients * args.latency_ms:.0f} ms)")
+    print(f"matches per query: {len(results[0])}")
+    ok = all(results) and db.reinits == 1
+    failed |= not ok
+    print(f"failed query: every query answered after {db.reinits} re-initialization(s)  {'OK' if ok else 'FAIL'}")
+
+    # the index goes down between queries: the monitor has to notice and bring it back on its own
+    db.index.down, refuse, reinits = True, 1, db.reinits
+    marked = await wait_for(lambda: not db.healthy, 20 * args.health_interval)
+    print(f"index down: marked unhealthy {marked}  {'OK' if marked else 'FAIL'}")
+    failed |= not marked
+    recovered = await wait_for(lambda: db.healthy, 40 * args.health_interval)
+    ok = recovered and refuse == 0 and db.reinits - reinits == 2 and not db.index.down
+    failed |= not ok
+    print(f"index down: healthy again {recovered} after {db.reinits - reinits} re-initializations (1 refused)  {'OK' if ok else 'FAIL'}")
+
+    errors, reinits = db.errors, db.reinits
+    results = await asyncio.gather(*(db.query_db(query, dense, sparse, "question") for _ in range(args.clients)))
+    ok = all(results) and db.errors == errors and db.reinits == reinits
+    failed |= not ok
+    print(f"after recovery: {sum(map(bool, results))}/{args.clients} queries answered, {db.errors - errors} errors  {'OK' if ok else 'FAIL'}")
+
+    await db.stop_monitor()
+    db.close()
+    print(f"stats: {db.stats()}")
+    if failed: sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--health-interval", type=float, default=0.1, help="seconds between health checks and the backoff base")
+    asyncio.run(main(parser.parse_args()))
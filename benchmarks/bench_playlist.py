@@ -0,0 +1,180 @@
+# scripts/playlist.py against a stubbed pytube: videos "download" with a fixed latency into a tiny
+# generated WAV file and are transcoded with ffmpeg (or, without ffmpeg on the PATH, a CPU-bound stand-in).
+# Compares the old one-video-at-a-time loop with the pipelined downloader, reports the peak number of
+# concurrent downloads and transcodes, then interrupts a run (failed downloads, transcodes cut off before
+# or after their mp3 was written) and checks that the next run redoes exactly the unfinished videos,
+# skips the finished ones and leaves one mp3 and one metadata row per video; exits non-zero otherwise.
+# Usage: python benchmarks/bench_playlist.py [--videos 24] [--download-ms 300] [--transcode-ms 250]
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+import wave
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+class Stats:
+    lock = threading.Lock()
+    active = peak = downloads = 0
+    fail: set = set()
+    downloaded: set = set()
+
+def tiny_wav(path: str) -> None:
+    # 0.1 s of silence, 8 kHz mono
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b"\x00\x00" * 800)
+
+class FakeStream:
+    itag, mime_type = 140, "audio/mp4"
+
+    def __init__(self, video_id: str, download_ms: float) -> None:
+        self.video_id, self.download_ms = video_id, download_ms
+
+    def download(self, output_path: str, filename: str) -> str:
+        with Stats.lock:
+            Stats.active += 1
+            Stats.downloads += 1
+            Stats.downloaded.add(self.video_id)
+            Stats.peak = max(Stats.peak, Stats.active)
+        try:
+            time.sleep(self.download_ms / 1000)
+            if self.video_id in Stats.fail: raise ConnectionError("injected download failure")
+            tiny_wav(os.path.join(output_path, filename))
+        finally:
+            with Stats.lock: Stats.active -= 1
+        return os.path.join(output_path, filename)
+
+class FakeStreams:
+    def __init__(self, stream: FakeStream) -> None:
+        self.stream = stream
+
+    def get_audio_only(self): return self.stream
+    def filter(self, **kwargs): return [self.stream]
+    def get_by_itag(self, itag): return self.stream
+
+def install_fake_pytube(videos: int, download_ms: float) -> None:
+    pytube = types.ModuleType("pytube")
+    extract = types.ModuleType("pytube.extract")
+    extract.video_id = lambda url: url.rsplit("=", 1)[1]
+
+    class Playlist:
+        def __init__(self, url): self.title, self.video_urls = "Fake playlist", [f"https://youtube.com/watch?v=vid{i:03d}" for i in range(videos)]
+
+    class YouTube:
+        def __init__(self, url, use_oauth=False, allow_oauth_cache=False):
+            video_id = extract.video_id(url)
+            self.publish_date = datetime.date(2023, 1, 2)
+            self.vid_info = {"videoDetails": {"videoId": video_id, "title": f"Episode {video_id} | Huberman Lab", "lengthSeconds": "7200",
+                                              "keywords": ["sleep", "huberman lab"], "shortDescription": "About sleep.\nLinks",
+                                              "thumbnail": {"thumbnails": [{"url": "thumb.jpg"}]}}}
+            self.streams = FakeStreams(FakeStream(video_id, download_ms))
+
+    pytube.Playlist, pytube.YouTube, pytube.extract = Playlist, YouTube, extract
+    sys.modules["pytube"], sys.modules["pytube.extract"] = pytube, extract
+
+def cpu_transcode(mp4_path: str, mp3_path: str, transcode_ms: float = 250.0) -> str:
+    # Stand-in for ffmpeg: burns CPU, then writes when it ran so overlap can be measured afterwards; like
+    # transcode, the mp3 gets its final name only once complete
+    start = time.time()
+    while time.time() - start < transcode_ms / 1000: pass
+    with open(mp3_path + ".part.mp3", "w") as f: json.dump([start, time.time()], f)
+    os.replace(mp3_path + ".part.mp3", mp3_path)
+    os.remove(mp4_path)
+    return mp3_path
+
+def peak_overlap(intervals: list) -> int:
+    events = sorted([(s, 1) for s, _ in intervals] + [(e, -1) for _, e in intervals])
+    active = peak = 0
+    for _, change in events:
+        active += change
+        peak = max(peak, active)
+    return peak
+
+def main(args) -> None:
+    install_fake_pytube(args.videos, args.download_ms)
+    from functools import partial
+    from playlist import Playlist, transcode
+    from utils import MetadataStore
+    real_ffmpeg = shutil.which("ffmpeg") is not None
+    transcoder = transcode if real_ffmpeg else partial(cpu_transcode, transcode_ms=args.transcode_ms)
+    print(f"{args.videos} videos, {args.download_ms:.0f} ms downloads, transcoding with {'ffmpeg' if real_ffmpeg else f'a {args.transcode_ms:.0f} ms CPU stand-in'}, {os.cpu_count()} cores")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # the previous loop: resolve, download, transcode, one video after another
+        out = os.path.join(tmp, "sequential")
+        os.makedirs(out)
+        p = Playlist("fake", mp3_path=out, metadata=MetadataStore(os.path.join(out, "metadata.jsonl")))
+        start = time.perf_counter()
+        for url in p.playlist.video_urls:
+            meta, mp4 = p.download_audio(url)
+            transcoder(mp4, p.mp3_file(meta["video_id"]))
+            p.metadata.add(meta)
+        print(f"one at a time  {time.perf_counter() - start:6.2f} s")
+
+        out = os.path.join(tmp, "pipelined")
+        os.makedirs(out)
+        Stats.peak = 0
+        p = Playlist("fake", mp3_path=out, metadata=MetadataStore(os.path.join(out, "metadata.jsonl")),
+                     download_workers=args.download_workers, transcode_workers=args.transcode_workers, transcoder=transcoder)
+        start = time.perf_counter()
+        p.download_playlist()
+        elapsed = time.perf_counter() - start
+        transcodes = "n/a with ffmpeg"
+        if not real_ffmpeg:
+            intervals = []
+            for name in os.listdir(out):
+                if name.endswith(".mp3"):
+                    with open(os.path.join(out, name)) as f: intervals.append(json.load(f))
+            transcodes = peak_overlap(intervals)
+        print(f"pipelined      {elapsed:6.2f} s  (peak {Stats.peak} concurrent downloads, {transcodes} concurrent transcodes)")
+
+        # interrupt: a third of the downloads fail, and of the videos that did finish one is cut off mid-transcode
+        # (only its .part.mp3 left) and one after its mp3 but before its metadata row; then run again
+        out = os.path.join(tmp, "resumed")
+        os.makedirs(out)
+        videos = [f"vid{i:03d}" for i in range(args.videos)]
+        Stats.fail = set(videos[::3])
+        make = lambda: Playlist("fake", mp3_path=out, metadata=MetadataStore(os.path.join(out, "metadata.jsonl")),
+                                download_workers=args.download_workers, transcode_workers=args.transcode_workers, transcoder=transcoder)
+        failed = {url.rsplit("=", 1)[1] for url in make().download_playlist()}
+        cut_transcode, cut_metadata = videos[1], videos[2]
+        os.remove(os.path.join(out, cut_transcode + ".mp3"))
+        with open(os.path.join(out, cut_transcode + ".mp3.part.mp3"), "w") as f: f.write("partial")
+        metadata_path = os.path.join(out, "metadata.jsonl")
+        with open(metadata_path) as f: lines = [line for line in f if json.loads(line)["video_id"] not in (cut_transcode, cut_metadata)]
+        with open(metadata_path, "w") as f: f.writelines(lines)
+        Stats.fail, Stats.downloads, Stats.downloaded = set(), 0, set()
+        failed_again = make().download_playlist()
+        with open(metadata_path) as f: rows = [json.loads(line)["video_id"] for line in f]
+        leftovers = sorted(set(os.listdir(out)) - {v + ".mp3" for v in videos} - {"metadata.jsonl"})
+        print(f"resume         first run {len(failed)} failed, second run downloaded {Stats.downloads} ({len(failed_again)} failed); "
+              f"{len(rows)} metadata rows, {len(set(rows))} unique; {len(leftovers)} leftover temp files")
+
+        redo = failed | {cut_transcode, cut_metadata}
+        checks = [("first run fails exactly the injected downloads", failed == set(videos[::3])),
+                  ("second run redoes the failed and cut-off videos", Stats.downloaded == redo and Stats.downloads == len(redo)),
+                  ("second run skips every finished video", set(videos) - Stats.downloaded == set(videos) - redo),
+                  ("second run has no failures", not failed_again),
+                  ("one metadata row per video", sorted(rows) == videos),
+                  ("one mp3 per video", all(os.path.exists(os.path.join(out, v + ".mp3")) for v in videos)),
+                  ("no leftover temp files", not leftovers)]
+        for label, ok in checks: print(f"{label}: {'OK' if ok else 'FAIL'}")
+        if not all(ok for _, ok in checks): sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=24)
+    parser.add_argument("--download-ms", type=float, default=300.0)
+    parser.add_argument("--transcode-ms", type=float, default=250.0, help="CPU stand-in cost when ffmpeg isn't installed")
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--transcode-workers", type=int, default=None, help="defaults to the number of cores")
+    main(parser.parse_args())
@@ -0,0 +1,92 @@
+# Event-loop stall and wall time of retrieval preparation under concurrent requests
+# Compares SPLADE called inline on the loop (old splade_encode) with the executor-backed prepare_retrieval.
+# Exits non-zero if prepare_retrieval stalls the loop longer than --max-stall-ms.
+# Usage: python benchmarks/bench_prepare.py [--clients 8] [--splade-ms 80] [--upstream-ms 60]
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from batching import SpladeBatcher
+from globals import g
+from ml import prepare_retrieval
+from schemas import Query
+
+class FakeSplade:
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+
+    def encode_queries(self, texts):
+        time.sleep(self.seconds)   # stands in for the blocking torch forward pass
+        sparse = {"indices": [1, 2, 3], "values": [0.5, 0.25, 0.125]}
+        return [sparse for _ in texts] if isinstance(texts, list) else sparse
+
+class FakeResponse:
+    def __init__(self, body: dict) -> None:
+        self.body = body
+
+    def json(self) -> dict:
+        return self.body
+
+class FakeClient:
+    def __init__(self, seconds: float, body: dict) -> None:
+        self.seconds = seconds
+        self.body = body
+
+    async def post(self, url: str, **kwargs) -> FakeResponse:
+        await asyncio.sleep(self.seconds)
+        return FakeResponse(self.body)
+
+async def heartbeat(stop: asyncio.Event, interval: float = 0.005) -> float:
+    # Largest delay between when a 5 ms timer should fire and when it actually does
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+async def legacy_prepare(query: Query):
+    dense = (await g.ada_client.post(url="")).json()["data"][0]["embedding"]
+    sparse = g.splade.encode_queries(query.text)
+    class_ = (await g.hf_client.post(url="")).json()["labels"][0]
+    return dense, sparse, class_
+
+async def run(fn, clients: int) -> tuple[float, float]:
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(fn(Query(text=f"query {i}")) for i in range(clients)))
+    wall = time.perf_counter() - start
+    stop.set()
+    return wall, await beat
+
+async def main(args) -> None:
+    g.set_default("splade", FakeSplade(args.splade_ms / 1000))
+    g.set_default("splade_executor", ThreadPoolExecutor(max_workers=args.workers))
+    g.set_default("splade_batcher", SpladeBatcher(max_batch_size=1, max_wait_ms=0, queue_depth=1024, workers=args.workers))
+    g.set_default("ada_client", FakeClient(args.upstream_ms / 1000, {"data": [{"embedding": [0.0] * 1536}]}))
+    g.set_default("hf_client", FakeClient(args.upstream_ms / 1000, {"scores": [0.9, 0.1], "labels": ["question", "search term"]}))
+    failed = False
+    for name, fn in (("inline", legacy_prepare), ("prepare", prepare_retrieval)):
+        wall, stall = await run(fn, args.clients)
+        line = f"{name:8s} clients={args.clients:3d} wall={wall * 1000:8.1f} ms  worst loop stall={stall * 1000:8.1f} ms"
+        if name == "prepare":
+            ok = stall * 1000 <= args.max_stall_ms
+            failed |= not ok
+            line += f"  (limit {args.max_stall_ms:.0f} ms) {'OK' if ok else 'FAIL'}"
+        print(line)
+    if failed: sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--splade-ms", type=float, default=80.0)
+    parser.add_argument("--upstream-ms", type=float, default=60.0)
+    parser.add_argument("--max-stall-ms", type=float, default=50.0, help="worst loop stall allowed while SPLADE encodes")
+    asyncio.run(main(parser.parse_args()))
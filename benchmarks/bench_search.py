@@ -0,0 +1,79 @@
+# /search vs. the passages event of /query: payload size (raw and gzip) of the same 10 passages,
+# then latency on the offline stack from loadtest.py: /query's time to the passages event, /search,
+# and a /search revalidation answered with 304
+# Usage: python benchmarks/bench_search.py [--queries 30] [--profile profile.json]
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "app"))
+sys.path.insert(0, HERE)
+
+from fastapi.encoders import jsonable_encoder
+
+from episodes import Episode
+from globals import g
+from schemas import Query
+from utils import passage, search_result
+from loadtest import add_serve_arguments, make_queries, one_query, serve
+from fakes import FakeIndex
+
+class Store:
+    # episode_store stand-in with descriptions and tags of realistic length
+    def get(self, video_id: str) -> Episode:
+        return Episode(description="In this episode, I discuss how to optimize sleep and focus. " * 25,
+                       tags=[f"keyword {i}" for i in range(20)])
+
+def sizes() -> None:
+    g.set_default("episode_store", Store())
+    matches = FakeIndex(top_k_matches=10)._matches(10)
+    # the Pinecone client deserializes ISO timestamps in metadata into datetimes
+    for m in matches: m["metadata"]["published"] = datetime.fromisoformat(m["metadata"]["published"])
+    passages = [passage(m) for m in matches]
+    event = json.dumps([jsonable_encoder(p) for p in passages]).encode()
+    search = search_result(Query(text="how does light affect sleep?"), passages).model_dump_json().encode()
+    for name, body in [("passages event", event), ("/search", search)]:
+        print(f"{name:15s} {len(body):7d} B raw  {len(gzip.compress(body)):6d} B gzip")
+
+def p50(values: list[float]) -> str:
+    return f"{statistics.median(values) * 1000:7.1f} ms"
+
+async def latencies(args) -> None:
+    async with serve(args) as (base_url, _):
+        queries = make_queries(args.queries, 0.0, random.Random(args.seed))
+        async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+            # /query's passages event, for fresh queries
+            events = [(await one_query(client, text))["ttfse"] for text in queries]
+            fresh, revalidated, tags = [], [], []
+            for text in make_queries(args.queries, 0.0, random.Random(args.seed + 1)):
+                start = time.perf_counter()
+                response = await client.get("/search", params={"q": text})
+                fresh.append(time.perf_counter() - start)
+                tags.append((text, response.headers["etag"]))
+            for text, tag in tags:
+                start = time.perf_counter()
+                response = await client.get("/search", params={"q": text}, headers={"If-None-Match": tag})
+                assert response.status_code == 304, response.status_code
+                revalidated.append(time.perf_counter() - start)
+    print(f"/query passages event p50 {p50(events)}")
+    print(f"/search p50               {p50(fresh)}")
+    print(f"/search 304 p50           {p50(revalidated)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--sizes-only", action="store_true")
+    add_serve_arguments(parser)
+    args = parser.parse_args()
+    sizes()
+    if not args.sizes_only: asyncio.run(latencies(args))
@@ -0,0 +1,121 @@
+# SPLADE engines on CPU: per-query latency, peak RSS, equivalence with the torch SpladeEncoder
+# and top-k sparse retrieval overlap. Each engine runs in its own process so peak RSS is isolated.
+# Usage: python benchmarks/bench_splade_engines.py [--onnx-path app/splade-onnx] [--queries queries.txt] [--corpus corpus.txt]
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+QUERIES = [
+    "does alcohol affect testosterone?", "how to fall asleep faster", "morning sunlight",
+    "what is the best time to drink caffeine", "cold exposure dopamine", "how does exercise affect focus",
+    "zone 2 cardio", "is napping good for learning", "ashwagandha", "why do we dream"
+]
+CORPUS = [
+    "Alcohol consumption reduces testosterone and increases estrogen.",
+    "Viewing morning sunlight sets the circadian clock and improves sleep at night.",
+    "Delaying caffeine intake 90 to 120 minutes after waking helps avoid the afternoon crash.",
+    "Deliberate cold exposure causes a long lasting increase in dopamine.",
+    "Zone 2 cardio improves mitochondrial function and endurance.",
+    "Naps of 20 minutes or less can enhance learning and memory consolidation.",
+    "Ashwagandha can lower cortisol but should be cycled.",
+    "Rapid eye movement sleep is when most vivid dreaming occurs.",
+    "Exercise increases blood flow to the brain and improves focus afterwards.",
+    "Non sleep deep rest protocols can help you fall back asleep."
+]
+
+def load_engine(name: str, onnx_path: str):
+    if name == "onnx":
+        from splade_engines import OnnxSpladeEncoder
+        return OnnxSpladeEncoder(onnx_path)
+    if name == "quantized":
+        from splade_engines import QuantizedSpladeEncoder
+        return QuantizedSpladeEncoder()
+    from pinecone_text.sparse import SpladeEncoder
+    return SpladeEncoder(device="cpu")
+
+def worker(name: str, onnx_path: str, queries: list[str], corpus: list[str], repeats: int) -> None:
+    engine = load_engine(name, onnx_path)
+    engine.encode_queries(queries[0])
+    latencies = []
+    for _ in range(repeats):
+        for q in queries:
+            start = time.perf_counter()
+            engine.encode_queries(q)
+            latencies.append(time.perf_counter() - start)
+    print(json.dumps({
+        "p50_ms": statistics.median(latencies) * 1000,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "queries": [engine.encode_queries(q) for q in queries],
+        # the corpus side of retrieval uses document encodings, as the index built by ingest.py does
+        "corpus": engine.encode_documents(corpus) if name == "torch" else []
+    }))
+
+def dot(a: dict, b: dict) -> float:
+    weights = dict(zip(a["indices"], a["values"]))
+    return sum(weights.get(i, 0.0) * v for i, v in zip(b["indices"], b["values"]))
+
+def top_k(query: dict, corpus: list[dict], k: int) -> set[int]:
+    return set(sorted(range(len(corpus)), key=lambda i: -dot(query, corpus[i]))[:k])
+
+def compare(ref: dict, other: dict) -> tuple[float, float]:
+    # index-set Jaccard and max abs weight difference over shared indices
+    a, b = dict(zip(ref["indices"], ref["values"])), dict(zip(other["indices"], other["values"]))
+    shared = set(a) & set(b)
+    jaccard = len(shared) / max(len(set(a) | set(b)), 1)
+    return jaccard, max((abs(a[i] - b[i]) for i in shared), default=0.0)
+
+def main(args) -> None:
+    queries = open(args.queries).read().splitlines() if args.queries else QUERIES
+    corpus = open(args.corpus).read().splitlines() if args.corpus else CORPUS
+    results = {}
+    for name in args.engines:
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", name, "--onnx-path", args.onnx_path, "--repeats", str(args.repeats)]
+            + (["--queries", args.queries] if args.queries else []) + (["--corpus", args.corpus] if args.corpus else []),
+            cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        results[name] = json.loads(out.strip().splitlines()[-1])
+    ref = results["torch"]
+    failed = False
+    for name, r in results.items():
+        line = f"{name:10s} p50={r['p50_ms']:8.2f} ms  peak RSS={r['peak_rss_mb']:8.1f} MB"
+        if name != "torch":
+            pairs = [compare(a, b) for a, b in zip(ref["queries"], r["queries"])]
+            jaccard = statistics.mean(p[0] for p in pairs)
+            max_diff = max(p[1] for p in pairs)
+            overlap = statistics.mean(
+                len(top_k(a, ref["corpus"], args.k) & top_k(b, ref["corpus"], args.k)) / args.k
+                for a, b in zip(ref["queries"], r["queries"])
+            )
+            ok = max_diff <= args.tol and jaccard >= args.min_jaccard
+            failed |= not ok
+            line += f"  index jaccard={jaccard:.3f}  max |dw|={max_diff:.4f}  top-{args.k} overlap={overlap:.3f}  {'OK' if ok else 'FAIL'}"
+        print(line)
+    if failed: sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines", nargs="+", default=["torch", "quantized", "onnx"])
+    parser.add_argument("--onnx-path", default=os.path.join(APP_DIR, "splade-onnx"))
+    parser.add_argument("--queries")
+    parser.add_argument("--corpus")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--tol", type=float, default=0.1, help="max allowed absolute weight difference")
+    parser.add_argument("--min-jaccard", type=float, default=0.9)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        queries = open(args.queries).read().splitlines() if args.queries else QUERIES
+        corpus = open(args.corpus).read().splitlines() if args.corpus else CORPUS
+        worker(args.worker, args.onnx_path, queries, corpus, args.repeats)
+    else:
+        main(args)
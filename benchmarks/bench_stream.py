@@ -0,0 +1,68 @@
+# Time-to-first-token and total stream time of ml.gpt_complete against a local fake OpenAI SSE server,
+# compared with the previous parse/re-serialize relay that slept 50 ms per line
+# Usage: python benchmarks/bench_stream.py [--tokens 400] [--token-ms 10]
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from httpx import AsyncClient
+
+from config import settings
+from globals import g
+from ml import gpt_complete
+from schemas import Message
+from fakes import FakeOpenAIStream
+
+async def legacy_complete(message: Message):
+    payload = {"model": settings.gpt_model, "messages": [{"role": "user", "content": message.text}], "stream": True}
+    async with g.gpt_client.stream('POST', url=settings.gpt_endpoint, json=payload) as response:
+        async for raw in response.aiter_lines():
+            line = raw.rstrip("\n")
+            if not line: continue
+            _, _, value = line.partition(":")
+            if value.startswith(" "): value = value[1:]
+            if value != "[DONE]":
+                yield {"event": "gpt-response", "data": json.dumps(json.loads(value))}
+            else:
+                yield {"event": "close", "data": {}}
+            await asyncio.sleep(0.05)
+
+def is_token(item) -> bool:
+    if isinstance(item, bytes): return b"gpt-response" in item
+    return isinstance(item, dict) and item.get("event") == "gpt-response"
+
+async def measure(stream) -> tuple[float, float, int]:
+    start = time.perf_counter()
+    ttft, writes = None, 0
+    async for item in stream:
+        writes += 1
+        if ttft is None and is_token(item): ttft = time.perf_counter() - start
+    return ttft, time.perf_counter() - start, writes
+
+async def main(args) -> None:
+    server = await FakeOpenAIStream(tokens=args.tokens, token_ms=args.token_ms, first_token_ms=args.first_token_ms).start()
+    settings.gpt_endpoint = server.url
+    g.set_default("gpt_client", AsyncClient(timeout=60.0))
+    message = Message(text="Query: how does light exposure affect sleep?")
+    try:
+        runs = [("relay", lambda: gpt_complete(message, []))]
+        if not args.skip_legacy: runs.insert(0, ("legacy", lambda: legacy_complete(message)))
+        for name, stream in runs:
+            ttft, total, writes = await measure(stream())
+            print(f"{name:7s} ttft={ttft * 1000:8.1f} ms  total={total * 1000:9.1f} ms  writes={writes}")
+    finally:
+        await g.gpt_client.aclose()
+        await server.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=400)
+    parser.add_argument("--token-ms", type=float, default=10.0)
+    parser.add_argument("--first-token-ms", type=float, default=300.0)
+    parser.add_argument("--skip-legacy", action="store_true")
+    asyncio.run(main(parser.parse_args()))
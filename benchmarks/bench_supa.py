@@ -0,0 +1,174 @@
+# scripts/supa.py against a local PostgREST-compatible stand-in of the Supabase `episodes` table: reads
+# with select/order/Range, inserts that fail with a 409 on an existing id, and upserts via
+# `Prefer: resolution=merge-duplicates`. Each request costs a round trip plus a per-row cost, and the
+# table stores `published` as a date and `keywords` as jsonb, so rows read back differ in form from
+# the rows written. Compares the old one-insert-per-episode loop with the bulk upsert, then checks that
+# re-runs skip unchanged episodes, write only edits and new episodes, and recover from failed batches;
+# exits non-zero if any of those checks fails.
+# Usage: python benchmarks/bench_supa.py [--episodes 300] [--call-ms 40] [--row-ms 0.2]
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from supa import episode_row, init_supabase, upsert_data
+
+def stored(row: dict) -> dict:
+    # What a date and a jsonb column hand back for the values written
+    return {**row, "published": datetime.strptime(row["published"], "%m/%d/%Y").strftime("%Y-%m-%d"),
+            "keywords": json.loads(row["keywords"])}
+
+class Table:
+    def __init__(self, call_ms: float, row_ms: float) -> None:
+        self.call_ms, self.row_ms = call_ms, row_ms
+        self.rows: dict = {}
+        self.requests = self.written = self.posts = 0
+        self.written_ids: list = []
+        self.fail_next = 0
+
+def create_standin(table: Table) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/rest/v1/episodes")
+    async def select(request: Request):
+        table.requests += 1
+        columns = request.query_params.get("select", "*").split(",")
+        rows = [table.rows[k] for k in sorted(table.rows)]
+        start, end = 0, len(rows) - 1
+        if "range" in request.headers: start, end = map(int, request.headers["range"].split("-"))
+        page = [row if columns == ["*"] else {c: row[c] for c in columns} for row in rows[start:end + 1]]
+        await asyncio.sleep((table.call_ms + table.row_ms * len(page)) / 1000)
+        last = start + len(page) - 1
+        return JSONResponse(page, headers={"Content-Range": f"{start}-{last}/*" if page else "*/*"})
+
+    @app.post("/rest/v1/episodes")
+    async def write(request: Request):
+        table.requests += 1
+        table.posts += 1
+        body = await request.json()
+        rows = body if isinstance(body, list) else [body]
+        await asyncio.sleep((table.call_ms + table.row_ms * len(rows)) / 1000)
+        if table.fail_next:
+            table.fail_next -= 1
+            return JSONResponse({"message": "injected failure"}, status_code=503)
+        prefer = request.headers.get("prefer", "")
+        if "resolution=merge-duplicates" not in prefer:
+            # a statement is all or nothing
+            for row in rows:
+                if row["id"] in table.rows:
+                    return JSONResponse({"code": "23505", "details": f"Key (id)=({row['id']}) already exists.", "hint": None,
+                                         "message": 'duplicate key value violates unique constraint "episodes_pkey"'}, status_code=409)
+        for row in rows: table.rows[row["id"]] = stored(row)
+        table.written += len(rows)
+        table.written_ids += [row["id"] for row in rows]
+        if "return=minimal" in prefer: return Response(status_code=201)
+        return JSONResponse([table.rows[row["id"]] for row in rows], status_code=201)
+
+    return app
+
+def serve(app: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started: time.sleep(0.05)
+    return server
+
+def channel(episodes: int, rng: random.Random) -> dict:
+    meta = {}
+    for e in range(episodes):
+        video_id = f"vid{e:04d}"
+        meta[video_id] = {"video_id": video_id, "title": f"Episode {e} | Huberman Lab", "description": f"About episode {e}. " * 40,
+                          "url": f"https://youtu.be/{video_id}", "embed_url": f"https://www.youtube.com/embed/{video_id}",
+                          "thumbnail": f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
+                          "keywords": rng.sample(["sleep", "light", "dopamine", "focus", "caffeine", "cortisol"], 3),
+                          "published": f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(2021, 2023)}"}
+    return meta
+
+def per_row_insert(supabase, channel_meta: dict) -> int:
+    # The previous upsert_data: one insert request per episode, abandoned at the first error
+    written = 0
+    try:
+        for video_id in channel_meta:
+            supabase.table("episodes").insert(episode_row(video_id, channel_meta[video_id])).execute()
+            written += 1
+    except Exception as e:
+        print("  error:", e)
+    return written
+
+def run(label: str, table: Table, fn):
+    table.requests = table.written = table.posts = 0
+    table.written_ids = []
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<28} {time.perf_counter() - start:6.2f} s  {table.requests:4d} requests  {table.written:4d} rows written  {result}")
+    return result
+
+def main(args) -> None:
+    table = Table(args.call_ms, args.row_ms)
+    server = serve(create_standin(table), args.port)
+    supabase = init_supabase(f"http://127.0.0.1:{args.port}", "fake.fake.fake")
+    channel_meta = channel(args.episodes, random.Random(0))
+    print(f"{args.episodes} episodes, {args.call_ms:.0f} ms per request + {args.row_ms} ms per row")
+    bulk = lambda: upsert_data(supabase, channel_meta, args.batch_size, args.concurrency)
+
+    checks = []
+    check = lambda label, ok: checks.append((label, ok))
+    expected = lambda: {v: stored(episode_row(v, m)) for v, m in channel_meta.items()}
+
+    run("per-row insert", table, lambda: f"{per_row_insert(supabase, channel_meta)} inserted")
+    run("per-row insert, re-run", table, lambda: f"{per_row_insert(supabase, channel_meta)} inserted")
+
+    table.rows = {}
+    counts = run("bulk upsert", table, bulk)
+    check("first run inserts every episode", counts == {"inserted": args.episodes, "updated": 0, "skipped": 0, "failed": 0})
+    check("first run leaves the table equal to the metadata", table.rows == expected())
+    counts = run("bulk upsert, re-run", table, bulk)
+    check("re-run skips every unchanged episode", counts == {"inserted": 0, "updated": 0, "skipped": args.episodes, "failed": 0})
+    check("re-run sends no upsert", table.posts == 0 and table.written == 0)
+    check("re-run adds no rows", len(table.rows) == args.episodes)
+
+    edited = list(channel_meta)[:args.edits]
+    for video_id in edited:
+        channel_meta[video_id] = {**channel_meta[video_id], "title": channel_meta[video_id]["title"] + " (updated)"}
+    grown = channel(args.episodes + args.new, random.Random(1))
+    added = [v for v in grown if v not in channel_meta]
+    for video_id in added: channel_meta[video_id] = grown[video_id]
+    counts = run(f"{args.edits} edited, {args.new} new", table, bulk)
+    check("edits and new episodes are counted", counts == {"inserted": args.new, "updated": args.edits, "skipped": args.episodes - args.edits, "failed": 0})
+    check("only edited and new episodes are written", sorted(table.written_ids) == sorted(edited + added))
+    check("table matches the edited metadata", table.rows == expected())
+
+    table.rows = {}
+    table.fail_next = 1
+    counts = run("bulk, one batch failing", table, bulk)
+    failed = len(channel_meta) - len(table.rows)
+    check("a failed batch is reported and the others are written", counts["failed"] == failed > 0 and counts["inserted"] == len(table.rows))
+    counts = run("bulk, after the failure", table, bulk)
+    check("the next run writes only the failed batch", counts == {"inserted": failed, "updated": 0, "skipped": len(channel_meta) - failed, "failed": 0})
+    check("table matches the metadata, without duplicates", table.rows == expected() and len(table.rows) == len(channel_meta))
+    server.should_exit = True
+
+    for label, ok in checks: print(f"{label}: {'OK' if ok else 'FAIL'}")
+    if not all(ok for _, ok in checks): sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--episodes", type=int, default=300)
+    parser.add_argument("--edits", type=int, default=10, help="episodes whose title changes before the third run")
+    parser.add_argument("--new", type=int, default=20, help="episodes added before the third run")
+    parser.add_argument("--call-ms", type=float, default=40.0, help="round trip per request")
+    parser.add_argument("--row-ms", type=float, default=0.2, help="cost per row read or written")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--port", type=int, default=9101)
+    main(parser.parse_args())
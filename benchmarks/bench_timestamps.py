@@ -0,0 +1,201 @@
+# scripts/timestamps.py on synthetic Whisper chunk streams of full-episode length: the notebook's
+# timestamp_sentences (whole-episode lists, exact previous-chunk check) against the streaming generator,
+# for throughput, peak memory, output on clean input, and how many injected hallucinations (chunks
+# repeated right away or a few chunks later, phrases looping inside a chunk) each lets through.
+# Then the process pool over several episodes. Exits non-zero unless the streaming sentences and their
+# timestamps equal the notebook's on clean input, no injected hallucination is left in the output, and
+# the pool writes the same sentences as the in-process generator. Uses the untrained punkt tokenizer when
+# the punkt data isn't installed.
+# Usage: python benchmarks/bench_timestamps.py [--hours 3.5] [--episodes 8] [--workers 4]
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from timestamps import PUNKT, HallucinationFilter, align_episodes, collapse_loops, load_detector, normalize, read_chunks, timestamp_sentences
+
+WORDS = ("sleep light dopamine focus caffeine cortisol exercise protocol neuron circadian morning evening "
+         "receptor brain signal temperature body system study people really important because about which").split()
+PHRASES = ["so I think", "and that's", "you know what I mean", "thank you", "the"]
+
+def synthetic_chunks(hours: float, rng: random.Random, repeat_rate: float = 0.0, loop_rate: float = 0.0, injected: dict | None = None):
+    # Sentences of 6-22 words cut into chunks of 10-30 words at ~0.35 s per word, like Whisper's
+    # chunk-level timestamps; the last chunk has no end time
+    injected = injected if injected is not None else {}
+    recent, words, t, end = deque(maxlen=6), [], 0.0, hours * 3600
+
+    def emit(text):
+        nonlocal t
+        duration = 0.35 * len(text.split())
+        chunk = {"text": " " + text, "timestamp": [round(t, 2), round(t + duration, 2) if t + duration < end else None]}
+        t += duration
+        return chunk
+
+    while t < end:
+        while len(words) < 30:
+            sentence = [rng.choice(WORDS) for _ in range(rng.randint(6, 22))]
+            words += [sentence[0].capitalize()] + sentence[1:-1] + [sentence[-1] + rng.choice(".?")]
+        size = rng.randint(10, 30)
+        text, words = " ".join(words[:size]), words[size:]
+        yield emit(text)
+        recent.append(text)
+        if rng.random() < repeat_rate:
+            delayed = len(recent) > 2 and rng.random() < 0.5
+            injected["delayed" if delayed else "repeated"] = injected.get("delayed" if delayed else "repeated", 0) + 1
+            yield emit(recent[-rng.randint(2, len(recent))] if delayed else text)
+        if rng.random() < loop_rate:
+            injected["loops"] = injected.get("loops", 0) + 1
+            yield emit(" ".join([rng.choice(PHRASES)] * rng.randint(6, 20)) + ".")
+
+def notebook_timestamp_sentences(chunks, sent_detector, video_id=None):
+    # timestamp_sentences from notebooks/huberman-transcriptions.ipynb, except that a sentence continued
+    # in the last chunk (end None) no longer raises a TypeError
+    timestamped = []
+    init_text = chunks[0]['text'].lstrip()
+    sentences = sent_detector.tokenize(init_text)
+    start, end = int(chunks[0]['timestamp'][0]), int(chunks[0]['timestamp'][1])
+    if len(sentences) > 1:
+        for sent in sentences[:-1]:
+            timestamped.append({'id': video_id, 'start': start, 'end': end, 'text': sent})
+    current_sentence = {'id': video_id, 'start': start, 'end': end, 'text': sentences[-1]}
+
+    prev_text = init_text
+    for chunk in chunks[1:]:
+        text = chunk['text'].lstrip()
+        if text == prev_text: continue
+        sentences = sent_detector.tokenize(text)
+        for sent in sentences:
+            if sent[0].isalpha() and current_sentence['text'][-1] not in (".", "?", "!"):
+                current_sentence['text'] += " " + sent
+                current_sentence['end'] = int(chunk['timestamp'][1]) if chunk['timestamp'][1] is not None else None
+            else:
+                timestamped.append(current_sentence)
+                start = int(chunk['timestamp'][0])
+                end = int(chunk['timestamp'][1]) if chunk['timestamp'][1] is not None else None
+                current_sentence = {'id': video_id, 'start': start, 'end': end, 'text': sent}
+        prev_text = text
+    timestamped.append(current_sentence)
+    return timestamped
+
+def leftovers(sentences, window: int = 8, min_words: int = 4) -> tuple[int, int]:
+    # Hallucinations left in the output: sentences repeating one of the last `window`, and looping phrases
+    recent, repeats, loops = deque(maxlen=window), 0, 0
+    for sent in sentences:
+        key = normalize(sent["text"])
+        if key.count(" ") + 1 >= min_words and key in recent: repeats += 1
+        recent.append(key)
+        loops += collapse_loops(sent["text"])[1]
+    return repeats, loops
+
+def notebook_run(hours: float, detector, seed: int, **injection):
+    chunks = list(synthetic_chunks(hours, random.Random(seed), **injection))
+    return chunks, notebook_timestamp_sentences(chunks, detector)
+
+def streaming_run(hours: float, detector, seed: int, **injection) -> int:
+    count = 0
+    for _ in timestamp_sentences(synthetic_chunks(hours, random.Random(seed), **injection), detector=detector): count += 1
+    return count
+
+def main(args) -> None:
+    try:
+        detector, resource = load_detector(PUNKT), PUNKT
+    except LookupError:
+        detector, resource = load_detector(None), None
+        print("punkt data not installed, using the untrained punkt tokenizer")
+    injection = {"repeat_rate": args.repeat_rate, "loop_rate": args.loop_rate}
+    checks = []
+    chunks = list(synthetic_chunks(args.hours, random.Random(0), **injection))
+    words = sum(len(c["text"].split()) for c in chunks)
+    print(f"{args.hours} h episodes: {len(chunks)} chunks, {words} words, {os.cpu_count()} cores")
+
+    # throughput on the same in-memory chunks, then peak memory with chunks read from a stream
+    start = time.perf_counter()
+    reference = notebook_timestamp_sentences(chunks, detector)
+    notebook = time.perf_counter() - start
+    start = time.perf_counter()
+    count = sum(1 for _ in timestamp_sentences(iter(chunks), detector=detector))
+    streaming = time.perf_counter() - start
+    del chunks
+    print(f"notebook    {notebook:6.2f} s  {len(reference) / notebook:8.0f} sentences/s")
+    print(f"streaming   {streaming:6.2f} s  {count / streaming:8.0f} sentences/s")
+
+    for label, run in [("notebook", notebook_run), ("streaming", streaming_run)]:
+        tracemalloc.start()
+        run(args.hours, detector, 0, **injection)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{label:<11} peak memory {peak / 2**20:7.2f} MiB")
+
+    clean = list(synthetic_chunks(args.hours, random.Random(1)))
+    filtered = HallucinationFilter()
+    streamed = list(timestamp_sentences(iter(clean), "clean", detector=detector, hallucinations=filtered))
+    reference = notebook_timestamp_sentences(clean, detector, "clean")
+    mismatch = next((i for i, (a, b) in enumerate(zip(streamed, reference)) if a != b), None)
+    print(f"clean input: {len(streamed)} sentences, notebook {len(reference)}, first difference at "
+          f"{mismatch if mismatch is not None else 'none'}, {sum(filtered.stats().values())} false positives")
+    if mismatch is not None: print(f"  streaming {streamed[mismatch]}\n  notebook  {reference[mismatch]}")
+    checks.append(("clean input: same sentences and timestamps as the notebook", streamed == reference))
+    checks.append(("clean input: nothing dropped as a hallucination", not any(filtered.stats().values())))
+
+    injected = {}
+    chunks = list(synthetic_chunks(args.hours, random.Random(2), injected=injected, **injection))
+    print(f"injected: {injected.get('repeated', 0)} chunks repeated right away, {injected.get('delayed', 0)} repeated a few chunks later, {injected.get('loops', 0)} loops")
+    filtered = HallucinationFilter()
+    for label, sentences in [("notebook", notebook_timestamp_sentences(chunks, detector)),
+                             ("streaming", list(timestamp_sentences(iter(chunks), detector=detector, hallucinations=filtered)))]:
+        repeats, loops = leftovers(sentences)
+        print(f"{label:<11} {repeats} repeated sentences and {loops} loops left in the output")
+    print(f"streaming   filter: {filtered.stats()}")
+    checks.append(("injected hallucinations: none left in the streaming output", (repeats, loops) == (0, 0)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        chunks_dir = os.path.join(tmp, "chunks")
+        os.makedirs(chunks_dir)
+        paths = []
+        for e in range(args.episodes):
+            paths.append(os.path.join(chunks_dir, f"ep{e:03d}.jsonl"))
+            with open(paths[-1], "w") as f:
+                for chunk in synthetic_chunks(args.hours, random.Random(100 + e), **injection): f.write(json.dumps(chunk) + "\n")
+        for workers in sorted({1, args.workers}):
+            start = time.perf_counter()
+            results = dict(align_episodes(paths, os.path.join(tmp, f"out{workers}"), workers, resource))
+            elapsed = time.perf_counter() - start
+            sentences = sum(r.get("sentences", 0) for r in results.values())
+            print(f"pool, {workers} worker{'s' if workers > 1 else ' '}  {args.episodes} episodes in {elapsed:6.2f} s  "
+                  f"{sentences / elapsed:8.0f} sentences/s  {args.episodes * args.hours / elapsed * 3600:6.0f}x real time")
+            same = len(results) == args.episodes and not any("error" in r for r in results.values())
+            for path in paths:
+                video_id = os.path.splitext(os.path.basename(path))[0]
+                out_path = os.path.join(tmp, f"out{workers}", video_id + ".jsonl")
+                same = same and os.path.exists(out_path) and \
+                    list(read_chunks(out_path)) == list(timestamp_sentences(read_chunks(path), video_id, detector=detector))
+            checks.append((f"pool, {workers} worker{'s' if workers > 1 else ''}: same sentences as in process", same))
+
+        # the clean episode through the pool, against the notebook
+        clean_path = os.path.join(tmp, "clean", "clean.jsonl")
+        os.makedirs(os.path.dirname(clean_path))
+        with open(clean_path, "w") as f:
+            for chunk in clean: f.write(json.dumps(chunk) + "\n")
+        results = dict(align_episodes([clean_path], os.path.join(tmp, "clean-out"), 1, resource))
+        out_path = os.path.join(tmp, "clean-out", "clean.jsonl")
+        checks.append(("pool, clean input: same sentences and timestamps as the notebook",
+                       "error" not in results.get("clean", {"error": None}) and list(read_chunks(out_path)) == reference))
+
+    for label, ok in checks: print(f"{label}: {'OK' if ok else 'FAIL'}")
+    if not all(ok for _, ok in checks): sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=3.5, help="length of each synthetic episode")
+    parser.add_argument("--episodes", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat-rate", type=float, default=0.02, help="fraction of chunks Whisper repeats")
+    parser.add_argument("--loop-rate", type=float, default=0.01, help="fraction of chunks followed by a looping phrase")
+    main(parser.parse_args())
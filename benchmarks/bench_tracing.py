@@ -0,0 +1,65 @@
+# Overhead of tracing: cost of one span, and per-request latency of a small app with and without
+# MetricsMiddleware (in-process ASGI transport, so the overhead is not hidden behind network time)
+# Usage: python benchmarks/bench_tracing.py [--requests 2000] [--spans 12] [--rounds 5]
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from prometheus_client import generate_latest
+
+from tracing import MetricsMiddleware, span
+
+def bench_span(iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with span("bench"): pass
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def build_app(spans: int, traced: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work():
+        # one span per stage of a typical /query
+        for i in range(spans):
+            with span(f"stage{i}"): await asyncio.sleep(0)
+        return {"ok": True}
+
+    if traced: app.add_middleware(MetricsMiddleware)
+    return app
+
+async def bench_requests(app: FastAPI, requests: int) -> tuple[float, dict]:
+    latencies = []
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = await client.get("/work")
+            latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1e6, response.headers
+
+async def main(args) -> None:
+    print(f"span: {bench_span(100_000):.2f} us")
+    plain_app, traced_app = build_app(args.spans, traced=False), build_app(args.spans, traced=True)
+    # alternate rounds and keep the best of each so machine noise doesn't decide the comparison
+    plain, traced = float("inf"), float("inf")
+    for _ in range(args.rounds):
+        plain = min(plain, (await bench_requests(plain_app, args.requests))[0])
+        p50, headers = await bench_requests(traced_app, args.requests)
+        traced = min(traced, p50)
+    print(f"request p50: untraced {plain:.0f} us, traced {traced:.0f} us ({traced - plain:+.0f} us for {args.spans} spans)")
+    print(f"Server-Timing: {headers.get('server-timing', '')[:80]}...")
+    print(f"/metrics exposition: {len(generate_latest())} bytes")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--spans", type=int, default=12)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,113 @@
+# Upstream client layer against the fake embeddings endpoint from upstreams.py, with injected latency
+# spikes and, separately, injected 5xx errors: a plain httpx.AsyncClient (what startup() used before),
+# upstream.Upstream with retries only, and with retries and hedging. Reports latency percentiles,
+# failed calls and how many calls reached the upstream. Exits non-zero unless hedging at least halves the
+# p99 under spikes and fails no more calls than retries alone under errors.
+# Usage: python benchmarks/bench_upstream.py [--requests 400] [--concurrency 8]
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "app"))
+sys.path.insert(0, HERE)
+
+from upstream import Upstream
+from loadtest import percentiles, wait_ready
+
+SCENARIOS = {
+    "spikes": {"median_ms": 40, "p95_ms": 80, "spike_rate": 0.05, "spike_ms": 1000},
+    "errors": {"median_ms": 40, "p95_ms": 80, "error_rate": 0.05},
+}
+
+class Plain:
+    # The previous client: default pool limits, one attempt
+    name = "httpx"
+
+    def __init__(self) -> None:
+        self.client = httpx.AsyncClient(timeout=10.0)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        kwargs.pop("hedge", None)
+        return await self.client.post(url, **kwargs)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+def clients() -> list:
+    retries = Upstream("retries", 10.0, hedge=False)
+    hedged = Upstream("hedged", 10.0)
+    return [Plain(), retries, hedged]
+
+async def drive(client, url: str, requests: int, concurrency: int) -> tuple[list[float], int]:
+    latencies, failures = [], 0
+    pending = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal failures
+        for i in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, hedge=True, json={"model": "ada", "input": f"query {i}"})
+                if response.status_code != 200: failures += 1
+            except httpx.HTTPError:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, failures
+
+async def upstream_calls(url: str) -> int:
+    async with httpx.AsyncClient() as client:
+        return (await client.get(f"{url}/stats")).json()["embeddings"]["calls"]
+
+async def scenario(name: str, profile: dict, args) -> dict:
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"embeddings": profile}, f)
+    base = f"http://127.0.0.1:{args.port}"
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, "upstreams.py"), "--port", str(args.port), "--profile", f.name])
+    try:
+        await wait_ready(f"{base}/stats", 30, process)
+        print(f"{name}: {profile}")
+        results = {}
+        for client in clients():
+            # steady state: the hedge delay is learned from the recent latencies, so measure after a warm-up
+            await drive(client, f"{base}/v1/embeddings", args.warmup, args.concurrency)
+            before = await upstream_calls(base)
+            latencies, failures = await drive(client, f"{base}/v1/embeddings", args.requests, args.concurrency)
+            calls = await upstream_calls(base) - before
+            await client.aclose()
+            p = percentiles(latencies)
+            results[client.name] = {**p, "failed": failures}
+            print(f"  {client.name:8s} p50 {p['p50_ms']:7.1f} ms  p95 {p['p95_ms']:7.1f} ms  p99 {p['p99_ms']:7.1f} ms  "
+                  f"failed {failures:3d}/{args.requests}  upstream calls {calls}")
+        return results
+    finally:
+        process.terminate()
+        process.wait()
+        os.unlink(f.name)
+
+async def main(args) -> None:
+    results = {name: await scenario(name, profile, args) for name, profile in SCENARIOS.items()}
+    spikes, errors = results["spikes"], results["errors"]
+    checks = [
+        ("hedging halves the p99 under spikes", spikes["hedged"]["p99_ms"] <= spikes["httpx"]["p99_ms"] / 2),
+        ("hedges don't starve retries under errors", errors["hedged"]["failed"] <= errors["retries"]["failed"]),
+    ]
+    for label, ok in checks: print(f"{label}: {'OK' if ok else 'FAIL'}")
+    if not all(ok for _, ok in checks): sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=100, help="unmeasured requests per client first")
+    parser.add_argument("--port", type=int, default=9100)
+    asyncio.run(main(parser.parse_args()))
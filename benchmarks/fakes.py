@@ -0,0 +1,113 @@
+# Local stand-ins for upstream services, shared by the benchmark scripts
+import asyncio
+import json
+
+def chat_chunk(content: str | None, finish_reason: str | None = None) -> dict:
+    delta = {} if content is None else {"content": content}
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "model": "gpt-3.5-turbo-16k-0613",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+
+class FakeOpenAIStream:
+    # Minimal HTTP/1.1 server that answers any POST with a chunked OpenAI-style SSE completion
+    def __init__(self, tokens: int = 400, token_ms: float = 10.0, first_token_ms: float = 300.0, prefill_ms_per_kb: float = 0.0) -> None:
+        self.tokens = tokens
+        self.token_delay = token_ms / 1000
+        self.first_token_delay = first_token_ms / 1000
+        # prompt processing time grows with the request body
+        self.prefill_delay = prefill_ms_per_kb / 1000
+        self.requests = 0
+        self.server: asyncio.AbstractServer | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    async def start(self) -> "FakeOpenAIStream":
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> int:
+        # Returns the body length
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in head.split(b"\r\n"):
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length": length = int(value)
+        if length: await reader.readexactly(length)
+        return length
+
+    async def _send_chunk(self, writer: asyncio.StreamWriter, data: bytes) -> None:
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                length = await self._read_request(reader)
+                self.requests += 1
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                    b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n"
+                )
+                await asyncio.sleep(self.first_token_delay + self.prefill_delay * length / 1024)
+                await self._send_chunk(writer, b"data: " + json.dumps(chat_chunk("")).encode() + b"\n\n")
+                for i in range(self.tokens):
+                    await asyncio.sleep(self.token_delay)
+                    await self._send_chunk(writer, b"data: " + json.dumps(chat_chunk(f" tok{i}")).encode() + b"\n\n")
+                await self._send_chunk(writer, b"data: " + json.dumps(chat_chunk(None, "stop")).encode() + b"\n\n")
+                await self._send_chunk(writer, b"data: [DONE]\n\n")
+                await self._send_chunk(writer, b"")
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # CancelledError: the client hung up mid-stream and the loop is shutting down
+            pass
+        finally:
+            writer.close()
+
+class FakeIndex:
+    # Offline stand-in for pinecone.Index: blocking query() with a fixed latency and injectable failures;
+    # a `down` index fails every call, like an expired connection, until it is replaced
+    def __init__(self, latency_ms: float = 40.0, fail_next: int = 0, top_k_matches: int = 10) -> None:
+        self.latency = latency_ms / 1000
+        self.fail_next = fail_next
+        self.down = False
+        self.top_k_matches = top_k_matches
+        self.queries = 0
+
+    def _matches(self, top_k: int) -> list[dict]:
+        return [{
+            "id": f"vid{i % 3}_{i + 1}",
+            "score": 1.0 - i / 100,
+            "metadata": {
+                "video_id": f"vid{i % 3}",
+                "title": f"Episode {i % 3}",
+                "published": "2023-01-02T00:00:00",
+                "thumbnail": f"https://img.youtube.com/vi/vid{i % 3}/maxresdefault.jpg",
+                "content": "Sunlight in the morning sets the circadian clock. " * 10,
+                "start": 60.0 * i,
+                "end": 60.0 * i + 90.0,
+                "tokens": 120
+            }
+        } for i in range(min(top_k, self.top_k_matches))]
+
+    def query(self, top_k: int = 10, vector=None, sparse_vector=None, namespace: str = "", include_metadata: bool = True, **kwargs) -> dict:
+        import time
+        time.sleep(self.latency)
+        self.queries += 1
+        if self.down: raise ConnectionError("connection expired")
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            raise ConnectionError("connection expired")
+        return {"matches": self._matches(top_k), "namespace": namespace}
+
+    def describe_index_stats(self) -> dict:
+        if self.down: raise ConnectionError("connection expired")
+        return {"dimension": 1536, "index_fullness": 0.0, "namespaces": {"nocontext-default": {}}, "total_vector_count": self.top_k_matches}
@@ -0,0 +1,196 @@
+# Offline load test of /query: starts the fake upstreams and the API (serve_app.py) as subprocesses,
+# drives /query at fixed concurrency levels, and reports throughput, end-to-end latency percentiles,
+# time to the first SSE event and time to the first GPT token. --out writes the results as JSON so
+# runs can be compared between commits.
+# Usage: python benchmarks/loadtest.py [--concurrency 1 8 32] [--requests 200] [--profile profile.json] [--out run.json] [--compare baseline.json]
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TOPICS = ["sleep", "morning light", "caffeine", "cold exposure", "dopamine", "focus", "testosterone", "alcohol", "exercise", "fasting"]
+
+def app_env(upstreams: str) -> dict:
+    return {
+        **os.environ,
+        "AWS_ENV": "false",
+        "LOGGER_NAME": "hubermangpt",
+        "LOG_LEVEL": "WARNING",
+        "OPENAI_API_KEY": "fake",
+        "EMBEDDING_ENDPOINT": f"{upstreams}/v1/embeddings",
+        "GPT_ENDPOINT": f"{upstreams}/v1/chat/completions",
+        "HUGGINGFACE_API_KEY": "fake",
+        "HF_INFERENCE_ENDPOINT": f"{upstreams}/hf",
+        "PINECONE_API_KEY": "fake",
+        "PINECONE_ENV": "fake",
+        "PINECONE_CONTROLLER_HOST": upstreams,
+        "PINECONE_INDEX_HOST": upstreams,
+        "SUPABASE_URL": upstreams,
+        "SUPABASE_KEY": "fake.fake.fake",   # supabase-py checks the key looks like a JWT
+        "REDIS_HOST": os.getenv("REDIS_HOST", "localhost"),
+    }
+
+async def wait_ready(url: str, timeout: float, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None: raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200: return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+def make_queries(count: int, repeat: float, rng: random.Random) -> list[str]:
+    # `repeat` of the queries come from a small popular set, the rest are unique
+    popular = [f"How does {t} affect sleep quality?" for t in TOPICS]
+    return [rng.choice(popular) if rng.random() < repeat else
+            f"What does the podcast say about {rng.choice(TOPICS)} and {rng.choice(TOPICS)} (#{i})?" for i in range(count)]
+
+async def one_query(client: httpx.AsyncClient, text: str) -> dict:
+    start = time.perf_counter()
+    sample = {"ok": False, "ttfse": None, "ttft": None}
+    try:
+        async with client.stream("POST", "/query", json={"text": text}) as response:
+            if response.status_code != 200:
+                await response.aread()
+                sample["status"] = response.status_code
+            else:
+                async for line in response.aiter_lines():
+                    if not line.startswith("event:"): continue
+                    event = line[6:].strip()
+                    now = time.perf_counter() - start
+                    if sample["ttfse"] is None: sample["ttfse"] = now
+                    if event == "gpt-response" and sample["ttft"] is None: sample["ttft"] = now
+                    if event == "close": sample["ok"] = True
+                    if event == "error": break
+    except httpx.HTTPError as err:
+        sample["error"] = type(err).__name__
+    sample["latency"] = time.perf_counter() - start
+    return sample
+
+def percentiles(values: list[float]) -> dict:
+    if not values: return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    values = sorted(values)
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1)
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+async def run_level(base_url: str, concurrency: int, queries: list[str]) -> dict:
+    pending = iter(queries)
+    samples = []
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        for text in pending: samples.append(await one_query(client, text))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    ok = [s for s in samples if s["ok"]]
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "latency": percentiles([s["latency"] for s in ok]),
+        "ttfse": percentiles([s["ttfse"] for s in ok]),
+        "ttft": percentiles([s["ttft"] for s in ok if s["ttft"] is not None]),
+    }
+
+def compare(baseline: dict, result: dict) -> None:
+    # Per-level change against an earlier run's JSON
+    earlier = {level["concurrency"]: level for level in baseline["levels"]}
+    print(f"vs. {baseline.get('commit')}:")
+    for level in result["levels"]:
+        before = earlier.get(level["concurrency"])
+        if before is None: continue
+        change = lambda new, old: f"{(new - old) / old:+.1%}" if new and old else "n/a"
+        print(f"c={level['concurrency']:<3d} throughput {change(level['throughput_rps'], before['throughput_rps'])}  "
+              f"latency p50 {change(level['latency']['p50_ms'], before['latency']['p50_ms'])}  "
+              f"p99 {change(level['latency']['p99_ms'], before['latency']['p99_ms'])}  "
+              f"ttft p50 {change(level['ttft']['p50_ms'], before['ttft']['p50_ms'])}")
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+@asynccontextmanager
+async def serve(args):
+    # Fake upstreams and the API as subprocesses; yields (API base URL, upstreams base URL)
+    upstreams = f"http://127.0.0.1:{args.upstream_port}"
+    base_url = f"http://127.0.0.1:{args.app_port}"
+    upstream_cmd = [sys.executable, os.path.join(HERE, "upstreams.py"), "--port", str(args.upstream_port), "--seed", str(args.seed)]
+    if args.profile: upstream_cmd += ["--profile", os.path.abspath(args.profile)]
+    app_cmd = [sys.executable, os.path.join(HERE, "serve_app.py"), "--port", str(args.app_port)]
+    if not args.real_redis: app_cmd.append("--fake-redis")
+    if not args.real_splade: app_cmd += ["--fake-splade", "--splade-ms", str(args.splade_ms)]
+    processes = [subprocess.Popen(upstream_cmd)]
+    try:
+        await wait_ready(f"{upstreams}/stats", 30, processes[0])
+        processes.append(subprocess.Popen(app_cmd, env=app_env(upstreams)))
+        await wait_ready(f"{base_url}/ready", args.startup_timeout, processes[1])
+        yield base_url, upstreams
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+def add_serve_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--profile", help="JSON latency/error profile for the fake upstreams")
+    parser.add_argument("--splade-ms", type=float, default=25.0)
+    parser.add_argument("--real-redis", action="store_true", help="use REDIS_HOST instead of fakeredis")
+    parser.add_argument("--real-splade", action="store_true", help="load the configured SPLADE engine")
+    parser.add_argument("--upstream-port", type=int, default=9100)
+    parser.add_argument("--app-port", type=int, default=9200)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+async def main(args) -> None:
+    async with serve(args) as (base_url, upstreams):
+        rng = random.Random(args.seed)
+        # warm-up requests open connection pools and start the background tasks
+        await run_level(base_url, 2, make_queries(args.warmup, args.repeat, rng))
+        levels = []
+        for concurrency in args.concurrency:
+            level = await run_level(base_url, concurrency, make_queries(args.requests, args.repeat, rng))
+            levels.append(level)
+            print(f"c={concurrency:<3d} {level['throughput_rps']:7.2f} req/s  errors={level['errors']:<3d} "
+                  f"latency p50/p95/p99={level['latency']['p50_ms']}/{level['latency']['p95_ms']}/{level['latency']['p99_ms']} ms  "
+                  f"ttfse p50={level['ttfse']['p50_ms']} ms  ttft p50={level['ttft']['p50_ms']} ms")
+        async with httpx.AsyncClient() as client:
+            upstream_stats = (await client.get(f"{upstreams}/stats")).json()
+        result = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": vars(args),
+            "levels": levels,
+            "upstream_calls": upstream_stats,
+        }
+        if args.out:
+            with open(args.out, "w") as f: json.dump(result, f, indent=2)
+            print(f"Wrote {args.out}")
+        if args.compare:
+            with open(args.compare) as f: compare(json.load(f), result)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--repeat", type=float, default=0.0, help="fraction of queries drawn from a small popular set")
+    add_serve_arguments(parser)
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON of an earlier run to compare against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,48 @@
+# Runs the API against the fake upstreams in benchmarks/upstreams.py. Settings come from the
+# environment (see loadtest.py); --fake-redis swaps in fakeredis and --fake-splade a hashing encoder
+# with a fixed per-batch cost, so no model download or Redis server is needed.
+# Usage: python benchmarks/serve_app.py --port 9200 [--fake-redis] [--fake-splade] [--splade-ms 25]
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+class HashingSplade:
+    # Sparse vectors from hashed words; sleeps like a CPU-bound forward pass on the calling thread
+    def __init__(self, batch_ms: float, per_text_ms: float) -> None:
+        self.batch_ms = batch_ms
+        self.per_text_ms = per_text_ms
+
+    def encode_queries(self, texts):
+        batch = [texts] if isinstance(texts, str) else texts
+        time.sleep((self.batch_ms + self.per_text_ms * len(batch)) / 1000)
+        output = []
+        for text in batch:
+            indices = sorted({int.from_bytes(hashlib.blake2b(w.encode(), digest_size=4).digest(), "little") % 30522 for w in text.lower().split()})
+            output.append({"indices": indices, "values": [1.0] * len(indices)})
+        return output[0] if isinstance(texts, str) else output
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--fake-redis", action="store_true")
+    parser.add_argument("--fake-splade", action="store_true")
+    parser.add_argument("--splade-ms", type=float, default=25.0, help="fake SPLADE cost per batch")
+    args = parser.parse_args()
+    os.chdir(APP_DIR)
+    if args.fake_redis:
+        import fakeredis
+        import fakeredis.aioredis
+        import redis.asyncio
+        server = fakeredis.FakeServer()
+        redis.asyncio.Redis = lambda **kwargs: fakeredis.aioredis.FakeRedis(server=server)
+    if args.fake_splade:
+        import startup
+        startup.load_splade = lambda: HashingSplade(args.splade_ms, args.splade_ms / 10)
+    import uvicorn
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,188 @@
+# Fake upstream services for offline load testing, all on one local HTTP server:
+#   POST /v1/embeddings             OpenAI embeddings (deterministic vectors per input text)
+#   POST /v1/chat/completions       OpenAI chat completions, streamed as SSE or not
+#   POST /hf                        Hugging Face zero-shot classification endpoint
+#   GET  /actions/whoami            Pinecone controller
+#   POST /query, /describe_index_stats   Pinecone index data plane
+#   GET  /rest/v1/episodes          Supabase REST (PostgREST) episodes table
+# Each upstream has a log-normal latency distribution, an error rate and optional latency spikes
+# (spike_rate of calls take an extra spike_ms), set by a JSON profile. Embeddings can also cost
+# per_input_ms per input text and be rate limited to rate_limit_rps (a 429 with Retry-After beyond it).
+# Usage: python benchmarks/upstreams.py [--port 9100] [--profile profile.json] [--seed 0]
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from fakes import chat_chunk
+
+# median / p95 latency in ms and the fraction of calls that fail with a 5xx
+DEFAULT_PROFILE = {
+    "embeddings": {"median_ms": 60, "p95_ms": 180, "error_rate": 0.0},
+    "chat": {"median_ms": 450, "p95_ms": 1200, "error_rate": 0.0, "tokens": 200, "token_ms": 15},
+    "hf": {"median_ms": 120, "p95_ms": 400, "error_rate": 0.0},
+    "pinecone": {"median_ms": 45, "p95_ms": 120, "error_rate": 0.0},
+    "supabase": {"median_ms": 30, "p95_ms": 90, "error_rate": 0.0},
+}
+EPISODES = 60
+DIMENSION = 1536
+
+class Upstream:
+    def __init__(self, median_ms: float, p95_ms: float, error_rate: float = 0.0, spike_rate: float = 0.0,
+                 spike_ms: float = 0.0, rate_limit_rps: float = 0.0, **extra) -> None:
+        self.mu = math.log(median_ms / 1000)
+        self.sigma = math.log(p95_ms / median_ms) / 1.645 if p95_ms > median_ms else 0.0
+        self.error_rate = error_rate
+        self.spike_rate = spike_rate
+        self.spike = spike_ms / 1000
+        self.rate_limit_rps = rate_limit_rps
+        self.tokens, self.updated = rate_limit_rps, time.monotonic()
+        self.extra = extra
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def throttle(self) -> float | None:
+        # Token bucket of rate_limit_rps requests per second: seconds until a token is free, or None
+        if not self.rate_limit_rps: return None
+        now = time.monotonic()
+        self.tokens = min(self.rate_limit_rps, self.tokens + (now - self.updated) * self.rate_limit_rps)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return None
+        self.throttled += 1
+        return (1 - self.tokens) / self.rate_limit_rps
+
+    async def delay(self) -> bool:
+        # Sleeps for one latency sample; False means this call should fail
+        self.calls += 1
+        spike = self.spike if random.random() < self.spike_rate else 0.0
+        await asyncio.sleep(random.lognormvariate(self.mu, self.sigma) + spike)
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return False
+        return True
+
+def embedding(text: str) -> list[float]:
+    # Same text, same unit vector, so caches behave as they would with real embeddings
+    seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(DIMENSION, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def sse_chunk(content: str | None, finish_reason: str | None = None) -> bytes:
+    return b"data: " + json.dumps(chat_chunk(content, finish_reason)).encode() + b"\n\n"
+
+def match(rank: int, rng: random.Random) -> dict:
+    video_id = f"ep{rng.randrange(EPISODES):03d}"
+    start = rng.randrange(0, 7200, 10)
+    return {
+        "id": f"{video_id}_{start}",
+        "score": 0.9 - rank * 0.01,
+        "values": [],
+        "metadata": {
+            "video_id": video_id,
+            "title": f"Episode {video_id}",
+            "published": "2023-01-02T00:00:00",
+            "content": "Morning sunlight exposure sets the circadian clock and improves sleep. " * 12,
+            "start": float(start),
+            "end": float(start + 75),
+        }
+    }
+
+def episode_row(video_id: str) -> dict:
+    return {"id": video_id, "description": f"Description of {video_id}. " * 20, "keywords": json.dumps(["sleep", "light", "focus"])}
+
+def create_upstreams(profile: dict) -> FastAPI:
+    app = FastAPI()
+    upstreams = {name: Upstream(**{**DEFAULT_PROFILE[name], **profile.get(name, {})}) for name in DEFAULT_PROFILE}
+    failed = lambda: JSONResponse({"error": {"message": "injected failure"}}, status_code=500)
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        embeddings = upstreams["embeddings"]
+        wait = embeddings.throttle()
+        if wait is not None:
+            return JSONResponse({"error": {"message": "rate limited"}}, status_code=429, headers={"Retry-After": f"{wait:.3f}"})
+        if not await embeddings.delay(): return failed()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(len(texts) * embeddings.extra.get("per_input_ms", 0) / 1000)
+        # JSONResponse directly: jsonable_encoder would walk every float of a large batch
+        return JSONResponse({"object": "list", "data": [{"object": "embedding", "index": i, "embedding": embedding(t)} for i, t in enumerate(texts)]})
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        chat = upstreams["chat"]
+        if not await chat.delay(): return failed()
+        if not body.get("stream"):
+            await asyncio.sleep(chat.extra["tokens"] * chat.extra["token_ms"] / 1000)
+            content = "".join(f" tok{i}" for i in range(chat.extra["tokens"]))
+            return {"id": "chatcmpl-fake", "object": "chat.completion", "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}
+
+        async def stream():
+            yield sse_chunk("")
+            for i in range(chat.extra["tokens"]):
+                await asyncio.sleep(chat.extra["token_ms"] / 1000)
+                yield sse_chunk(f" tok{i}")
+            yield sse_chunk(None, "stop")
+            yield b"data: [DONE]\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/hf")
+    async def zero_shot(request: Request):
+        body = await request.json()
+        if not await upstreams["hf"].delay(): return failed()
+        question = body["inputs"].rstrip().endswith("?")
+        return {"sequence": body["inputs"], "labels": ["question", "search term"] if question else ["search term", "question"], "scores": [0.9, 0.1]}
+
+    @app.get("/actions/whoami")
+    async def whoami():
+        return {"project_name": "fake", "user_label": "fake", "user_name": "fake"}
+
+    @app.post("/query")
+    async def query(request: Request):
+        body = await request.json()
+        if not await upstreams["pinecone"].delay(): return failed()
+        rng = random.Random(json.dumps(body.get("vector", [])[:4]))
+        return {"matches": [match(rank, rng) for rank in range(body.get("topK", 10))], "namespace": body.get("namespace", "")}
+
+    @app.post("/describe_index_stats")
+    async def describe_index_stats():
+        if not await upstreams["pinecone"].delay(): return failed()
+        return {"namespaces": {"nocontext-default": {"vectorCount": 100000}}, "dimension": DIMENSION, "indexFullness": 0.1, "totalVectorCount": 100000}
+
+    @app.get("/rest/v1/episodes")
+    async def episodes(request: Request):
+        if not await upstreams["supabase"].delay(): return failed()
+        ids = request.query_params.get("id", "")
+        if ids.startswith("in.("): video_ids = [v.strip('"') for v in ids[4:-1].split(",") if v]
+        else: video_ids = [f"ep{i:03d}" for i in range(EPISODES)]
+        return [episode_row(v) for v in video_ids]
+
+    @app.get("/stats")
+    async def stats():
+        return {name: {"calls": u.calls, "errors": u.errors, "throttled": u.throttled} for name, u in upstreams.items()}
+
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--profile", help="JSON file overriding DEFAULT_PROFILE per upstream")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    profile = {}
+    if args.profile:
+        with open(args.profile) as f: profile = json.load(f)
+    uvicorn.run(create_upstreams(profile), host="127.0.0.1", port=args.port, log_level="warning")
@@ -1,2 +1,3 @@
 AUDIO_PATH = '../huberman-audio/'
-MP3_PATH = AUDIO_PATH + 'mp3/'
\ No newline at end of file
+MP3_PATH = AUDIO_PATH + 'mp3/'
+INDEX_VERSION_KEY = 'index:version'
\ No newline at end of file
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import numpy as np
+
+# File layout read by app/local_index.py, one directory per namespace
+INDEX_META = 'index.json'
+DENSE = 'dense.npy'
+SCALE = 'scale.npy'
+SPARSE_INDPTR = 'sparse_indptr.npy'
+SPARSE_INDICES = 'sparse_indices.npy'
+SPARSE_DATA = 'sparse_data.npy'
+METADATA = 'metadata.jsonl'
+
+def read_vectors(path):
+    # vectors in the Pinecone upsert format: {'id', 'values', 'sparse_values', 'metadata'} per line
+    with open(path, encoding='utf8') as f:
+        for line in f:
+            if line.strip(): yield json.loads(line)
+
+def quantize(dense):
+    # symmetric per-row int8 quantization; scores are rescaled by the row scale at query time
+    scale = np.abs(dense).max(axis=1) / 127
+    scale[scale == 0] = 1.0
+    quantized = np.clip(np.rint(dense / scale[:, None]), -127, 127).astype(np.int8)
+    return quantized, scale.astype(np.float32)
+
+def export_index(vectors, path, quantized=False):
+    # Build the dense matrix and the CSR sparse matrix of one namespace from the ingestion output
+    os.makedirs(path, exist_ok=True)
+    ids, dense, indptr, indices, data = [], [], [0], [], []
+    with open(os.path.join(path, METADATA), 'w', encoding='utf8') as meta_file:
+        for vec in vectors:
+            ids.append(vec['id'])
+            dense.append(np.asarray(vec['values'], dtype=np.float32))
+            sparse = vec.get('sparse_values') or {'indices': [], 'values': []}
+            indices.extend(sparse['indices'])
+            data.extend(sparse['values'])
+            indptr.append(len(indices))
+            json.dump(vec.get('metadata', {}), meta_file)
+            meta_file.write('\n')
+    dense = np.vstack(dense)
+    if quantized:
+        dense, scale = quantize(dense)
+        np.save(os.path.join(path, SCALE), scale)
+    np.save(os.path.join(path, DENSE), dense)
+    np.save(os.path.join(path, SPARSE_INDPTR), np.asarray(indptr, dtype=np.int64))
+    np.save(os.path.join(path, SPARSE_INDICES), np.asarray(indices, dtype=np.int32))
+    np.save(os.path.join(path, SPARSE_DATA), np.asarray(data, dtype=np.float32))
+    with open(os.path.join(path, INDEX_META), 'w', encoding='utf8') as f:
+        json.dump({
+            'ids': ids,
+            'quantized': quantized,
+            'vocab_size': int(max(indices, default=-1)) + 1
+        }, f)
+    return len(ids)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build local hybrid index files from exported vectors')
+    parser.add_argument('vectors', help='.jsonl file of vectors in the Pinecone upsert format')
+    parser.add_argument('out', help='local index directory (settings.local_index_path)')
+    parser.add_argument('--namespace', default='nocontext-default')
+    parser.add_argument('--quantize', action='store_true', help='store the dense matrix as int8')
+    args = parser.parse_args()
+    count = export_index(read_vectors(args.vectors), os.path.join(args.out, args.namespace), quantized=args.quantize)
+    print('Exported', count, 'vectors to', os.path.join(args.out, args.namespace))
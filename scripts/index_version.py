@@ -0,0 +1,24 @@
+import argparse
+import os
+import redis
+
+from constants import INDEX_VERSION_KEY
+
+def bump_index_version(client: redis.Redis) -> int:
+    # The API drops its cached answers once it sees the index version change
+    return client.incr(INDEX_VERSION_KEY)
+
+def redis_from_env() -> redis.Redis:
+    # The API's Redis, as configured by its REDIS_* environment variables
+    return redis.Redis(host=os.getenv('REDIS_HOST'), port=int(os.getenv('REDIS_PORT', 33643)), password=os.getenv('REDIS_PASSWORD'), ssl=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mark the index as re-ingested so cached answers are invalidated')
+    parser.add_argument('--host', default=os.getenv('REDIS_HOST'))
+    parser.add_argument('--port', type=int, default=33643)
+    parser.add_argument('--password', default=os.getenv('REDIS_PASSWORD'))
+    parser.add_argument('--no-ssl', action='store_true')
+    args = parser.parse_args()
+    client = redis.Redis(host=args.host, port=args.port, password=args.password, ssl=not args.no_ssl)
+    print('Index version is now', bump_index_version(client))
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+
+import httpx
+
+from export_local_index import read_vectors
+
+EMBEDDING_ENDPOINT = 'https://api.openai.com/v1/embeddings'
+EMBEDDING_MODEL = 'text-embedding-ada-002'
+
+def read_jsonl(path):
+    with open(path, encoding='utf8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def load_corpus(sentences_path=None, metadata_path=None, token=None):
+    # Timestamped sentences ({'id', 'text', 'start', 'end'}) and episode metadata by video_id, from
+    # local .jsonl exports or the Hugging Face datasets the notebook used
+    if sentences_path:
+        sentences, metadata = read_jsonl(sentences_path), read_jsonl(metadata_path)
+    else:
+        from datasets import load_dataset
+        sentences = load_dataset('hbattu/huberman-timestamped', token=token)['train']
+        metadata = load_dataset('hbattu/huberman-youtube-metadata', token=token)['train']
+    return sentences, {row['video_id']: row for row in metadata}
+
+def group_by_episode(sentences):
+    # One pass over the whole dataset instead of a filter per episode; keeps the sentence order
+    episodes = defaultdict(list)
+    for sent in sentences:
+        if sent['end'] is not None: episodes[sent['id']].append(sent)
+    return episodes
+
+@lru_cache(maxsize=None)
+def encoder():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception as err:
+        print('Unable to load the tiktoken encoding, approximating token counts:', err)
+        return None
+
+def num_tokens(text):
+    enc = encoder()
+    return len(enc.encode(text)) if enc is not None else max(1, len(text) // 4)
+
+def chunk(episode, window=15, stride=10):
+    # Chunk an episode into documents with a rolling window of 'window' sentences and an overlap of
+    # 'window - stride' sentences (the index uses the content alone, without the episode context)
+    documents = []
+    for s in range(0, len(episode), stride):
+        window_end = min(s + window, len(episode))
+        content = ' '.join(sent['text'] for sent in episode[s:window_end])
+        documents.append({'content': content, 'start': episode[s]['start'], 'end': episode[window_end - 1]['end']})
+    return documents
+
+def build_vector_meta(doc, episode_meta):
+    return {
+        'title': episode_meta['title'],
+        'published': episode_meta['published'],
+        'thumbnail': episode_meta['thumbnail'],
+        'video_id': episode_meta['video_id'],
+        'content': doc['content'],
+        'start': doc['start'],
+        'end': doc['end'],
+        'tokens': num_tokens(doc['content'])
+    }
+
+def build_documents(episodes, channel_meta, window=15, stride=10):
+    # Every episode's documents as {'id', 'metadata'}, ids numbered per episode as before
+    documents = []
+    for video_id, episode in episodes.items():
+        episode_meta = channel_meta.get(video_id)
+        if episode_meta is None: continue
+        for idx, doc in enumerate(chunk(episode, window, stride)):
+            documents.append({'id': f'{video_id}_{idx + 1}', 'metadata': build_vector_meta(doc, episode_meta)})
+    return documents
+
+def read_checkpoint(path):
+    # Ids already written to the vectors file; a line cut short by a crash is dropped
+    done = set()
+    if not os.path.exists(path): return done
+    with open(path, 'rb+') as f:
+        offset = 0
+        for line in f:
+            if not line.endswith(b'\n'): break
+            done.add(json.loads(line)['id'])
+            offset += len(line)
+        f.truncate(offset)
+    return done
+
+class AdaptiveLimit:
+    # Concurrency limit for the embeddings API: a 429 halves it and pauses every request for the
+    # Retry-After, and it grows back by one after `limit` successes in a row
+    def __init__(self, limit):
+        self.max_limit = self.limit = limit
+        self.in_flight = 0
+        self.successes = 0
+        self.resume_at = 0.0
+        self.released = asyncio.Event()
+        self.throttled = 0
+
+    async def __aenter__(self):
+        while True:
+            pause = self.resume_at - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            elif self.in_flight < self.limit:
+                self.in_flight += 1
+                return self
+            else:
+                self.released.clear()
+                await self.released.wait()
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self.released.set()
+
+    def succeeded(self):
+        self.successes += 1
+        if self.successes >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self.successes = 0
+
+    def rate_limited(self, retry_after):
+        self.throttled += 1
+        self.limit = max(1, self.limit // 2)
+        self.successes = 0
+        self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
+
+def retry_after(response, attempt):
+    try:
+        return float(response.headers['retry-after'])
+    except (KeyError, ValueError):
+        return min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+async def embed_dense(client, texts, limiter, endpoint, api_key, model=EMBEDDING_MODEL, retries=8):
+    headers = {'Authorization': f'Bearer {api_key}'}
+    for attempt in range(retries):
+        async with limiter:
+            try:
+                res = await client.post(endpoint, headers=headers, json={'model': model, 'input': texts})
+            except httpx.TransportError as err:
+                res = err
+        if isinstance(res, httpx.Response) and res.status_code == 200:
+            limiter.succeeded()
+            # the API does not promise to return the embeddings in input order
+            return [d['embedding'] for d in sorted(res.json()['data'], key=lambda d: d['index'])]
+        if isinstance(res, httpx.Response) and res.status_code == 429:
+            limiter.rate_limited(retry_after(res, attempt))
+            continue
+        if isinstance(res, httpx.Response) and res.status_code < 500: res.raise_for_status()
+        await asyncio.sleep(min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0))
+    raise RuntimeError(f'Embeddings request for {len(texts)} documents failed {retries} times')
+
+def embed_sparse(splade, texts, batch_size):
+    sparse = []
+    for i in range(0, len(texts), batch_size): sparse.extend(splade.encode_documents(texts[i:i + batch_size]))
+    return sparse
+
+async def batch_embed(documents, out_path, splade, endpoint=EMBEDDING_ENDPOINT, api_key=None, model=EMBEDDING_MODEL,
+                      batch_size=256, concurrency=8, splade_batch_size=64):
+    # Embeds documents into the vectors file in the Pinecone upsert format, skipping those already in it.
+    # Ada batches run concurrently under an adaptive limit while SPLADE encodes the same batches (across
+    # episodes) on one thread; each batch is appended once both are done, so a crashed run resumes there.
+    done = read_checkpoint(out_path)
+    todo = [doc for doc in documents if doc['id'] not in done]
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    print(f'{len(done)} documents already embedded, {len(todo)} to go in {len(batches)} batches')
+    if not batches: return 0
+    loop = asyncio.get_running_loop()
+    limiter = AdaptiveLimit(concurrency)
+    in_flight = asyncio.Semaphore(concurrency * 2)
+    written, start = 0, time.perf_counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='splade') as splade_pool, \
+         open(out_path, 'a', encoding='utf8') as out:
+        async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+            async def embed_batch(batch):
+                nonlocal written
+                async with in_flight:
+                    texts = [doc['metadata']['content'] for doc in batch]
+                    sparse = loop.run_in_executor(splade_pool, embed_sparse, splade, texts, splade_batch_size)
+                    dense = await embed_dense(client, texts, limiter, endpoint, api_key, model)
+                    sparse = await sparse
+                    out.write(''.join(json.dumps({'id': doc['id'], 'values': d, 'sparse_values': s, 'metadata': doc['metadata']}) + '\n'
+                                      for doc, d, s in zip(batch, dense, sparse)))
+                    out.flush()
+                    written += len(batch)
+                    print(f'{written}/{len(todo)} documents embedded ({written / (time.perf_counter() - start):.0f}/s, '
+                          f'Ada concurrency {limiter.limit}, {limiter.throttled} rate limited)', end='\r')
+
+            tasks = [asyncio.ensure_future(embed_batch(batch)) for batch in batches]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks: task.cancel()
+    print()
+    return written
+
+def upsert_vectors(index, namespace, vectors_path, batch_size=100, workers=8, progress_path=None):
+    # Upserts the vectors file in parallel batches; completed batch numbers go to a progress file so a
+    # crashed run only re-sends the batches that were in flight
+    progress_path = progress_path or vectors_path + '.upserted'
+    done = set()
+    if os.path.exists(progress_path):
+        with open(progress_path, encoding='utf8') as f: done = {int(line) for line in f if line.strip()}
+    sent = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upsert') as pool, \
+         open(progress_path, 'a', encoding='utf8') as progress:
+        pending = {}
+
+        def finish(futures):
+            nonlocal sent
+            for future in futures:
+                future.result()
+                number, count = pending.pop(future)
+                progress.write(f'{number}\n')
+                progress.flush()
+                sent += count
+            print(f'{sent} vectors upserted', end='\r')
+
+        batch, number = [], 0
+        for vec in read_vectors(vectors_path):
+            batch.append(vec)
+            if len(batch) < batch_size: continue
+            if number not in done: pending[pool.submit(index.upsert, vectors=batch, namespace=namespace)] = (number, len(batch))
+            batch, number = [], number + 1
+            # bounded, so the whole vectors file is never held in memory
+            if len(pending) >= workers * 2: finish(wait(pending, return_when=FIRST_COMPLETED).done)
+        if batch and number not in done: pending[pool.submit(index.upsert, vectors=batch, namespace=namespace)] = (number, len(batch))
+        finish(wait(pending).done)
+    print()
+    return sent
+
+def init_splade():
+    import torch
+    from pinecone_text.sparse import SpladeEncoder
+    return SpladeEncoder(device='cuda' if torch.cuda.is_available() else 'cpu')
+
+def init_index(name):
+    import pinecone
+    pinecone.init(api_key=os.getenv('PINECONE_API_KEY'), environment=os.getenv('PINECONE_ENV'))
+    return pinecone.Index(name)
+
+def embed_command(args):
+    sentences, channel_meta = load_corpus(args.sentences, args.metadata, os.getenv('HF_TOKEN'))
+    documents = build_documents(group_by_episode(sentences), channel_meta, args.window, args.stride)
+    asyncio.run(batch_embed(documents, args.out, init_splade(), args.endpoint, os.getenv('OPENAI_API_KEY'),
+                            batch_size=args.batch_size, concurrency=args.concurrency, splade_batch_size=args.splade_batch_size))
+
+def upsert_command(args):
+    count = upsert_vectors(init_index(args.index), args.namespace, args.vectors, args.batch_size, args.workers)
+    print('Upserted', count, 'vectors to', args.index, args.namespace)
+    if args.bump_index_version:
+        from index_version import bump_index_version, redis_from_env
+        print('Index version is now', bump_index_version(redis_from_env()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Embed the timestamped transcripts and upsert them to Pinecone')
+    commands = parser.add_subparsers(dest='command', required=True)
+    embed = commands.add_parser('embed', help='chunk and embed (Ada + SPLADE) into a vectors .jsonl file; resumes')
+    embed.add_argument('out', help='vectors .jsonl file (also the checkpoint)')
+    embed.add_argument('--sentences', help='.jsonl of timestamped sentences instead of the HF dataset')
+    embed.add_argument('--metadata', help='.jsonl of episode metadata instead of the HF dataset')
+    embed.add_argument('--endpoint', default=os.getenv('EMBEDDING_ENDPOINT', EMBEDDING_ENDPOINT))
+    embed.add_argument('--window', type=int, default=15)
+    embed.add_argument('--stride', type=int, default=10)
+    embed.add_argument('--batch-size', type=int, default=256, help='documents per Ada request')
+    embed.add_argument('--concurrency', type=int, default=8, help='concurrent Ada requests (halved on a 429)')
+    embed.add_argument('--splade-batch-size', type=int, default=64)
+    embed.set_defaults(run=embed_command)
+    upsert = commands.add_parser('upsert', help='upsert a vectors .jsonl file to Pinecone; resumes')
+    upsert.add_argument('vectors')
+    upsert.add_argument('--index', default='huberman-search')
+    upsert.add_argument('--namespace', default='nocontext-default')
+    upsert.add_argument('--batch-size', type=int, default=100)
+    upsert.add_argument('--workers', type=int, default=8)
+    upsert.add_argument('--bump-index-version', action='store_true', help='invalidate the API\'s cached answers afterwards')
+    upsert.set_defaults(run=upsert_command)
+    args = parser.parse_args()
+    args.run(args)
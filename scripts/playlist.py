@@ -1,18 +1,37 @@
+import os
+import subprocess
 import sys
 import tempfile
-from better_ffmpeg_progress import FfmpegProcess
-from tqdm import tqdm
-from pytube import Playlist as pl, YouTube
-from pytube.cli import on_progress
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pytube import Playlist as pl, YouTube, extract
 from constants import MP3_PATH
-from utils import write_to_jsonl
+from utils import MetadataStore
+
+def transcode(mp4_path, mp3_path):
+    # mp4 (audio) -> mp3 in a worker process; the mp3 appears under its final name only once complete
+    tmp_path = mp3_path + '.part.mp3'
+    try:
+        result = subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', mp4_path, '-vn', tmp_path],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0: raise RuntimeError(f'ffmpeg failed on {mp4_path}: {result.stderr.strip()}')
+        os.replace(tmp_path, mp3_path)
+    finally:
+        for path in (mp4_path, tmp_path):
+            if os.path.exists(path): os.remove(path)
+    return mp3_path
 
 class Playlist:
-    def __init__(self, url, use_oauth=True, allow_oauth_cache=True):
+    def __init__(self, url, use_oauth=True, allow_oauth_cache=True, mp3_path=MP3_PATH, metadata=None,
+                 download_workers=4, transcode_workers=None, transcoder=transcode):
         self.url = url
         self.use_oauth = use_oauth
         self.allow_oauth_cache = allow_oauth_cache
-        
+        self.mp3_path = mp3_path
+        self.metadata = metadata if metadata is not None else MetadataStore()
+        self.download_workers = download_workers
+        self.transcode_workers = transcode_workers or os.cpu_count()
+        self.transcoder = transcoder
+
         self.playlist = pl(url)
 
     def extract_metadata(self, vid_url, publish_date, vid_details):
@@ -27,7 +46,7 @@ class Playlist:
         meta['description'] = vid_details['shortDescription']
         meta['thumbnail'] = vid_details['thumbnail']['thumbnails'][0]['url']
         return meta
-    
+
     def extract_audio(self, streams):
         # get highest bitrate audio stream
         highest_bitrate = streams.get_audio_only()
@@ -43,59 +62,80 @@ class Playlist:
         if itag is None: return None
         return streams.get_by_itag(itag)
 
+    def mp3_file(self, video_id):
+        return os.path.join(self.mp3_path, video_id + '.mp3')
+
+    def is_done(self, video_id):
+        # the manifest: an episode is done once its mp3 and its metadata row both exist
+        return video_id in self.metadata and os.path.exists(self.mp3_file(video_id))
+
     def download_audio(self, vid_url):
+        # Runs on a download thread: resolves the video and downloads its audio stream to a temp mp4
+        yt = YouTube(vid_url, use_oauth=self.use_oauth, allow_oauth_cache=self.allow_oauth_cache)
+        # extract video metadata
+        publish_date = yt.publish_date.strftime('%m/%d/%Y')
+        vid_details = yt.vid_info['videoDetails']
+        meta = self.extract_metadata(vid_url, publish_date, vid_details)
+        # extract audio stream
+        audio_stream = self.extract_audio(yt.streams)
+        if audio_stream is None: return meta, None
+        print('Downloading...', meta['title'], '({})'.format(meta['url']))
+        fd, mp4_path = tempfile.mkstemp(suffix='.mp4', dir=self.mp3_path)
+        os.close(fd)
         try:
-            yt = YouTube(vid_url, use_oauth=self.use_oauth, allow_oauth_cache=self.allow_oauth_cache)
-            # extract video metadata
-            publish_date = yt.publish_date.strftime('%m/%d/%Y')
-            vid_details = yt.vid_info['videoDetails']
-            meta = self.extract_metadata(vid_url, publish_date, vid_details)
-            # extract audio stream
-            audio_stream = self.extract_audio(yt.streams)
-            if audio_stream:
-                # append each video's metadata to .jsonl file with path to audio
-                write_to_jsonl(meta)
-                # download audio file to mp4 (audio)
-                print('\nDownloading...', meta['title'], '({})'.format(meta['url']))
-                # create temp file for mp4 file download
-                temp_file = tempfile.NamedTemporaryFile(suffix='.mp4', dir=MP3_PATH)
-                audio_stream.download(filename=temp_file.name)
-                # convert mp4 to mp3 using ffmpeg
-                out_file = MP3_PATH + meta['video_id'] + '.mp3'
-                process = FfmpegProcess(["ffmpeg", "-i", temp_file.name, out_file])
-                process.run()
-                temp_file.close()
+            audio_stream.download(output_path=self.mp3_path, filename=os.path.basename(mp4_path))
+        except BaseException:
+            os.remove(mp4_path)
+            raise
+        return meta, mp4_path
 
-        except Exception as err:
-            print('Error in downloading video:', vid_url)
-            raise(err)
-    
     def download_playlist(self):
-        # Download every video in YouTube playlist
+        # Download every video in the YouTube playlist that isn't done yet: downloads run on a thread
+        # pool and each finished download is transcoded on a process pool while the next ones download.
+        # Metadata is written once an episode's mp3 exists, so an interrupted run picks up where it stopped.
         vid_urls = self.playlist.video_urls
+        todo = [url for url in vid_urls if not self.is_done(extract.video_id(url))]
         print('Starting download of YouTube playlist:', self.playlist.title)
-        for i, url in enumerate(vid_urls): 
-            self.download_audio(url)
-            print('Completed ', '({done}/{total})'.format(done=i+1, total=len(vid_urls)))
-        print('Finished playlist download!')
-    
-    # def upload_to_hub(self, path=AUDIO_PATH):
-        
+        print(f'{len(vid_urls) - len(todo)} of {len(vid_urls)} videos already downloaded')
+        os.makedirs(self.mp3_path, exist_ok=True)
+        done, failed = 0, []
+        with ThreadPoolExecutor(max_workers=self.download_workers) as downloads, \
+             ProcessPoolExecutor(max_workers=self.transcode_workers) as transcodes:
+            pending = {downloads.submit(self.download_audio, url): ('download', url) for url in todo}
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, item = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as err:
+                        url = item if stage == 'download' else item['url']
+                        print(f'Error in {stage} of video: {url} ({err})')
+                        failed.append(url)
+                        continue
+                    if stage == 'download':
+                        meta, mp4_path = result
+                        if mp4_path is None:
+                            print('No mp4 audio stream for video:', item)
+                            continue
+                        pending[transcodes.submit(self.transcoder, mp4_path, self.mp3_file(meta['video_id']))] = ('transcode', meta)
+                    else:
+                        self.metadata.add(item)
+                        done += 1
+                        print('Completed', item['title'], '({done}/{total})'.format(done=done, total=len(todo)))
+        print('Finished playlist download!' if not failed else f'Finished with {len(failed)} failed videos: {", ".join(failed)}')
+        return failed
+
 
-    
 if __name__ == '__main__':
-    if len(sys.argv) != 2: 
+    if len(sys.argv) != 2:
         print('Invalid Arguments: Provide YouTube URL of playlist in command line.')
         exit(1)
-    try: 
+    try:
         # Download playlist from cli input of playlist url
         p = Playlist(url=sys.argv[1])
-        p.download_playlist()
-    
+        if p.download_playlist(): exit(1)
+
     except Exception as err:
         print(err)
         exit(1)
-    
-    
-
-    
\ No newline at end of file
@@ -1,27 +1,30 @@
 from supabase import create_client, Client
 from supabase.client import SupabaseException
-from datasets import load_dataset
-from collections import defaultdict
+from postgrest.types import ReturnMethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+import argparse
+import hashlib
 import json
+import os
+
+# Columns of the `episodes` table written by this script; `id` is the primary key
+COLUMNS = ["id", "title", "description", "url", "embed_url", "thumbnail", "keywords", "published"]
+
+def add_links(batch: dict) -> dict:
+    # One batched pass over the dataset: every derived column is built from the video_id column at once
+    ids = batch["video_id"]
+    return {
+        "url": ["https://youtu.be/" + v for v in ids],
+        "thumbnail": [f"https://img.youtube.com/vi/{v}/maxresdefault.jpg" for v in ids],
+        "embed_url": [f"https://www.youtube.com/embed/{v}" for v in ids],
+    }
 
 def huberman_metadata(token: str) -> dict:
+    from datasets import load_dataset
     metadata = load_dataset("hbattu/huberman-youtube-metadata", token=token)["train"]
-    def modify_yt_url(row):
-        row["url"] = "https://youtu.be/" + row["video_id"]
-        return row
-    def modify_thumbnail(row):
-        row["thumbnail"] = f"https://img.youtube.com/vi/{row['video_id']}/maxresdefault.jpg"
-        return row
-    def add_col(meta):
-        embed_url_col = [f"https://www.youtube.com/embed/{row['video_id']}" for row in meta]
-        return meta.add_column("embed_url", embed_url_col)
-
-    metadata = add_col(metadata.map(modify_yt_url).map(modify_thumbnail))
-    channel_meta = defaultdict(lambda: defaultdict(dict))
-    for row in metadata:
-       channel_meta[row["video_id"]] = row
-    
-    return channel_meta
+    metadata = metadata.map(add_links, batched=True, batch_size=1000)
+    return {row["video_id"]: row for row in metadata}
 
 def init_supabase(url: str, key: str) -> Client:
     try:
@@ -30,32 +33,98 @@ def init_supabase(url: str, key: str) -> Client:
     except SupabaseException:
         print("Invalid something. Check credentials passed in.")
 
-def upsert_data(supabase: Client, channel_meta: dict) -> None:
-    try:
-        for video_id in channel_meta:
-            episode_meta = channel_meta[video_id]
-            data, count = supabase.table("episodes").insert({
-                "id": video_id,
-                "title": episode_meta["title"],
-                "description": episode_meta["description"],
-                "url": episode_meta["url"],
-                "embed_url": episode_meta["embed_url"],
-                "thumbnail": episode_meta["thumbnail"],
-                "keywords": json.dumps(episode_meta["keywords"]),
-                "published": episode_meta["published"]
-            }).execute()
-    except Exception as e:
-        print("Error in upserting to Supabase -> ", e)
+def episode_row(video_id: str, episode_meta: dict) -> dict:
+    return {
+        "id": video_id,
+        "title": episode_meta["title"],
+        "description": episode_meta["description"],
+        "url": episode_meta["url"],
+        "embed_url": episode_meta["embed_url"],
+        "thumbnail": episode_meta["thumbnail"],
+        "keywords": json.dumps(episode_meta["keywords"]),
+        "published": episode_meta["published"],
+    }
+
+def _published(value) -> str:
+    # The metadata holds MM/DD/YYYY strings, a date or timestamp column hands back ISO dates
+    if isinstance(value, (date, datetime)): return value.strftime("%Y-%m-%d")
+    for parse in (lambda v: datetime.strptime(v, "%m/%d/%Y"), datetime.fromisoformat):
+        try:
+            return parse(value).strftime("%Y-%m-%d")
+        except (TypeError, ValueError):
+            pass
+    return value
+
+def checksum(row: dict) -> str:
+    # Hash of a row's values, normalized so a row read back from Postgres matches the row that was written
+    keywords = row.get("keywords")
+    if isinstance(keywords, str):
+        try:
+            keywords = json.loads(keywords)
+        except ValueError:
+            pass
+    values = {**{c: row.get(c) for c in COLUMNS}, "keywords": keywords, "published": _published(row.get("published"))}
+    return hashlib.blake2b(json.dumps(values, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+def existing_checksums(supabase: Client, page_size: int = 1000) -> dict:
+    # {id: checksum} of every row in the table, read in pages ordered by id
+    checksums, start = {}, 0
+    while True:
+        rows = supabase.table("episodes").select(",".join(COLUMNS)).order("id").range(start, start + page_size).execute().data
+        for row in rows: checksums[row["id"]] = checksum(row)
+        if len(rows) < page_size: return checksums
+        start += page_size
+
+def plan_upsert(rows: list, existing: dict) -> dict:
+    plan = {"insert": [], "update": [], "skip": []}
+    for row in rows:
+        if row["id"] not in existing: plan["insert"].append(row)
+        elif existing[row["id"]] != checksum(row): plan["update"].append(row)
+        else: plan["skip"].append(row)
+    return plan
+
+def upsert_batch(supabase: Client, batch: list) -> int:
+    supabase.table("episodes").upsert(batch, returning=ReturnMethod.minimal, on_conflict="id").execute()
+    return len(batch)
+
+def upsert_data(supabase: Client, channel_meta: dict, batch_size: int = 100, concurrency: int = 4,
+                dry_run: bool = False) -> dict:
+    # Upserts only new or changed episodes, batch_size rows per request with at most `concurrency` requests
+    # in flight. A failed batch is reported and the others still go through, so a re-run picks up the rest.
+    plan = plan_upsert([episode_row(v, m) for v, m in channel_meta.items()], existing_checksums(supabase))
+    counts = {"inserted": len(plan["insert"]), "updated": len(plan["update"]), "skipped": len(plan["skip"]), "failed": 0}
+    if dry_run: return counts
+    changed = plan["insert"] + plan["update"]
+    failed = set()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="supabase") as pool:
+        futures = {pool.submit(upsert_batch, supabase, changed[i:i + batch_size]): changed[i:i + batch_size]
+                   for i in range(0, len(changed), batch_size)}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print("Error in upserting to Supabase -> ", e)
+                failed.update(row["id"] for row in futures[future])
+    inserted = {row["id"] for row in plan["insert"]}
+    counts["inserted"] = len(inserted - failed)
+    counts["updated"] = len(plan["update"]) - len(failed - inserted)
+    counts["failed"] = len(failed)
+    return counts
 
 
 
 if __name__ == "__main__":
-    hf_token = input("Enter HF token: ")
+    parser = argparse.ArgumentParser(description="Upsert new or changed episode metadata into the Supabase episodes table")
+    parser.add_argument("--batch-size", type=int, default=100, help="rows per upsert request")
+    parser.add_argument("--concurrency", type=int, default=4, help="upsert requests in flight")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be inserted, updated and skipped")
+    args = parser.parse_args()
+    hf_token = os.getenv("HF_TOKEN") or input("Enter HF token: ")
     channel_meta = huberman_metadata(hf_token)
-    db_url = input("Enter Supabase URL: ")
-    db_key = input("Enter Supabase service role secret key: ")
+    db_url = os.getenv("SUPABASE_URL") or input("Enter Supabase URL: ")
+    db_key = os.getenv("SUPABASE_KEY") or input("Enter Supabase service role secret key: ")
     supabase = init_supabase(url=db_url, key=db_key)
     # Upsert to Supabase
-    upsert_data(supabase, channel_meta)
-
-    
\ No newline at end of file
+    counts = upsert_data(supabase, channel_meta, args.batch_size, args.concurrency, args.dry_run)
+    print("{inserted} inserted, {updated} updated, {skipped} skipped, {failed} failed".format(**counts))
+    if counts["failed"]: exit(1)
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from export_local_index import read_vectors
+from ingest import (EMBEDDING_ENDPOINT, batch_embed, build_vector_meta, chunk, group_by_episode, init_index,
+                    init_splade, load_corpus, upsert_vectors)
+
+ADA_PRICE_PER_1K = 0.0001   # USD per 1K tokens, text-embedding-ada-002
+
+def digest(value):
+    return hashlib.blake2b(value.encode(), digest_size=16).hexdigest()
+
+def chunk_hashes(metadata):
+    # 'content' decides whether a chunk is re-embedded, 'meta' whether only its metadata is updated.
+    # The token count follows from the content, so it is left out.
+    meta = {k: v for k, v in metadata.items() if k != 'tokens'}
+    return {'content': digest(metadata['content']), 'meta': digest(json.dumps(meta, sort_keys=True, default=str))}
+
+def episode_chunks(video_id, episode, episode_meta, window=15, stride=10):
+    return [{'id': f'{video_id}_{idx + 1}', 'metadata': build_vector_meta(doc, episode_meta)}
+            for idx, doc in enumerate(chunk(episode, window, stride))]
+
+def episode_hash(chunks):
+    return digest(json.dumps(sorted((vid, h['content'], h['meta']) for vid, h in chunks.items())))
+
+def read_manifest(path):
+    # {'episodes': {video_id: {'hash', 'chunks': {vector_id: {'content', 'meta'}}}}}: what the index holds
+    if not os.path.exists(path): return {'episodes': {}}
+    with open(path, encoding='utf8') as f: return json.load(f)
+
+def write_manifest(manifest, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf8') as f: json.dump(manifest, f)
+    os.replace(tmp, path)
+
+def manifest_from_vectors(vectors_path):
+    # Manifest of an index built by ingest.py, so the first sync doesn't re-embed everything
+    episodes = {}
+    for vec in read_vectors(vectors_path):
+        episodes.setdefault(vec['metadata']['video_id'], {'chunks': {}})['chunks'][vec['id']] = chunk_hashes(vec['metadata'])
+    for entry in episodes.values(): entry['hash'] = episode_hash(entry['chunks'])
+    return {'episodes': episodes}
+
+def playlist_ids(url):
+    from pytube import extract
+    from playlist import Playlist
+    return [extract.video_id(u) for u in Playlist(url).playlist.video_urls]
+
+def supabase_ids(url, key):
+    from supabase import create_client
+    return [row['id'] for row in create_client(url, key).table('episodes').select('id').execute().data]
+
+def plan_sync(manifest, episodes, channel_meta, playlist=None, supabase=None, window=15, stride=10):
+    # Compares the transcribed corpus (limited to the playlist, when given) with the manifest
+    wanted = [v for v in (playlist if playlist is not None else episodes) if v in episodes and v in channel_meta]
+    known = manifest['episodes']
+    plan = {'new': [], 'changed': [], 'unchanged': 0, 'removed': [], 'embed': [], 'update': [], 'delete': [], 'episodes': {}}
+    for video_id in wanted:
+        chunks = episode_chunks(video_id, episodes[video_id], channel_meta[video_id], window, stride)
+        hashes = {c['id']: chunk_hashes(c['metadata']) for c in chunks}
+        entry = {'hash': episode_hash(hashes), 'chunks': hashes}
+        plan['episodes'][video_id] = entry
+        before = known.get(video_id)
+        if before is not None and before['hash'] == entry['hash']:
+            plan['unchanged'] += 1
+            continue
+        plan['changed' if before else 'new'].append(video_id)
+        previous = before['chunks'] if before else {}
+        for c in chunks:
+            old = previous.get(c['id'])
+            if old is None or old['content'] != hashes[c['id']]['content']: plan['embed'].append(c)
+            elif old['meta'] != hashes[c['id']]['meta']: plan['update'].append(c)
+        plan['delete'].extend(vid for vid in previous if vid not in hashes)
+    for video_id, before in known.items():
+        if video_id not in plan['episodes']:
+            plan['removed'].append(video_id)
+            plan['delete'].extend(before['chunks'])
+    # episodes the other sources disagree on; sync only reports these
+    plan['untranscribed'] = [v for v in playlist if v not in episodes] if playlist is not None else []
+    plan['missing_metadata'] = [v for v in (playlist if playlist is not None else episodes) if v in episodes and v not in channel_meta]
+    plan['missing_from_supabase'] = [v for v in wanted if v not in supabase] if supabase is not None else []
+    plan['stale_in_supabase'] = [v for v in supabase if v not in plan['episodes']] if supabase is not None else []
+    plan['tokens'] = sum(c['metadata']['tokens'] for c in plan['embed'])
+    return plan
+
+def print_plan(plan, price_per_1k=ADA_PRICE_PER_1K):
+    print(f"Episodes: {len(plan['new'])} new, {len(plan['changed'])} changed, {plan['unchanged']} unchanged, {len(plan['removed'])} removed")
+    print(f"Vectors: {len(plan['embed'])} to embed and upsert, {len(plan['update'])} metadata updates, {len(plan['delete'])} to delete")
+    print(f"Estimated embedding cost: {plan['tokens']} tokens, ${plan['tokens'] / 1000 * price_per_1k:.4f}")
+    for key, label in [('new', 'New'), ('changed', 'Changed'), ('removed', 'Removed'),
+                       ('untranscribed', 'In the playlist but not transcribed yet'),
+                       ('missing_metadata', 'Transcribed but without episode metadata'),
+                       ('missing_from_supabase', 'Missing from Supabase (run supa.py)'),
+                       ('stale_in_supabase', 'In Supabase but not in the index')]:
+        if plan[key]: print(f'{label}: {", ".join(plan[key])}')
+
+def apply_metadata(index, namespace, plan, workers=8):
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='update') as pool:
+        for future in [pool.submit(index.update, id=c['id'], set_metadata=c['metadata'], namespace=namespace) for c in plan['update']]:
+            future.result()
+
+def delete_vectors(index, namespace, ids, batch_size=1000):
+    for i in range(0, len(ids), batch_size): index.delete(ids=ids[i:i + batch_size], namespace=namespace)
+
+def run_sync(plan, manifest, manifest_path, index, namespace, splade, endpoint, api_key, work_dir='.',
+             batch_size=256, concurrency=8):
+    # Embeds into a vectors file named after the planned work, so a crashed sync resumes its own file
+    # (ingest.py skips ids already written) and never reuses vectors of an earlier, different plan
+    key = digest(json.dumps([(c['id'], chunk_hashes(c['metadata'])['content']) for c in plan['embed']]))
+    vectors_path = os.path.join(work_dir, f'sync-{key}.jsonl')
+    if plan['embed']:
+        asyncio.run(batch_embed(plan['embed'], vectors_path, splade, endpoint, api_key, batch_size=batch_size, concurrency=concurrency))
+        upsert_vectors(index, namespace, vectors_path)
+    apply_metadata(index, namespace, plan)
+    delete_vectors(index, namespace, plan['delete'])
+    manifest['episodes'] = {**{v: e for v, e in manifest['episodes'].items() if v not in plan['removed']}, **plan['episodes']}
+    write_manifest(manifest, manifest_path)
+    for path in (vectors_path, vectors_path + '.upserted'):
+        if os.path.exists(path): os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Embed and upsert only new or changed episodes, and delete removed ones')
+    parser.add_argument('--manifest', default='manifest.json', help='content hashes of what the index holds')
+    parser.add_argument('--adopt', help='build the manifest from an ingest.py vectors file and exit')
+    parser.add_argument('--playlist', help='YouTube playlist URL; episodes no longer in it are removed')
+    parser.add_argument('--sentences', help='.jsonl of timestamped sentences instead of the HF dataset')
+    parser.add_argument('--metadata', help='.jsonl of episode metadata instead of the HF dataset')
+    parser.add_argument('--index', default='huberman-search')
+    parser.add_argument('--namespace', default='nocontext-default')
+    parser.add_argument('--endpoint', default=os.getenv('EMBEDDING_ENDPOINT', EMBEDDING_ENDPOINT))
+    parser.add_argument('--batch-size', type=int, default=256, help='documents per Ada request')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent Ada requests (halved on a 429)')
+    parser.add_argument('--price-per-1k', type=float, default=ADA_PRICE_PER_1K, help='embedding price in USD per 1K tokens')
+    parser.add_argument('--dry-run', action='store_true', help='print the planned work and its cost, change nothing')
+    parser.add_argument('--bump-index-version', action='store_true', help='invalidate the API\'s cached answers if anything changed')
+    args = parser.parse_args()
+
+    if args.adopt:
+        write_manifest(manifest_from_vectors(args.adopt), args.manifest)
+        print('Wrote', args.manifest)
+        exit(0)
+    manifest = read_manifest(args.manifest)
+    sentences, channel_meta = load_corpus(args.sentences, args.metadata, os.getenv('HF_TOKEN'))
+    playlist = playlist_ids(args.playlist) if args.playlist else None
+    supabase = supabase_ids(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY')) if os.getenv('SUPABASE_URL') else None
+    plan = plan_sync(manifest, group_by_episode(sentences), channel_meta, playlist, supabase)
+    print_plan(plan, args.price_per_1k)
+    if args.dry_run: exit(0)
+    if not (plan['embed'] or plan['update'] or plan['delete']):
+        print('Index is up to date')
+        exit(0)
+    run_sync(plan, manifest, args.manifest, init_index(args.index), args.namespace,
+             init_splade() if plan['embed'] else None, args.endpoint, os.getenv('OPENAI_API_KEY'),
+             work_dir=os.path.dirname(os.path.abspath(args.manifest)), batch_size=args.batch_size, concurrency=args.concurrency)
+    print('Synced', args.namespace)
+    if args.bump_index_version:
+        from index_version import bump_index_version, redis_from_env
+        print('Index version is now', bump_index_version(redis_from_env()))
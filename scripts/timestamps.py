@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import string
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Sentence-level timestamps from Whisper's chunk-level ones: the transcription notebook's
+# timestamp_sentences as a stream. Input is one .jsonl file of Whisper chunks per episode,
+# <video_id>.jsonl with one {'text', 'timestamp': [start, end]} per line; the output rows are the
+# {'id', 'start', 'end', 'text'} sentences of the huberman-timestamped dataset.
+
+PUNKT = 'tokenizers/punkt/english.pickle'
+_PUNCTUATION = string.punctuation + '“”‘’…'
+_detector = None
+
+def load_detector(resource=PUNKT):
+    # None gives an untrained Punkt tokenizer (no abbreviation list), for when the punkt data isn't installed
+    from nltk.tokenize.punkt import PunktSentenceTokenizer
+    if resource is None: return PunktSentenceTokenizer()
+    import nltk.data
+    return nltk.data.load(resource)
+
+def init_worker(resource=PUNKT):
+    # Pool initializer: each worker process unpickles the punkt model once, not once per episode
+    global _detector
+    _detector = load_detector(resource)
+
+def _keys(text):
+    # the words of a text as compared for repeats: lowercase, without surrounding punctuation
+    return [w.strip(_PUNCTUATION) for w in text.lower().split()]
+
+def normalize(text):
+    return ' '.join(k for k in _keys(text) if k)
+
+def _collapse(words, keys, max_ngram, max_repeats):
+    # a loop repeats its words more than max_repeats times, which rules out almost every chunk at once
+    if not keys or max(Counter(keys).values()) <= max_repeats: return words, keys, 0
+    out, out_keys, i, collapsed = [], [], 0, 0
+    while i < len(words):
+        for n in range(1, min(max_ngram, (len(words) - i) // (max_repeats + 1)) + 1):
+            if keys[i] != keys[i + n]: continue
+            reps = 1
+            while keys[i + reps * n:i + (reps + 1) * n] == keys[i:i + n]: reps += 1
+            if reps > max_repeats:
+                out.extend(words[i + (reps - 1) * n:i + reps * n])
+                out_keys.extend(keys[i:i + n])
+                i += reps * n
+                collapsed += 1
+                break
+        else:
+            out.append(words[i])
+            out_keys.append(keys[i])
+            i += 1
+    return out, out_keys, collapsed
+
+def collapse_loops(text, max_ngram=8, max_repeats=4):
+    # Whisper can get stuck repeating a phrase ('so I think so I think so I think ...'). A run of more than
+    # max_repeats back-to-back copies of the same 1..max_ngram words is cut to its last copy.
+    words, _, collapsed = _collapse(text.split(), _keys(text), max_ngram, max_repeats)
+    return ' '.join(words), collapsed
+
+class HallucinationFilter:
+    # Whisper's repetition failures on long audio, checked against the last `window` chunks and sentences:
+    # a chunk repeated verbatim (right away, or a few chunks later), the same sentence coming back across
+    # chunks, and a phrase looping inside a chunk. Repeats shorter than min_words ('Yeah.', 'Right.') are
+    # only dropped when they follow right after themselves, as the notebook did.
+    def __init__(self, window=8, min_words=4, max_ngram=8, max_repeats=4):
+        self.chunks = deque(maxlen=window)
+        self.sentences = deque(maxlen=window)
+        self.min_words = min_words
+        self.max_ngram = max_ngram
+        self.max_repeats = max_repeats
+        self.dropped_chunks = self.dropped_sentences = self.collapsed_loops = 0
+
+    def _repeated(self, key, recent):
+        if not recent: return False
+        return key == recent[-1] or (key.count(' ') + 1 >= self.min_words and key in recent)
+
+    def chunk(self, text):
+        # The chunk's text with loops collapsed, or None if it repeats a recent chunk
+        words, keys, collapsed = _collapse(text.split(), _keys(text), self.max_ngram, self.max_repeats)
+        if collapsed:
+            text = ' '.join(words)
+            self.collapsed_loops += collapsed
+        key = ' '.join(k for k in keys if k)
+        if self._repeated(key, self.chunks):
+            self.dropped_chunks += 1
+            return None
+        self.chunks.append(key)
+        return text
+
+    def sentence(self, text):
+        key = normalize(text)
+        if key.count(' ') + 1 >= self.min_words and key in self.sentences:
+            self.dropped_sentences += 1
+            return False
+        self.sentences.append(key)
+        return True
+
+    def stats(self):
+        return {'dropped_chunks': self.dropped_chunks, 'dropped_sentences': self.dropped_sentences, 'collapsed_loops': self.collapsed_loops}
+
+def _seconds(timestamp):
+    return int(timestamp) if timestamp is not None else None
+
+def timestamp_sentences(chunks, video_id=None, detector=None, hallucinations=None):
+    # Consumes Whisper chunks one at a time and yields each sentence as soon as the next one starts, so
+    # memory stays constant however long the episode. A sentence split across chunks keeps the start of
+    # its first chunk and the end of its last; the final chunk's end may be None, as Whisper leaves it.
+    global _detector
+    if detector is None:
+        if _detector is None: init_worker()
+        detector = _detector
+    hallucinations = hallucinations if hallucinations is not None else HallucinationFilter()
+    current = None
+    for chunk in chunks:
+        text = chunk['text'].strip()
+        if not text: continue
+        text = hallucinations.chunk(text)
+        if text is None: continue
+        start, end = (_seconds(t) for t in chunk['timestamp'])
+        for sent in detector.tokenize(text):
+            if not hallucinations.sentence(sent): continue
+            # a fragment that continues an unfinished sentence is appended to it
+            if current is not None and sent[0].isalpha() and current['text'][-1] not in ('.', '?', '!'):
+                current['text'] += ' ' + sent
+                current['end'] = end
+            else:
+                if current is not None: yield current
+                current = {'id': video_id, 'start': start, 'end': end, 'text': sent}
+    if current is not None: yield current
+
+def read_chunks(path):
+    with open(path, encoding='utf8') as f:
+        for line in f:
+            if line.strip(): yield json.loads(line)
+
+def align_episode(chunks_path, out_path, filter_kwargs=None):
+    # Runs in a pool worker: streams one episode's chunks into its sentences file, written under a temp
+    # name and renamed when complete so an interrupted run never leaves a partial episode behind
+    video_id = os.path.splitext(os.path.basename(chunks_path))[0]
+    hallucinations = HallucinationFilter(**(filter_kwargs or {}))
+    tmp, count = out_path + '.tmp', 0
+    try:
+        with open(tmp, 'w', encoding='utf8') as out:
+            for sent in timestamp_sentences(read_chunks(chunks_path), video_id, hallucinations=hallucinations):
+                out.write(json.dumps(sent) + '\n')
+                count += 1
+    except BaseException:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, out_path)
+    return {'sentences': count, **hallucinations.stats()}
+
+def align_episodes(chunks_paths, out_dir, workers=None, resource=PUNKT, filter_kwargs=None):
+    # Aligns episodes in parallel across a process pool, skipping those already in out_dir, and yields
+    # (video_id, stats) as each one finishes; a failed episode yields {'error': ...} and the rest go on
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = {}
+    for path in chunks_paths:
+        video_id = os.path.splitext(os.path.basename(path))[0]
+        out_path = os.path.join(out_dir, video_id + '.jsonl')
+        if not os.path.exists(out_path): jobs[video_id] = (path, out_path)
+    if not jobs: return
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(jobs)), initializer=init_worker, initargs=(resource,)) as pool:
+        futures = {pool.submit(align_episode, path, out_path, filter_kwargs): video_id for video_id, (path, out_path) in jobs.items()}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as err:
+                yield futures[future], {'error': str(err)}
+
+def merge_sentences(out_dir, path):
+    # Concatenates the per-episode files into one .jsonl, the --sentences input of ingest.py and sync.py
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf8') as out:
+        for name in sorted(os.listdir(out_dir)):
+            if not name.endswith('.jsonl'): continue
+            with open(os.path.join(out_dir, name), encoding='utf8') as f:
+                for line in f: out.write(line)
+    os.replace(tmp, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Timestamp the sentences of Whisper chunk files, one process per episode')
+    parser.add_argument('chunks_dir', help='directory of <video_id>.jsonl Whisper chunk files')
+    parser.add_argument('out_dir', help='directory for the <video_id>.jsonl sentence files; finished episodes are skipped')
+    parser.add_argument('--sentences', help='also merge every episode into this .jsonl')
+    parser.add_argument('--workers', type=int, default=None, help='defaults to the number of cores')
+    parser.add_argument('--punkt', default=PUNKT, help="nltk resource of the punkt model ('' for an untrained tokenizer)")
+    parser.add_argument('--window', type=int, default=8, help='chunks and sentences checked for repeats')
+    parser.add_argument('--min-words', type=int, default=4, help='shortest sentence dropped as a non-adjacent repeat')
+    parser.add_argument('--max-repeats', type=int, default=4, help='back-to-back copies of a phrase kept before it counts as a loop')
+    args = parser.parse_args()
+
+    paths = [os.path.join(args.chunks_dir, name) for name in sorted(os.listdir(args.chunks_dir)) if name.endswith('.jsonl')]
+    filter_kwargs = {'window': args.window, 'min_words': args.min_words, 'max_repeats': args.max_repeats}
+    done, error_ids = 0, []
+    for video_id, stats in align_episodes(paths, args.out_dir, args.workers, args.punkt or None, filter_kwargs):
+        done += 1
+        if 'error' in stats:
+            print('ERROR timestamping video ->', video_id, stats['error'])
+            error_ids.append(video_id)
+            continue
+        print(f"{video_id}: {stats['sentences']} sentences, {stats['dropped_chunks']} repeated chunks and "
+              f"{stats['dropped_sentences']} repeated sentences dropped, {stats['collapsed_loops']} loops collapsed ({done} done)")
+    if args.sentences:
+        merge_sentences(args.out_dir, args.sentences)
+        print('Wrote', args.sentences)
+    if error_ids: exit(1)
@@ -0,0 +1,93 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import httpx
+
+# the classifier's features live with the app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+from classifier import DEFAULT_WEIGHTS, features, question_probability
+
+LABELS = ['question', 'search term']
+
+def read_queries(path):
+    # labelled query set: {'text': ..., 'label': 'question' | 'search term'} per line
+    with open(path, encoding='utf8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def remote_labels(queries, endpoint, token):
+    # label every query with the current zero-shot endpoint to measure agreement with it
+    headers = {'Authorization': f'Bearer {token}'}
+    labels = []
+    with httpx.Client(timeout=10.0) as client:
+        for q in queries:
+            res = client.post(endpoint, headers=headers, json={'inputs': q['text'], 'parameters': {'candidate_labels': LABELS}})
+            res.raise_for_status()
+            scores = sorted(zip(res.json()['scores'], res.json()['labels']), reverse=True)
+            labels.append(scores[0][1])
+    return labels
+
+def train(examples, epochs=200, lr=0.1, l2=1e-3):
+    # plain logistic regression by batch gradient descent, starting from the hand-set weights
+    weights = dict(DEFAULT_WEIGHTS)
+    rows = [(features(text), 1.0 if label == 'question' else 0.0) for text, label in examples]
+    for _ in range(epochs):
+        grad = {name: 0.0 for name in weights}
+        for feats, y in rows:
+            p = 1 / (1 + math.exp(-sum(weights[n] * v for n, v in feats.items())))
+            for name, value in feats.items(): grad[name] += (p - y) * value
+        for name in weights:
+            weights[name] -= lr * (grad[name] / len(rows) + l2 * weights[name])
+    return weights
+
+def evaluate(examples, weights):
+    correct = sum((question_probability(text, weights) >= 0.5) == (label == 'question') for text, label in examples)
+    return correct / len(examples) if examples else 0.0
+
+def main(args):
+    queries = read_queries(args.queries)
+    if args.remote:
+        endpoint = args.endpoint or os.getenv('HF_INFERENCE_ENDPOINT')
+        labels = remote_labels(queries, endpoint, os.getenv('HUGGINGFACE_API_KEY'))
+        agreement = sum(l == q.get('label') for l, q in zip(labels, queries) if q.get('label'))
+        labelled = sum(1 for q in queries if q.get('label'))
+        if labelled: print(f'Endpoint agreement with the hand labels: {agreement / labelled:.3f} ({labelled} queries)')
+        for q, label in zip(queries, labels): q['remote_label'] = label
+    target = 'remote_label' if args.remote and args.fit_remote else 'label'
+    examples = [(q['text'], q[target]) for q in queries if q.get(target)]
+    random.Random(args.seed).shuffle(examples)
+    split = int(len(examples) * (1 - args.holdout))
+    train_set, test_set = examples[:split], examples[split:]
+
+    weights = train(train_set, epochs=args.epochs, lr=args.lr)
+    print(f'Default weights: train={evaluate(train_set, DEFAULT_WEIGHTS):.3f} holdout={evaluate(test_set, DEFAULT_WEIGHTS):.3f}')
+    print(f'Fitted weights:  train={evaluate(train_set, weights):.3f} holdout={evaluate(test_set, weights):.3f}  (target: {target})')
+    if args.remote:
+        agree = sum((question_probability(q['text'], weights) >= 0.5) == (q['remote_label'] == 'question') for q in queries)
+        print(f'Fitted model agreement with the endpoint: {agree / len(queries):.3f}')
+
+    start = time.perf_counter()
+    for q in queries: question_probability(q['text'], weights)
+    print(f'Local inference: {(time.perf_counter() - start) / len(queries) * 1e6:.1f} us/query (uncached)')
+    if args.out:
+        with open(args.out, 'w', encoding='utf8') as f:
+            json.dump(weights, f, indent=2)
+        print('Wrote weights to', args.out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit and evaluate the local query-type classifier')
+    parser.add_argument('queries', help='.jsonl file of {"text", "label"} queries')
+    parser.add_argument('--out', help='where to write the fitted weights, e.g. ../app/classifier_weights.json')
+    parser.add_argument('--remote', action='store_true', help='also label the queries with the zero-shot endpoint')
+    parser.add_argument('--fit-remote', action='store_true', help='fit to the endpoint labels instead of the hand labels')
+    parser.add_argument('--endpoint', help='zero-shot endpoint (defaults to $HF_INFERENCE_ENDPOINT)')
+    parser.add_argument('--holdout', type=float, default=0.2)
+    parser.add_argument('--epochs', type=int, default=200)
+    parser.add_argument('--lr', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
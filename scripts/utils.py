@@ -1,5 +1,6 @@
 import json
 import os
+import threading
 from constants import AUDIO_PATH, MP3_PATH
 
 def preprocess_metadata(meta):
@@ -15,11 +16,31 @@ def preprocess_metadata(meta):
     return meta
 
 
-def write_to_jsonl(meta):
-    metadata = preprocess_metadata(meta)
-    audio_file = 'mp3/' + metadata['video_id'] + '.mp3'
-    metadata['file_name'] = audio_file
-    with open(os.path.join(AUDIO_PATH, 'metadata.jsonl'), 'a', encoding='utf8') as meta_file:
-        json.dump(metadata, meta_file)
-        meta_file.write('\n')
+class MetadataStore:
+    # metadata.jsonl keyed by video_id: adding an episode again replaces its row, and every write goes
+    # to a temp file that replaces the old one, so a crash never leaves a partial or duplicated file
+    def __init__(self, path=os.path.join(AUDIO_PATH, 'metadata.jsonl')):
+        self.path = path
+        self.lock = threading.Lock()
+        self.rows = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf8') as meta_file:
+                for line in meta_file:
+                    if line.strip():
+                        row = json.loads(line)
+                        self.rows[row['video_id']] = row
 
+    def __contains__(self, video_id):
+        return video_id in self.rows
+
+    def add(self, meta):
+        metadata = preprocess_metadata(meta)
+        metadata['file_name'] = 'mp3/' + metadata['video_id'] + '.mp3'
+        with self.lock:
+            self.rows[metadata['video_id']] = metadata
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w', encoding='utf8') as meta_file:
+                for row in self.rows.values():
+                    json.dump(row, meta_file)
+                    meta_file.write('\n')
+            os.replace(tmp, self.path)